@@ -1,27 +1,67 @@
 """
 図面アップロードAPI
+
+起動を速くするため、抽出・読み取りなどのサービスは各エンドポイントの初回呼び出し時に読み込む。
 """
+import hashlib
+import os
 import uuid
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import aiofiles
-from fastapi import APIRouter, File, Form, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 
-from app.schemas.drawing import DrawingUploadResponse
-from app.services import GeminiOutlineExtractor, OutlineExtractionResult
+from app.core.metrics import observe_bytes, track_stage
+from app.core.profiling import ProfiledRoute, run_in_threadpool
+from app.schemas.drawing import (
+    DimensionLine,
+    DrawingUploadResponse,
+    OutlineExtractionResult,
+    RoofExtractionResult,
+)
+from app.services.storage_manager import get_storage_manager
 
-router = APIRouter(prefix="/drawings", tags=["drawings"])
+router = APIRouter(prefix="/drawings", tags=["drawings"], route_class=ProfiledRoute)
 
 # アップロードディレクトリ
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# 図面ファイルの送信時に一度に読み込むサイズ（既定の 64KiB より大きくしてスレッドの往復を減らす）
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# URL の v に内容のハッシュを含む場合のキャッシュ指定（同じ URL の内容は変わらない）
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@lru_cache(maxsize=1024)
+def _content_digest(path: str, mtime_ns: int, size: int) -> str:
+    """ファイル内容のハッシュ（更新時刻・サイズもキーにし、書き換えられたら計算し直す）"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()[:32]
+
+
+def _file_version(file_path: Path) -> Tuple[os.stat_result, str]:
+    """ファイルの stat と内容のハッシュ"""
+    stat_result = file_path.stat()
+    digest = _content_digest(str(file_path), stat_result.st_mtime_ns, stat_result.st_size)
+    return stat_result, digest
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match が ETag に一致するか（弱い比較）"""
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
 
 @router.post("/upload", response_model=DrawingUploadResponse)
 async def upload_drawing(
+    http_request: Request,
     file: UploadFile = File(...),
     type: str = Form(...),
     floor: Optional[int] = Form(None),
@@ -33,6 +73,8 @@ async def upload_drawing(
     - **type**: 図面タイプ（plan, elevation, roof-plan, site-survey）
     - **floor**: 階層（平面図の場合）
     """
+    from app.services.drawing_similarity import get_similarity_index
+
     # ファイルID生成
     file_id = str(uuid.uuid4())
 
@@ -50,29 +92,64 @@ async def upload_drawing(
 
     # ファイル保存
     file_path = UPLOAD_DIR / f"{file_id}{suffix}"
-    try:
-        async with aiofiles.open(file_path, "wb") as f:
-            content = await file.read()
-            await f.write(content)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"ファイル保存に失敗しました: {e}")
+    storage = get_storage_manager(UPLOAD_DIR)
+    with storage.pin(file_id):
+        try:
+            with track_stage("upload_write"):
+                async with aiofiles.open(file_path, "wb") as f:
+                    content = await file.read()
+                    await f.write(content)
+            observe_bytes("upload", len(content))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"ファイル保存に失敗しました: {e}")
+        storage.touch(file_path.name, len(content))
+
+        # 近似重複検出用の知覚ハッシュを登録（画像のみ、失敗してもアップロードは成功扱い）
+        with track_stage("phash"):
+            await run_in_threadpool(
+                get_similarity_index(UPLOAD_DIR).add_file, file_id, file_path,
+                _tenant_of(http_request),
+            )
+        # 内容のハッシュを URL に含め、ブラウザに再検証なしでキャッシュさせる
+        _, version = await run_in_threadpool(_file_version, file_path)
 
     return DrawingUploadResponse(
         id=file_id,
         name=original_name,
         type=type,
-        url=f"/api/v1/drawings/file/{file_id}{suffix}",
+        url=f"/api/v1/drawings/file/{file_id}{suffix}?v={version}",
         floor=floor,
         status="ready",
     )
 
 
 @router.get("/file/{filename}")
-async def get_drawing_file(filename: str):
-    """アップロードされた図面ファイルを取得する"""
+async def get_drawing_file(filename: str, request: Request, v: Optional[str] = None):
+    """
+    アップロードされた図面ファイルを取得する
+
+    - 内容のハッシュを ETag とし、If-None-Match が一致すれば 304 を返す
+    - Range 指定には部分応答（206）を返す（PDF の分割読み込み用）
+    - **v**: 内容のハッシュ。一致すれば内容が変わらないため immutable でキャッシュさせる
+    """
     file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
+    with track_stage("file_lookup"):
+        try:
+            stat_result, digest = await run_in_threadpool(_file_version, file_path)
+        except OSError:
+            stat_result = None
+    if stat_result is None:
         raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    get_storage_manager(UPLOAD_DIR).touch(filename)
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if v == digest else "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
     # Content-Typeを決定
     suffix = file_path.suffix.lower()
@@ -85,16 +162,27 @@ async def get_drawing_file(filename: str):
     }
     media_type = media_type_map.get(suffix, "application/octet-stream")
 
-    return FileResponse(file_path, media_type=media_type)
+    # Range / If-Range は FileResponse が処理する。ASGI の pathsend 拡張に対応したサーバーでは
+    # ファイルの送信をサーバーに任せる（sendfile によるゼロコピー）
+    response = FileResponse(
+        file_path, media_type=media_type, headers=headers, stat_result=stat_result
+    )
+    response.chunk_size = FILE_CHUNK_SIZE
+    return response
 
 
 @router.delete("/{drawing_id}")
 async def delete_drawing(drawing_id: str):
     """図面ファイルを削除する"""
+    from app.services.drawing_similarity import get_similarity_index
+
+    storage = get_storage_manager(UPLOAD_DIR)
     deleted = False
     for file_path in UPLOAD_DIR.glob(f"{drawing_id}*"):
-        file_path.unlink()
+        file_path.unlink(missing_ok=True)
+        storage.forget(file_path.name)
         deleted = True
+    await run_in_threadpool(get_similarity_index(UPLOAD_DIR).remove, drawing_id)
 
     if not deleted:
         raise HTTPException(status_code=404, detail="図面が見つかりません")
@@ -102,17 +190,63 @@ async def delete_drawing(drawing_id: str):
     return {"message": "削除しました", "id": drawing_id}
 
 
+def _tenant_of(http_request: Request) -> str:
+    """リクエストのテナント（X-Tenant-ID ヘッダー）"""
+    from app.services.extraction_scheduler import DEFAULT_TENANT
+
+    return http_request.headers.get("X-Tenant-ID", DEFAULT_TENANT)
+
+
+def _extraction_slot(http_request: Request):
+    """
+    抽出処理の実行枠（抽出スケジューラで順番を待つ）
+
+    テナントは X-Tenant-ID、優先度は X-Priority（interactive / batch）、
+    待ち時間の上限は X-Max-Wait（秒、優先度ごとの既定値以下）ヘッダーで指定する。
+    """
+    from app.services.extraction_scheduler import (
+        DEFAULT_MAX_WAIT,
+        INTERACTIVE,
+        get_extraction_scheduler,
+    )
+
+    headers = http_request.headers
+    priority = headers.get("X-Priority", INTERACTIVE)
+    if priority not in DEFAULT_MAX_WAIT:
+        raise HTTPException(status_code=400, detail=f"不明な優先度です: {priority}")
+    max_wait = DEFAULT_MAX_WAIT[priority]
+    if "X-Max-Wait" in headers:
+        try:
+            max_wait = min(max_wait, float(headers["X-Max-Wait"]))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Max-Wait は秒数で指定してください")
+    return get_extraction_scheduler().slot(
+        tenant=_tenant_of(http_request),
+        priority=priority,
+        max_wait=max_wait,
+        abandoned=http_request.is_disconnected,
+    )
+
+
 class ExtractOutlineRequest(BaseModel):
     """外周座標抽出リクエスト"""
     file_id: str
     floor: Optional[int] = None
+    reuse_near_duplicate: bool = True  # 近似重複の図面があれば以前の抽出結果を返す
 
 
 @router.post("/extract-outline", response_model=OutlineExtractionResult)
-async def extract_outline(file: UploadFile = File(...), floor: Optional[int] = Form(None)):
+async def extract_outline(
+    http_request: Request,
+    file: UploadFile = File(...),
+    floor: Optional[int] = Form(None),
+):
     """
     建築図面から建物外周座標を抽出する（Gemini使用）
     """
+    from app.services.extraction_scheduler import ExtractionRejected
+    from app.services.gemini_outline_extractor import GeminiOutlineExtractor
+
     # ... (same file validation logic) ...
     filename = file.filename or "unknown"
     suffix = Path(filename).suffix.lower()
@@ -131,12 +265,18 @@ async def extract_outline(file: UploadFile = File(...), floor: Optional[int] = F
     }
     mime_type = mime_type_map.get(suffix, "image/jpeg")
 
+    slot = _extraction_slot(http_request)
     try:
         content = await file.read()
         extractor = GeminiOutlineExtractor()
         # Pass floor to extractor
-        result = extractor.extract_outline_from_bytes(content, mime_type, floor=floor)
+        async with slot:
+            result = await run_in_threadpool(
+                extractor.extract_outline_from_bytes, content, mime_type, floor=floor
+            )
         return result
+    except ExtractionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=500, detail=f"座標抽出に失敗しました: {e}")
     except Exception as e:
@@ -144,52 +284,111 @@ async def extract_outline(file: UploadFile = File(...), floor: Optional[int] = F
 
 
 @router.post("/extract-outline-by-id")
-async def extract_outline_by_id(request: ExtractOutlineRequest):
+async def extract_outline_by_id(request: ExtractOutlineRequest, http_request: Request):
     """
     アップロード済み図面から建物外周座標を抽出する（Gemini使用）
     """
+    slot = _extraction_slot(http_request)
+    # 抽出中は図面を容量管理による削除の対象から外す
+    with get_storage_manager(UPLOAD_DIR).pin(request.file_id):
+        return await _extract_outline_by_id(request, slot, _tenant_of(http_request))
+
+
+async def _extract_outline_by_id(request: ExtractOutlineRequest, slot, tenant: str):
+    from app.services.drawing_similarity import get_similarity_index
+    from app.services.extraction_scheduler import ExtractionRejected
+    from app.services.gemini_outline_extractor import FLOOR_COLORS, GeminiOutlineExtractor
+
     # ファイルを検索
     file_path = None
-    for ext in [".png", ".jpg", ".jpeg"]:
-        candidate = UPLOAD_DIR / f"{request.file_id}{ext}"
-        if candidate.exists():
-            file_path = candidate.resolve()  # 絶対パスに変換
-            break
+    with track_stage("file_lookup"):
+        for ext in [".png", ".jpg", ".jpeg"]:
+            candidate = UPLOAD_DIR / f"{request.file_id}{ext}"
+            if candidate.exists():
+                file_path = candidate.resolve()  # 絶対パスに変換
+                get_storage_manager(UPLOAD_DIR).touch(candidate.name)
+                break
 
     if not file_path:
         raise HTTPException(status_code=404, detail="ファイルが見つかりません")
 
-    # MIMEタイプ決定
-    suffix = file_path.suffix.lower()
-    mime_type_map = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-    }
-    mime_type = mime_type_map.get(suffix, "image/jpeg")
+    similarity_index = get_similarity_index(UPLOAD_DIR)
+    if request.reuse_near_duplicate:
+        await run_in_threadpool(similarity_index.add_file, request.file_id, file_path, tenant)
+        match = similarity_index.find_reusable(request.file_id, "outline")
+        if match:
+            source_id, score, stored = match
+            result = OutlineExtractionResult(**stored).model_copy(update={
+                "floor": request.floor,
+                "color": FLOOR_COLORS.get(request.floor) if request.floor else None,
+                "reused_from": source_id,
+                "similarity": score,
+            })
+            return result.model_dump()
 
     try:
-        with open(file_path, "rb") as f:
-            content = f.read()
-
         extractor = GeminiOutlineExtractor()
-        # Pass floor from request to extractor
-        result = extractor.extract_outline_from_bytes(content, mime_type, floor=request.floor)
+        # ファイルパスを渡して抽出（クライアント側で mmap して送信する）
+        async with slot:
+            result = await run_in_threadpool(
+                extractor.extract_outline_from_file, str(file_path), floor=request.floor
+            )
+        await run_in_threadpool(
+            similarity_index.store_result, request.file_id, "outline", result.model_dump()
+        )
 
         return result.model_dump()
+    except ExtractionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=500, detail=f"座標抽出に失敗しました: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"エラーが発生しました: {e}")
 
 
-# ==================== 屋根情報抽出 API ====================
+class ExtractDimensionsRequest(BaseModel):
+    """寸法読み取りリクエスト"""
+    file_id: str
+
+
+@router.post("/extract-dimensions-by-id", response_model=List[DimensionLine])
+async def extract_dimensions_by_id(request: ExtractDimensionsRequest, http_request: Request):
+    """
+    アップロード済み図面から寸法値を読み取る（OpenCV + Tesseract、図面は外部に送らない）
+    """
+    from app.services.dimension_reader import LocalDimensionReader
+    from app.services.extraction_scheduler import ExtractionRejected
+
+    slot = _extraction_slot(http_request)
+    # 読み取り中は図面を容量管理による削除の対象から外す
+    with get_storage_manager(UPLOAD_DIR).pin(request.file_id):
+        file_path = None
+        with track_stage("file_lookup"):
+            for ext in [".png", ".jpg", ".jpeg"]:
+                candidate = UPLOAD_DIR / f"{request.file_id}{ext}"
+                if candidate.exists():
+                    file_path = candidate.resolve()
+                    get_storage_manager(UPLOAD_DIR).touch(candidate.name)
+                    break
+
+        if not file_path:
+            raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+
+        try:
+            async with slot:
+                return await run_in_threadpool(LocalDimensionReader().read_file, str(file_path))
+        except ExtractionRejected as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=500, detail=f"寸法の読み取りに失敗しました: {e}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"エラーが発生しました: {e}")
 
-from app.services.roof_extractor import GeminiRoofExtractor, RoofExtractionResult
 
+# ==================== 屋根情報抽出 API ====================
 
 @router.post("/extract-roof", response_model=RoofExtractionResult)
-async def extract_roof(file: UploadFile = File(...)):
+async def extract_roof(http_request: Request, file: UploadFile = File(...)):
     """
     建築図面（立面図）から屋根情報を抽出する（Gemini使用）
     
@@ -199,6 +398,9 @@ async def extract_roof(file: UploadFile = File(...)):
     - 屋根勾配（slopeRatio, slopeAngle）
     - 屋根形状（roofType: flat/gable/hip/shed）
     """
+    from app.services.extraction_scheduler import ExtractionRejected
+    from app.services.roof_extractor import GeminiRoofExtractor
+
     filename = file.filename or "unknown"
     suffix = Path(filename).suffix.lower()
     allowed_extensions = {".png", ".jpg", ".jpeg"}
@@ -216,11 +418,15 @@ async def extract_roof(file: UploadFile = File(...)):
     }
     mime_type = mime_type_map.get(suffix, "image/jpeg")
 
+    slot = _extraction_slot(http_request)
     try:
         content = await file.read()
         extractor = GeminiRoofExtractor()
-        result = extractor.extract_roof_from_bytes(content, mime_type)
+        async with slot:
+            result = await run_in_threadpool(extractor.extract_roof_from_bytes, content, mime_type)
         return result
+    except ExtractionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         return RoofExtractionResult(success=False, error=f"屋根情報抽出に失敗しました: {e}")
     except Exception as e:
@@ -230,29 +436,63 @@ async def extract_roof(file: UploadFile = File(...)):
 class ExtractRoofRequest(BaseModel):
     """屋根抽出リクエスト"""
     file_id: str
+    reuse_near_duplicate: bool = True  # 近似重複の図面があれば以前の抽出結果を返す
 
 
 @router.post("/extract-roof-by-id", response_model=RoofExtractionResult)
-async def extract_roof_by_id(request: ExtractRoofRequest):
+async def extract_roof_by_id(request: ExtractRoofRequest, http_request: Request):
     """
     アップロード済み図面から屋根情報を抽出する（Gemini使用）
     """
+    slot = _extraction_slot(http_request)
+    # 抽出中は図面を容量管理による削除の対象から外す
+    with get_storage_manager(UPLOAD_DIR).pin(request.file_id):
+        return await _extract_roof_by_id(request, slot, _tenant_of(http_request))
+
+
+async def _extract_roof_by_id(
+    request: ExtractRoofRequest, slot, tenant: str
+) -> RoofExtractionResult:
+    from app.services.drawing_similarity import get_similarity_index
+    from app.services.extraction_scheduler import ExtractionRejected
+    from app.services.roof_extractor import GeminiRoofExtractor
+
     # ファイルを検索
     file_path = None
-    for ext in [".png", ".jpg", ".jpeg"]:
-        candidate = UPLOAD_DIR / f"{request.file_id}{ext}"
-        if candidate.exists():
-            file_path = candidate.resolve()
-            break
+    with track_stage("file_lookup"):
+        for ext in [".png", ".jpg", ".jpeg"]:
+            candidate = UPLOAD_DIR / f"{request.file_id}{ext}"
+            if candidate.exists():
+                file_path = candidate.resolve()
+                get_storage_manager(UPLOAD_DIR).touch(candidate.name)
+                break
 
     if not file_path:
         # PDF等の場合は変換機能があればよいが、現状は画像のみ対応とする
         return RoofExtractionResult(success=False, error="ファイルが見つかりません、またはサポートされていない形式です")
 
+    similarity_index = get_similarity_index(UPLOAD_DIR)
+    if request.reuse_near_duplicate:
+        await run_in_threadpool(similarity_index.add_file, request.file_id, file_path, tenant)
+        match = similarity_index.find_reusable(request.file_id, "roof")
+        if match:
+            source_id, score, stored = match
+            return RoofExtractionResult(**stored).model_copy(update={
+                "reused_from": source_id,
+                "similarity": score,
+            })
+
     try:
         extractor = GeminiRoofExtractor()
         # ファイルパスを渡して抽出
-        result = extractor.extract_roof_from_file(str(file_path))
+        async with slot:
+            result = await run_in_threadpool(extractor.extract_roof_from_file, str(file_path))
+        if result.success:
+            await run_in_threadpool(
+                similarity_index.store_result, request.file_id, "roof", result.model_dump()
+            )
         return result
+    except ExtractionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         return RoofExtractionResult(success=False, error=f"エラーが発生しました: {e}")
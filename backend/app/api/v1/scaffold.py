@@ -0,0 +1,372 @@
+"""
+足場計算API
+
+起動を速くするため、足場計算（scaffold_logic）とサービスは各エンドポイントの初回呼び出し時に読み込む。
+"""
+import asyncio
+import json
+import os
+import tempfile
+from typing import TYPE_CHECKING, Dict, Iterator, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from app.core.profiling import ProfiledRoute, run_in_threadpool
+from app.schemas.scaffold import (
+    Point3DSchema,
+    QuantityRow,
+    RoofClashSchema,
+    ScaffoldCalculateRequest,
+    ScaffoldCalculateResponse,
+    ScaffoldClashResponse,
+    ScaffoldExportRequest,
+    ScaffoldLassoQuantityRequest,
+    ScaffoldMemberSchema,
+    ScaffoldQuantityResponse,
+)
+
+if TYPE_CHECKING:
+    from scaffold_logic import HeightCondition, NGArea, RoofSpec, ScaffoldMember, ScaffoldSpec
+
+    from app.services import LiveLayoutSession, ScaffoldCalculation
+
+    ScaffoldInputs = Tuple[
+        List[Tuple[float, float]],
+        HeightCondition,
+        Optional[ScaffoldSpec],
+        List[NGArea],
+        Dict[int, List[Tuple[float, float]]],
+        Optional[RoofSpec],
+    ]
+
+router = APIRouter(prefix="/scaffold", tags=["scaffold"], route_class=ProfiledRoute)
+
+
+def _to_inputs(request: ScaffoldCalculateRequest) -> "ScaffoldInputs":
+    """リクエストを足場計算の入力に変換"""
+    from scaffold_logic import HeightCondition, NGArea, Point2D, RoofSpec, ScaffoldSpec
+
+    from app.services.scaffold_service import ng_area_from_entrance
+
+    if len(request.vertices) < 3:
+        raise HTTPException(status_code=400, detail="外周ポリラインには3点以上が必要です")
+
+    height_condition = HeightCondition(**request.height_condition.model_dump())
+    scaffold_spec = (
+        ScaffoldSpec(**request.scaffold_spec.model_dump()) if request.scaffold_spec else None
+    )
+    ng_areas = [
+        NGArea(
+            min_point=Point2D(a.min_point.x, a.min_point.y),
+            max_point=Point2D(a.max_point.x, a.max_point.y),
+            kind=a.kind,
+        )
+        for a in request.ng_areas
+    ]
+    ng_areas.extend(ng_area_from_entrance(e) for e in request.entrances)
+
+    floor_outlines: Dict[int, List[Tuple[float, float]]] = {}
+    for floor_outline in request.floor_outlines:
+        if len(floor_outline.vertices) < 3:
+            raise HTTPException(
+                status_code=400, detail=f"{floor_outline.floor}階の外形には3点以上が必要です"
+            )
+        floor_outlines[floor_outline.floor] = [(p.x, p.y) for p in floor_outline.vertices]
+
+    roof = RoofSpec(**request.roof.model_dump()) if request.roof else None
+
+    points = [(p.x, p.y) for p in request.vertices]
+    return points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+
+
+def _to_quantity_rows(summary: dict) -> list[QuantityRow]:
+    """数量集計を行リストに変換（種別・長さ・面で整列）"""
+    return [
+        QuantityRow(member_type=member_type, length=length, face=face, count=count)
+        for (member_type, length, face), count in sorted(summary.items())
+    ]
+
+
+def _to_member_schema(m: "ScaffoldMember") -> ScaffoldMemberSchema:
+    """部材をレスポンススキーマに変換"""
+    return ScaffoldMemberSchema(
+        member_type=m.member_type.value,
+        length=m.length,
+        face=m.face.value,
+        position_start=Point3DSchema(
+            x=m.position_start.x, y=m.position_start.y, z=m.position_start.z
+        ),
+        position_end=Point3DSchema(x=m.position_end.x, y=m.position_end.y, z=m.position_end.z),
+    )
+
+
+def _to_response(calculation: "ScaffoldCalculation") -> ScaffoldCalculateResponse:
+    """計算結果をレスポンススキーマに変換"""
+    from scaffold_logic import get_scaffold_summary
+
+    return ScaffoldCalculateResponse(
+        result_key=calculation.key,
+        cached=calculation.cached,
+        members=[_to_member_schema(m) for m in calculation.result.members],
+        quantities=_to_quantity_rows(get_scaffold_summary(calculation.result)),
+    )
+
+
+@router.post("/calculate", response_model=ScaffoldCalculateResponse)
+def calculate(request: ScaffoldCalculateRequest):
+    """
+    外周ポリラインから足場を自動割付する
+
+    平行移動・開始頂点・頂点順が異なるだけの同一形状は、
+    正規化キーによりキャッシュから返される。
+    """
+    from app.services import get_scaffold_service
+
+    points, height_condition, scaffold_spec, ng_areas, floors, roof = _to_inputs(request)
+
+    try:
+        calculation = get_scaffold_service().calculate(
+            points, height_condition, scaffold_spec, ng_areas, floors, roof
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"足場計算に失敗しました: {e}")
+
+    return _to_response(calculation)
+
+
+@router.post("/quantity/lasso", response_model=ScaffoldQuantityResponse)
+def quantity_in_lasso(request: ScaffoldLassoQuantityRequest):
+    """
+    投げ縄で指定した範囲の部材数量（部材種別×長さ×面）を集計する
+
+    部材の中点が投げ縄の内側にあるものを集計対象とする。
+    """
+    from app.services import get_scaffold_service
+
+    if len(request.lasso) < 3:
+        raise HTTPException(status_code=400, detail="投げ縄には3点以上が必要です")
+
+    points, height_condition, scaffold_spec, ng_areas, floors, roof = _to_inputs(request)
+
+    try:
+        key, summary = get_scaffold_service().quantity_in_polygon(
+            points,
+            height_condition,
+            [(p.x, p.y) for p in request.lasso],
+            scaffold_spec,
+            ng_areas,
+            floors,
+            roof,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"数量集計に失敗しました: {e}")
+
+    return ScaffoldQuantityResponse(result_key=key, quantities=_to_quantity_rows(summary))
+
+
+@router.post("/clashes", response_model=ScaffoldClashResponse)
+def roof_clashes(request: ScaffoldCalculateRequest):
+    """
+    足場部材と屋根の干渉をチェックする
+
+    屋根条件（軒出・ケラバ・屋根形状・勾配・棟高さ）と各階の外形から本屋根・下屋の立体を作り、
+    軒先・ケラバからのクリアランスを確保できない部材と調整案を返す。
+
+    - **height**: 部材を amount (mm) 上げる（負は下げる。支柱は屋根に入っている側の端を動かす）
+    - **span**: 屋根に入っている側の端から amount (mm) 詰める
+    """
+    from app.services import get_scaffold_service
+
+    points, height_condition, scaffold_spec, ng_areas, floors, roof = _to_inputs(request)
+    if roof is None:
+        raise HTTPException(status_code=400, detail="屋根条件が指定されていません")
+
+    try:
+        key, clashes = get_scaffold_service().roof_clashes(
+            points, height_condition, roof, scaffold_spec, ng_areas, floors
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"干渉チェックに失敗しました: {e}")
+
+    return ScaffoldClashResponse(
+        result_key=key,
+        clashes=[
+            RoofClashSchema(
+                member_index=c.member_index,
+                member=_to_member_schema(c.member),
+                floor=c.floor,
+                overlap=c.overlap,
+                adjustment=c.adjustment,
+                amount=c.amount,
+            )
+            for c in clashes
+        ],
+    )
+
+
+@router.post("/geometry")
+def geometry(
+    request: ScaffoldCalculateRequest,
+    lod: Literal["full", "faces", "outline"] = Query("full"),
+):
+    """
+    3Dワイヤーフレーム表示用の形状を GLB（glTF 2.0 バイナリ）で返す
+
+    - **full**: 全部材の線分（部材種別ごとに1メッシュ）
+    - **faces**: 面ごとにまとめた外接箱
+    - **outline**: 面ごとの足場ラインのみ
+
+    座標は m 単位・Y軸上向き（glTF 準拠）。
+    """
+    from app.services import get_scaffold_service
+
+    points, height_condition, scaffold_spec, ng_areas, floors, roof = _to_inputs(request)
+
+    try:
+        key, glb = get_scaffold_service().geometry(
+            points, height_condition, lod, scaffold_spec, ng_areas, floors, roof
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"形状生成に失敗しました: {e}")
+
+    return Response(
+        content=glb,
+        media_type="model/gltf-binary",
+        headers={"X-Result-Key": key},
+    )
+
+
+@router.post("/export")
+def export_quantities(request: ScaffoldExportRequest):
+    """
+    数量表（建物×部材種別×長さ×面×数量）をダウンロードする
+
+    - **csv**: 建物ごとに計算しながらチャンク転送する（見出し行は即座に送出）
+    - **xlsx**: constant_memory モードで一時ファイルに書き出してから送出する
+    """
+    from app.services import get_scaffold_service
+    from app.services.quantity_export import iter_csv_chunks, iter_quantity_rows, write_xlsx
+
+    if not request.items:
+        raise HTTPException(status_code=400, detail="エクスポート対象がありません")
+
+    # 入力検証はストリーミング開始前に済ませる
+    inputs = [
+        (item.label or f"建物{i + 1}", _to_inputs(item.calculation))
+        for i, item in enumerate(request.items)
+    ]
+    service = get_scaffold_service()
+
+    def summaries() -> Iterator[Tuple[str, dict]]:
+        for label, (points, height_condition, scaffold_spec, *options) in inputs:
+            _, summary = service.summarize(points, height_condition, scaffold_spec, *options)
+            yield label, summary
+
+    rows = iter_quantity_rows(summaries())
+
+    if request.format == "xlsx":
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            write_xlsx(rows, path)
+        except Exception as e:
+            os.unlink(path)
+            raise HTTPException(status_code=500, detail=f"Excel出力に失敗しました: {e}")
+        return FileResponse(
+            path,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            filename="scaffold_quantities.xlsx",
+            background=BackgroundTask(os.unlink, path),
+        )
+
+    return StreamingResponse(
+        iter_csv_chunks(rows),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="scaffold_quantities.csv"'},
+    )
+
+
+async def _live_worker(
+    websocket: WebSocket, session: "LiveLayoutSession", send_lock: asyncio.Lock
+) -> None:
+    """最新の編集だけを順に計算し、差分を送信する"""
+    from app.services import get_scaffold_service
+
+    service = get_scaffold_service()
+    while True:
+        version, payload = await session.next_edit()
+        try:
+            request = ScaffoldCalculateRequest.model_validate(payload)
+            points, height_condition, scaffold_spec, *options = _to_inputs(request)
+            calculation = await run_in_threadpool(
+                service.calculate, points, height_condition, scaffold_spec, *options
+            )
+        except HTTPException as e:
+            message = {"type": "error", "version": version, "detail": e.detail}
+        except ValueError as e:
+            # pydantic の検証エラーも ValueError のサブクラス
+            detail = f"足場計算に失敗しました: {e}"
+            message = {"type": "error", "version": version, "detail": detail}
+        except Exception as e:
+            # ワーカーが止まるとセッションが応答しなくなるため、接続は維持する
+            detail = f"エラーが発生しました: {e}"
+            message = {"type": "error", "version": version, "detail": detail}
+        else:
+            message = session.delta(version, calculation).model_dump()
+        async with send_lock:
+            await websocket.send_json(message)
+
+
+@router.websocket("/live")
+async def live_recalc(websocket: WebSocket):
+    """
+    外形編集中のライブ再計算
+
+    クライアント → サーバー:
+    - `{"type": "update", "version": n, "request": {...}}`: 版 n の足場計算リクエスト
+      （/calculate と同じ形式）。計算中に届いた編集は最新の1件だけが計算される
+    - `{"type": "ack", "version": n}`: 版 n の差分を適用した。以降の差分は版 n を基準にする
+
+    サーバー → クライアント:
+    - `{"type": "delta", "version": n, "base_version": b, ...}`: 版 b（None は空の状態）に
+      added を追加し removed を削除すると版 n になる。quantities は数量が変わった行のみ
+    - `{"type": "error", "version": n, "detail": "..."}`
+    """
+    from app.services import LiveLayoutSession
+
+    await websocket.accept()
+    session = LiveLayoutSession()
+    send_lock = asyncio.Lock()
+    worker = asyncio.create_task(_live_worker(websocket, session, send_lock))
+
+    async def send_error(detail: str) -> None:
+        async with send_lock:
+            await websocket.send_json({"type": "error", "version": None, "detail": detail})
+
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                kind = message["type"]
+                version = int(message["version"])
+            except (ValueError, TypeError, KeyError):
+                await send_error("メッセージの形式が不正です")
+                continue
+
+            if kind == "update":
+                session.submit(version, message.get("request"))
+            elif kind == "ack":
+                session.ack(version)
+            else:
+                await send_error(f"未対応のメッセージ種別です: {kind}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+        try:
+            await worker
+        except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+            pass
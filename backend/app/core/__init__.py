@@ -0,0 +1,3 @@
+"""
+アプリケーション共通基盤
+"""
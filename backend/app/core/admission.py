@@ -0,0 +1,293 @@
+"""
+受付制御（アドミッション制御）とバックプレッシャー
+
+アップロード・図面抽出のリクエストを経路ごとの同時処理数と待ち行列の長さで制限し、
+飽和時は処理を始める前に Retry-After 付きで即座に断る。
+
+- 待ち行列が満杯、または待ち時間の上限を過ぎた場合は 503（混雑）
+- 同じクライアント（X-Tenant-ID、無ければ接続元アドレス）が上限を超えて送った場合は 429
+- ボディサイズは受付前に Content-Length で確認し、Content-Length が無い場合も受信しながら
+  数えて、上限を超えた時点で 413 を返す（全体を読み込まない）
+- Retry-After は経路ごとの処理時間の移動平均と待ち件数から見積もる
+- 飽和状態はヘルスチェックで返し、ロードバランサーが混雑したワーカーを避けられるようにする
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.core.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTIONS
+
+# 図面ファイルを含むリクエストボディの上限の既定値（バイト）
+DEFAULT_MAX_BODY_BYTES = 50 * 1024**2
+
+# 待ち行列で待つ時間の上限の既定値（秒）
+DEFAULT_QUEUE_TIMEOUT = 10.0
+
+# 処理時間の移動平均の初期値（秒）と平滑化係数
+INITIAL_SERVICE_TIME = 1.0
+SERVICE_TIME_ALPHA = 0.2
+
+# Retry-After の上限（秒）
+MAX_RETRY_AFTER = 60
+
+TENANT_HEADER = b"x-tenant-id"
+
+
+@dataclass
+class RoutePolicy:
+    """経路ごとの受付条件"""
+    name: str                      # メトリクス・ヘルスチェックでの名前
+    path_prefix: str               # 対象とするパスの先頭（POST のみ対象）
+    concurrency: int               # 同時に処理するリクエスト数
+    queue_depth: int               # 処理を待てるリクエスト数
+    max_body_bytes: int = DEFAULT_MAX_BODY_BYTES  # ボディサイズの上限（0 は無制限）
+    per_client: int = 0            # 同じクライアントの処理中＋待ちの上限（0 は無制限）
+
+
+@dataclass
+class AdmissionConfig:
+    """受付制御の設定"""
+    routes: List[RoutePolicy]
+    queue_timeout: float = DEFAULT_QUEUE_TIMEOUT
+
+
+def load_admission_config() -> AdmissionConfig:
+    """環境変数から受付制御の設定を読み込む"""
+    max_body = int(os.getenv("MAX_UPLOAD_BYTES", DEFAULT_MAX_BODY_BYTES))
+    upload = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", 8))
+    extraction = int(os.getenv("ADMISSION_EXTRACTION_CONCURRENCY", 16))
+    return AdmissionConfig(
+        routes=[
+            RoutePolicy(
+                name="upload",
+                path_prefix="/api/v1/drawings/upload",
+                concurrency=upload,
+                queue_depth=int(os.getenv("ADMISSION_UPLOAD_QUEUE", 2 * upload)),
+                max_body_bytes=max_body,
+                per_client=int(os.getenv("ADMISSION_UPLOAD_PER_CLIENT", 4)),
+            ),
+            RoutePolicy(
+                name="extraction",
+                path_prefix="/api/v1/drawings/extract",
+                concurrency=extraction,
+                queue_depth=int(os.getenv("ADMISSION_EXTRACTION_QUEUE", 2 * extraction)),
+                max_body_bytes=max_body,
+                per_client=int(os.getenv("ADMISSION_EXTRACTION_PER_CLIENT", 8)),
+            ),
+        ],
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", DEFAULT_QUEUE_TIMEOUT)),
+    )
+
+
+class _RouteGate:
+    """経路1つ分の同時処理数・待ち行列"""
+
+    def __init__(self, policy: RoutePolicy):
+        self.policy = policy
+        self.active = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._clients: Dict[str, int] = {}
+        self._service_time = INITIAL_SERVICE_TIME
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        """次のリクエストを断る状態か"""
+        return self.active >= self.policy.concurrency and self.queued >= self.policy.queue_depth
+
+    def retry_after(self) -> int:
+        """待ち行列が空くまでの見積もり（秒）"""
+        estimate = self._service_time * (self.queued + 1) / max(1, self.policy.concurrency)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(estimate)))
+
+    def _add_client(self, client: str, delta: int) -> None:
+        count = self._clients.get(client, 0) + delta
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    async def acquire(self, client: str, timeout: float) -> Optional[Tuple[int, str]]:
+        """
+        処理枠を取得する
+
+        Returns:
+            取得できた場合は None、断る場合は (ステータスコード, 理由)
+        """
+        policy = self.policy
+        if policy.per_client and self._clients.get(client, 0) >= policy.per_client:
+            return 429, "client_limit"
+        if self.active < policy.concurrency and not self._waiters:
+            self.active += 1
+            self._add_client(client, 1)
+            ADMISSION_ACTIVE.labels(policy.name).inc()
+            return None
+        if self.queued >= policy.queue_depth:
+            return 503, "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._add_client(client, 1)
+        ADMISSION_QUEUED.labels(policy.name).inc()
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except BaseException:
+            self._abandon(waiter, client)
+            raise
+        if waiter.done():
+            return None
+        self._abandon(waiter, client)
+        return 503, "timeout"
+
+    def _abandon(self, waiter: "asyncio.Future[None]", client: str) -> None:
+        """待つのをやめる（枠を渡された直後であれば返す）"""
+        if waiter.done() and not waiter.cancelled():
+            self.release(client)
+            return
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        self._add_client(client, -1)
+        ADMISSION_QUEUED.labels(self.policy.name).dec()
+
+    def release(self, client: str, elapsed: Optional[float] = None) -> None:
+        """処理枠を返し、待っているリクエストがあれば先頭に渡す"""
+        if elapsed is not None:
+            self._service_time += SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+        self._add_client(client, -1)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            ADMISSION_QUEUED.labels(self.policy.name).dec()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+        ADMISSION_ACTIVE.labels(self.policy.name).dec()
+
+
+class AdmissionController:
+    """経路ごとの受付制御"""
+
+    def __init__(self, config: AdmissionConfig):
+        """
+        初期化
+
+        Args:
+            config: 受付制御の設定
+        """
+        self.config = config
+        self._gates = [_RouteGate(policy) for policy in config.routes]
+
+    def match(self, method: str, path: str) -> Optional[_RouteGate]:
+        """リクエストが対象とする経路（対象外は None）"""
+        if method != "POST":
+            return None
+        for gate in self._gates:
+            if path.startswith(gate.policy.path_prefix):
+                return gate
+        return None
+
+    def snapshot(self) -> Dict[str, dict]:
+        """経路ごとの処理中・待ち件数と飽和状態（ヘルスチェック用）"""
+        return {
+            gate.policy.name: {
+                "active": gate.active,
+                "queued": gate.queued,
+                "concurrency": gate.policy.concurrency,
+                "queue_depth": gate.policy.queue_depth,
+                "saturated": gate.saturated,
+            }
+            for gate in self._gates
+        }
+
+    @property
+    def saturated(self) -> bool:
+        return any(gate.saturated for gate in self._gates)
+
+
+def _client_of(scope, headers: dict) -> str:
+    tenant = headers.get(TENANT_HEADER)
+    if tenant:
+        return "tenant:" + tenant.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """対象経路のリクエストを受付制御に通す ASGI ミドルウェア"""
+
+    def __init__(self, app, controller: AdmissionController):
+        """
+        初期化
+
+        Args:
+            app: ASGI アプリケーション
+            controller: 受付制御
+        """
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        gate = self.controller.match(scope["method"], scope["path"])
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        policy = gate.policy
+        headers = dict(scope.get("headers") or ())
+        limit = policy.max_body_bytes
+        too_large = f"リクエストが大きすぎます（上限 {limit} バイト）"
+        length = headers.get(b"content-length")
+        if limit and length is not None and length.isdigit() and int(length) > limit:
+            ADMISSION_REJECTIONS.labels(policy.name, "body_too_large").inc()
+            await JSONResponse({"detail": too_large}, status_code=413)(scope, receive, send)
+            return
+
+        client = _client_of(scope, headers)
+        rejection = await gate.acquire(client, self.controller.config.queue_timeout)
+        if rejection is not None:
+            status, reason = rejection
+            ADMISSION_REJECTIONS.labels(policy.name, reason).inc()
+            detail = (
+                "同じクライアントからの同時リクエスト数が上限を超えました"
+                if status == 429
+                else "混雑しています。しばらくしてから再度お試しください"
+            )
+            response = JSONResponse(
+                {"detail": detail},
+                status_code=status,
+                headers={"Retry-After": str(gate.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if limit and message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # ルートのボディ解析からそのまま 413 として返される
+                    ADMISSION_REJECTIONS.labels(policy.name, "body_too_large").inc()
+                    raise HTTPException(status_code=413, detail=too_large)
+            return message
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            gate.release(client, time.perf_counter() - start)
@@ -0,0 +1,122 @@
+"""
+パフォーマンスメトリクス
+
+処理段階（stage）ごとのレイテンシ・ペイロードサイズ・エラー件数・処理中件数を記録し、
+Prometheus テキスト形式で公開する。
+記録はラベル付きメトリクスの加算のみで、リクエスト処理への影響は数マイクロ秒程度。
+"""
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# レイテンシのバケット（秒）。ファイル操作〜LLM 呼び出しまでを想定
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+# ペイロードサイズのバケット（バイト）。1KiB〜64MiB
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(9))
+
+STAGE_LATENCY = Histogram(
+    "scaff_stage_duration_seconds",
+    "処理段階ごとのレイテンシ（秒）",
+    ["stage", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+PAYLOAD_BYTES = Histogram(
+    "scaff_payload_bytes",
+    "処理段階ごとのペイロードサイズ（バイト）",
+    ["stage"],
+    buckets=BYTES_BUCKETS,
+)
+ERRORS = Counter(
+    "scaff_errors_total",
+    "処理段階ごとのエラー件数（例外型別）",
+    ["stage", "error_type"],
+)
+LIVE_EDITS = Counter(
+    "scaff_live_edits_total",
+    "ライブ再計算で受信した編集の件数（solved: 計算 / superseded: 後続に置換 / stale: 旧版）",
+    ["outcome"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "scaff_admission_rejections_total",
+    "受付制御で断ったリクエスト数（queue_full / timeout: 503、client_limit: 429、"
+    "body_too_large: 413）",
+    ["route", "reason"],
+)
+ADMISSION_ACTIVE = Gauge(
+    "scaff_admission_active",
+    "受付制御の経路ごとの処理中件数",
+    ["route"],
+)
+ADMISSION_QUEUED = Gauge(
+    "scaff_admission_queued",
+    "受付制御の経路ごとの待ち件数",
+    ["route"],
+)
+HEDGED_REQUESTS = Counter(
+    "scaff_hedged_requests_total",
+    "ヘッジ判定の結果（primary_won / hedge_won: 先に成功した送信 / failed: 両方失敗 /"
+    " budget_exhausted: 予算切れで送らず）",
+    ["model", "outcome"],
+)
+SCHEDULER_WAIT = Histogram(
+    "scaff_scheduler_wait_seconds",
+    "抽出スケジューラの待ち時間（秒）（outcome: granted / deadline / abandoned / cancelled）",
+    ["priority", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+SCHEDULER_QUEUED = Gauge(
+    "scaff_scheduler_queued",
+    "抽出スケジューラの待ち件数",
+    ["priority"],
+)
+STORAGE_EVICTIONS = Counter(
+    "scaff_storage_evictions_total",
+    "アップロード領域から削除したファイル数（quota: 容量超過 / orphan: 孤立ファイル）",
+    ["reason"],
+)
+STORAGE_BYTES = Gauge(
+    "scaff_storage_bytes",
+    "アップロード領域の使用量（バイト）",
+)
+IN_FLIGHT = Gauge(
+    "scaff_in_flight",
+    "処理段階ごとの処理中件数",
+    ["stage"],
+)
+
+
+@contextmanager
+def track_stage(stage: str, model: str = "") -> Iterator[None]:
+    """
+    処理段階のレイテンシ・処理中件数・エラー件数を記録する
+
+    Args:
+        stage: 処理段階名（例: "upload_write", "proxy_request"）
+        model: 使用モデル名（LLM 呼び出し以外は空文字）
+    """
+    in_flight = IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.labels(stage, type(e).__name__).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(stage, model).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+def observe_bytes(stage: str, size: int) -> None:
+    """処理段階のペイロードサイズを記録する"""
+    PAYLOAD_BYTES.labels(stage).observe(size)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus テキスト形式のメトリクスと Content-Type を返す"""
+    return generate_latest(), CONTENT_TYPE_LATEST
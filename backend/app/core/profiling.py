@@ -0,0 +1,250 @@
+"""
+リクエスト単位のプロファイリング
+
+認可ヘッダー付きのリクエスト、またはサンプリング率に当たったリクエストのみ
+プロファイラを動かし、リクエストIDを付けたファイルに書き出す。
+
+- pyinstrument がインストールされていればサンプリングプロファイラで
+  speedscope 形式（フレームグラフ）を出力する
+- 無い場合は cProfile で pstats 形式を出力する
+- プロファイラはイベントループのスレッド全体を計測するため、同時に計測するのは1リクエストのみ
+  とし、計測中に届いた対象リクエストや他のプロファイラが動作中の場合は計測せずに処理する
+- 同期エンドポイントや run_in_threadpool の処理はワーカースレッドで動くため、
+  ProfiledRoute とこのモジュールの run_in_threadpool を使うと計測中のリクエストに限り
+  ワーカー側でも cProfile を動かし、結果を出力に含める（cProfile 時は統合、
+  pyinstrument 時は別ファイル *.workers.pstats）
+- 出力ファイルの書き出しはスレッドプールで行い、イベントループを止めない
+
+PROFILE_TOKEN / PROFILE_SAMPLE_RATE がどちらも未設定の場合はミドルウェア自体を登録しないため、
+無効時のオーバーヘッドはない。
+"""
+import asyncio
+import functools
+import hmac
+import inspect
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, List, Optional, TypeVar
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+T = TypeVar("T")
+
+# 認可ヘッダー名
+PROFILE_HEADER = b"x-profile"
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+@dataclass
+class ProfilingConfig:
+    """プロファイリング設定"""
+    token: Optional[str] = None  # X-Profile ヘッダーで要求された場合に照合するトークン
+    sample_rate: float = 0.0  # 全リクエストに対するサンプリング率（0〜1）
+    output_dir: Path = Path("profiles")  # 出力先ディレクトリ
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+
+def load_profiling_config() -> ProfilingConfig:
+    """環境変数からプロファイリング設定を読み込む"""
+    return ProfilingConfig(
+        token=os.getenv("PROFILE_TOKEN") or None,
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0),
+        output_dir=Path(os.getenv("PROFILE_DIR", "profiles")),
+    )
+
+
+# 計測中のリクエストのコンテキストでのみ設定される、ワーカースレッドの計測結果の格納先
+_worker_profiles: ContextVar[Optional[List[Any]]] = ContextVar("worker_profiles", default=None)
+
+
+def _call_profiled(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    ワーカースレッドで関数を呼び出す（計測中のリクエストなら cProfile で計測する）
+
+    cProfile はスレッドごとに動くため、イベントループ側のプロファイラでは
+    ワーカースレッドの処理が見えない。その分をここで計測して格納先に追加する。
+    """
+    profiles = _worker_profiles.get()
+    if profiles is None:
+        return func(*args, **kwargs)
+
+    import cProfile
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Python 3.12 以降で他の cProfile が動作中（全スレッドを計測済み）
+        return func(*args, **kwargs)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profile.disable()
+        profiles.append(profile)
+
+
+async def run_in_threadpool(func: Callable[..., T], *args, **kwargs) -> T:
+    """starlette の run_in_threadpool と同じ（計測中のリクエストではワーカー側も計測する）"""
+    if _worker_profiles.get() is None:
+        return await _run_in_threadpool(func, *args, **kwargs)
+    return await _run_in_threadpool(_call_profiled, func, *args, **kwargs)
+
+
+class ProfiledRoute(APIRoute):
+    """同期エンドポイントをワーカースレッド内で計測するルート"""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        if not (
+            asyncio.iscoroutinefunction(endpoint)
+            or inspect.isgeneratorfunction(endpoint)
+            or inspect.isasyncgenfunction(endpoint)
+        ):
+            original = endpoint
+
+            # FastAPI は __wrapped__ をたどって引数の型を解析する
+            @functools.wraps(original)
+            def endpoint(*args, **kwargs):
+                return _call_profiled(original, *args, **kwargs)
+
+        super().__init__(path, endpoint, **kwargs)
+
+
+class _Profiler:
+    """pyinstrument（あれば）または cProfile の薄いラッパー"""
+
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            import cProfile
+
+            self._impl = cProfile.Profile()
+            self._sampling = False
+        else:
+            self._impl = Profiler(async_mode="enabled")
+            self._sampling = True
+
+    def start(self) -> None:
+        """
+        計測を開始する
+
+        Raises:
+            ValueError: 他のプロファイラが動作中（Python 3.12 以降の cProfile）
+        """
+        if self._sampling:
+            self._impl.start()
+        else:
+            self._impl.enable()
+
+    def stop(self) -> None:
+        """計測を停止する（開始したスレッドで呼ぶ）"""
+        if self._sampling:
+            self._impl.stop()
+        else:
+            self._impl.disable()
+
+    def dump(self, stem: Path, workers: List[Any] = ()) -> Path:
+        """
+        停止後の結果を出力し、出力ファイルパスを返す
+
+        Args:
+            stem: 拡張子を除いた出力先
+            workers: ワーカースレッドで計測した cProfile の結果
+        """
+        import pstats
+
+        if not self._sampling:
+            path = stem.with_suffix(".pstats")
+            stats = pstats.Stats(self._impl)
+            for profile in workers:
+                stats.add(profile)
+            stats.dump_stats(str(path))
+            return path
+
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        path = stem.with_suffix(".speedscope.json")
+        path.write_text(self._impl.output(SpeedscopeRenderer()), encoding="utf-8")
+        if workers:
+            stats = pstats.Stats(workers[0])
+            for profile in workers[1:]:
+                stats.add(profile)
+            stats.dump_stats(str(stem.with_suffix(".workers.pstats")))
+        return path
+
+
+class ProfilingMiddleware:
+    """対象リクエストのみプロファイラを動かす ASGI ミドルウェア"""
+
+    def __init__(self, app, config: ProfilingConfig):
+        """
+        初期化
+
+        Args:
+            app: ASGI アプリケーション
+            config: プロファイリング設定
+        """
+        self.app = app
+        self.config = config
+        self._active = False  # 計測中のリクエストがあるか
+        config.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def _should_profile(self, headers: dict) -> bool:
+        token = self.config.token
+        requested = headers.get(PROFILE_HEADER)
+        if token and requested is not None:
+            return hmac.compare_digest(requested, token.encode("latin-1"))
+        return self.config.sample_rate > 0 and random.random() < self.config.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or ())
+        if self._active or not self._should_profile(headers):
+            await self.app(scope, receive, send)
+            return
+
+        raw_id = headers.get(REQUEST_ID_HEADER)
+        request_id = raw_id.decode("latin-1") if raw_id else uuid.uuid4().hex
+        # ファイル名に使えない文字を除く
+        safe_id = "".join(c for c in request_id if c.isalnum() or c in "-_")[:64] or "request"
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-profile-id", safe_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        profiler = _Profiler()
+        try:
+            profiler.start()
+        except ValueError:
+            # 他のプロファイラが動作中
+            await self.app(scope, receive, send)
+            return
+        self._active = True
+        workers: List[Any] = []
+        context_token = _worker_profiles.set(workers)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            _worker_profiles.reset(context_token)
+            self._active = False
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            await _run_in_threadpool(
+                profiler.dump, self.config.output_dir / f"{stamp}_{safe_id}", list(workers)
+            )
@@ -0,0 +1,55 @@
+"""
+ワーカー起動後のウォームアップ
+
+重い依存ライブラリの読み込みと足場計算の初回実行を事前に済ませ、
+最初のリクエストの遅延を抑える。
+アプリの lifespan からバックグラウンドで実行するため、ヘルスチェックの応答は妨げない。
+"""
+import importlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# 事前に読み込むモジュール（未インストールのものは無視する）
+WARMUP_MODULES = (
+    "httpx",
+    "numpy",
+    "PIL.Image",
+    "cv2",
+    "xlsxwriter",
+    "app.services.gemini_outline_extractor",
+    "app.services.roof_extractor",
+    "app.services.dimension_reader",
+    "app.services.drawing_similarity",
+    "app.services.extraction_scheduler",
+    "app.services.scaffold_service",
+    "app.services.live_session",
+    "app.services.quantity_export",
+)
+
+
+def warmup_enabled() -> bool:
+    """環境変数 WARMUP_ON_STARTUP が有効か"""
+    return os.getenv("WARMUP_ON_STARTUP", "").lower() in ("1", "true", "yes")
+
+
+def warm_up() -> None:
+    """重い依存の読み込みと足場計算の初回実行を行う"""
+    for name in WARMUP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+
+    try:
+        from scaffold_logic import BuildingOutline, HeightCondition, Point2D, calculate_scaffold
+
+        outline = BuildingOutline(vertices=[
+            Point2D(0, 0), Point2D(9100, 0), Point2D(9100, 7280), Point2D(0, 7280),
+        ])
+        calculate_scaffold(outline, HeightCondition())
+    except Exception:
+        logger.exception("ウォームアップ中にエラーが発生しました")
+        return
+    logger.info("ウォームアップが完了しました")
@@ -1,23 +1,56 @@
 """
 FastAPI アプリケーション エントリポイント
+
+起動を速くするため、重い依存ライブラリはサービス層で初回利用時に読み込む。
+WARMUP_ON_STARTUP を有効にすると、起動後にバックグラウンドで事前読み込みを行う。
 """
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from dotenv import load_dotenv
 
 # .envファイルを読み込み
 load_dotenv()
 
-from app.api.v1 import drawings
+from app.api.v1 import drawings, scaffold
+from app.core.admission import AdmissionController, AdmissionMiddleware, load_admission_config
+from app.core.metrics import render_metrics
+from app.core.profiling import ProfilingMiddleware, load_profiling_config
+from app.core.warmup import warm_up, warmup_enabled
+from app.services.storage_manager import get_storage_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了処理"""
+    if warmup_enabled():
+        # ヘルスチェックの応答を妨げないよう、ウォームアップは待たずに別スレッドで実行
+        app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warm_up)
+    # アップロード領域の容量管理（走査・削除はバックグラウンドで行う）
+    storage_task = asyncio.create_task(get_storage_manager(UPLOAD_DIR).run())
+    yield
+    storage_task.cancel()
+    try:
+        await storage_task
+    except asyncio.CancelledError:
+        pass
+
 
 app = FastAPI(
     title="Scaff-Pro API",
     description="足場SaaSツール バックエンドAPI",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+# アップロード・図面抽出の受付制御。後から登録したミドルウェアほど外側になるため、
+# 断る応答にも CORS ヘッダーが付くよう CORS より先に登録する
+admission = AdmissionController(load_admission_config())
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS設定（開発環境用）
 app.add_middleware(
     CORSMiddleware,
@@ -32,8 +65,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# リクエスト単位のプロファイリング（PROFILE_TOKEN / PROFILE_SAMPLE_RATE 設定時のみ）
+profiling_config = load_profiling_config()
+if profiling_config.enabled:
+    app.add_middleware(ProfilingMiddleware, config=profiling_config)
+
 # APIルーター登録
 app.include_router(drawings.router, prefix="/api/v1")
+app.include_router(scaffold.router, prefix="/api/v1")
 
 # アップロードディレクトリ作成
 UPLOAD_DIR = Path("uploads")
@@ -47,6 +86,22 @@ async def root():
 
 
 @app.get("/api/v1/health")
-async def health_check():
-    """APIヘルスチェック"""
-    return {"status": "healthy"}
+async def health_check(response: Response):
+    """
+    APIヘルスチェック
+
+    受付制御のいずれかの経路が飽和している間は 503 を返し、ロードバランサーが
+    このワーカーを避けられるようにする。
+    """
+    routes = admission.snapshot()
+    if admission.saturated:
+        response.status_code = 503
+        return {"status": "saturated", "admission": routes}
+    return {"status": "healthy", "admission": routes}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 形式のパフォーマンスメトリクス"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
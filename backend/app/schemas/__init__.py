@@ -10,6 +10,23 @@ from .drawing import (
     Point,
     Bounds,
 )
+from .scaffold import (
+    ScaffoldCalculateRequest,
+    ScaffoldCalculateResponse,
+    ScaffoldMemberSchema,
+    QuantityRow,
+    HeightConditionSchema,
+    ScaffoldSpecSchema,
+    NGAreaSchema,
+    FloorOutlineSchema,
+    RoofSchema,
+    ScaffoldLassoQuantityRequest,
+    ScaffoldQuantityResponse,
+    ScaffoldExportItem,
+    ScaffoldExportRequest,
+    LiveMemberSchema,
+    LiveDeltaMessage,
+)
 
 __all__ = [
     "DrawingUploadResponse",
@@ -19,4 +36,19 @@ __all__ = [
     "ExtractedDimension",
     "Point",
     "Bounds",
+    "ScaffoldCalculateRequest",
+    "ScaffoldCalculateResponse",
+    "ScaffoldMemberSchema",
+    "QuantityRow",
+    "HeightConditionSchema",
+    "ScaffoldSpecSchema",
+    "NGAreaSchema",
+    "FloorOutlineSchema",
+    "RoofSchema",
+    "ScaffoldLassoQuantityRequest",
+    "ScaffoldQuantityResponse",
+    "ScaffoldExportItem",
+    "ScaffoldExportRequest",
+    "LiveMemberSchema",
+    "LiveDeltaMessage",
 ]
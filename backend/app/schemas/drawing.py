@@ -1,7 +1,7 @@
 """
 図面関連のPydanticスキーマ
 """
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -65,3 +65,50 @@ class DrawingUploadResponse(BaseModel):
     status: Literal["uploading", "processing", "ready", "error"]
     processedData: Optional[ProcessedDrawingData] = None
     errorMessage: Optional[str] = None
+
+
+class CoordinatePoint(BaseModel):
+    """座標点"""
+    point: str
+    x: float
+    y: float
+
+
+class DimensionLine(BaseModel):
+    """寸法線"""
+    label: str  # 寸法線のラベル（例: "X1-X2", "Y1-Y2"）
+    value_mm: float  # 読み取った寸法値 (mm)
+    direction: str  # "horizontal" or "vertical"
+    raw_text: str  # 図面上に記載されたテキスト
+
+
+class OutlineExtractionResult(BaseModel):
+    """建物の外周座標抽出結果"""
+    width_mm: float
+    height_mm: float
+    dimensions: List[DimensionLine]
+    coordinates: List[CoordinatePoint]
+    floor: Optional[int] = None
+    color: Optional[str] = None
+    reused_from: Optional[str] = None  # 近似重複の図面から結果を再利用した場合の元図面ID
+    similarity: Optional[float] = None  # 再利用元との類似度（0〜1）
+
+
+class RoofConfig(BaseModel):
+    """屋根設定"""
+    eaveOverhang: float = 0  # 軒出 (mm)
+    gableOverhang: float = 0  # ケラバ出幅 (mm)
+    slopeRatio: Optional[str] = None  # 勾配（例: "4/10"）
+    slopeAngle: Optional[float] = None  # 傾斜角度（度）
+    roofType: Literal["flat", "gable", "hip", "shed"] = "flat"  # 屋根形状
+    ridgeHeight: Optional[float] = None  # 棟高さ (mm)
+    rawTexts: List[str] = []  # 図面から読み取った元テキスト
+
+
+class RoofExtractionResult(BaseModel):
+    """屋根情報抽出結果"""
+    success: bool
+    config: Optional[RoofConfig] = None
+    error: Optional[str] = None
+    reused_from: Optional[str] = None  # 近似重複の図面から結果を再利用した場合の元図面ID
+    similarity: Optional[float] = None  # 再利用元との類似度（0〜1）
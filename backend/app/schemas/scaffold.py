@@ -0,0 +1,164 @@
+"""
+足場計算関連のPydanticスキーマ
+"""
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+from .drawing import ExtractedEntrance, Point
+
+# 入力座標の絶対値の上限（mm）。敷地と周辺を含めても十分な範囲にとどめ、
+# 空間インデックスのセル数が入力次第で際限なく増えないようにする
+MAX_COORDINATE = 1_000_000.0
+
+# 投げ縄の頂点数の上限
+MAX_LASSO_VERTICES = 1000
+
+
+class PlanPoint(Point):
+    """足場計算の入力座標（mm、絶対値は MAX_COORDINATE 以下）"""
+    x: float = Field(ge=-MAX_COORDINATE, le=MAX_COORDINATE)
+    y: float = Field(ge=-MAX_COORDINATE, le=MAX_COORDINATE)
+
+
+class Point3DSchema(BaseModel):
+    """3D座標"""
+    x: float
+    y: float
+    z: float
+
+
+class HeightConditionSchema(BaseModel):
+    """高さ条件"""
+    floor_count: int = 2
+    floor_height: float = 2850.0  # mm
+    eaves_height: float = 5700.0  # mm
+    max_height: float = 7000.0  # mm
+
+
+class ScaffoldSpecSchema(BaseModel):
+    """足場仕様テンプレート"""
+    # 標準スパンは NG エリアのグリッドのセルサイズにも使う
+    standard_span: float = Field(1800.0, ge=300.0, le=6000.0)  # mm
+    floor_pitch: float = Field(1900.0, ge=300.0, le=6000.0)  # mm
+    scaffold_width: float = 600.0  # mm
+    wall_standoff: float = 300.0  # 外壁からの離れ (mm)
+    roof_clearance: float = 100.0  # 軒先・ケラバからのクリアランス (mm)
+    available_spans: list[float] = Field(
+        default_factory=lambda: [1800, 1500, 1200, 900, 600, 355, 300, 150]
+    )
+
+
+class RoofSchema(BaseModel):
+    """屋根条件（RoofConfig の軒出・ケラバ・屋根形状・勾配・棟高さ）"""
+    eave_overhang: float = 0.0  # 軒出 (mm)
+    gable_overhang: float = 0.0  # ケラバ出幅 (mm)
+    roof_type: Literal["flat", "gable", "hip", "shed"] = "flat"
+    slope_angle: Optional[float] = None  # 傾斜角度（度）
+    ridge_height: Optional[float] = None  # 棟高さ (mm)
+
+
+class NGAreaSchema(BaseModel):
+    """足場設置禁止エリア（外接矩形）"""
+    min_point: PlanPoint
+    max_point: PlanPoint
+    kind: str = "opening"  # opening / entrance / boundary など
+
+
+class FloorOutlineSchema(BaseModel):
+    """階ごとの外形（ExtractedOutline と互換）"""
+    vertices: list[PlanPoint]  # 直角多角形
+    floor: int
+
+
+class ScaffoldCalculateRequest(BaseModel):
+    """足場計算リクエスト"""
+    vertices: list[PlanPoint]  # 建物外周ポリライン（直角多角形、1階の外形）
+    # 下屋・バルコニー等で1階と外形が異なる階（指定の無い階は直下の階と同じ）
+    floor_outlines: list[FloorOutlineSchema] = Field(default_factory=list)
+    height_condition: HeightConditionSchema = Field(default_factory=HeightConditionSchema)
+    scaffold_spec: Optional[ScaffoldSpecSchema] = None
+    roof: Optional[RoofSchema] = None  # 軒先・ケラバのクリアランス計算用
+    ng_areas: list[NGAreaSchema] = Field(default_factory=list)
+    entrances: list[ExtractedEntrance] = Field(default_factory=list)  # NG エリアとして扱う
+
+
+class ScaffoldLassoQuantityRequest(ScaffoldCalculateRequest):
+    """投げ縄範囲の数量集計リクエスト"""
+    # 投げ縄の頂点列（外周と同じ座標系）
+    lasso: list[PlanPoint] = Field(min_length=3, max_length=MAX_LASSO_VERTICES)
+
+
+class ScaffoldExportItem(BaseModel):
+    """数量表エクスポート対象（建物1棟分）"""
+    label: str = ""  # 建物名など、数量表の「建物」列に出力する
+    calculation: ScaffoldCalculateRequest
+
+
+class ScaffoldExportRequest(BaseModel):
+    """数量表エクスポートリクエスト（複数棟・ポートフォリオ単位）"""
+    items: list[ScaffoldExportItem]
+    format: Literal["csv", "xlsx"] = "csv"
+
+
+class ScaffoldMemberSchema(BaseModel):
+    """足場部材"""
+    member_type: str
+    length: float  # mm
+    face: str
+    position_start: Point3DSchema
+    position_end: Point3DSchema
+
+
+class QuantityRow(BaseModel):
+    """数量集計行（部材種別×長さ×面）"""
+    member_type: str
+    length: float  # mm
+    face: str
+    count: int
+
+
+class ScaffoldCalculateResponse(BaseModel):
+    """足場計算レスポンス"""
+    result_key: str  # 正規化した入力のハッシュ
+    cached: bool  # キャッシュから返したかどうか
+    members: list[ScaffoldMemberSchema]
+    quantities: list[QuantityRow]
+
+
+class LiveMemberSchema(ScaffoldMemberSchema):
+    """ライブ再計算の差分に含める部材（位置から決まる安定ID付き）"""
+    id: str
+
+
+class LiveDeltaMessage(BaseModel):
+    """ライブ再計算の差分メッセージ（サーバー → クライアント）"""
+    type: Literal["delta"] = "delta"
+    version: int  # 計算した編集の版
+    base_version: Optional[int]  # 差分の基準（クライアントが最後に ack した版、None は全量）
+    result_key: str
+    cached: bool
+    added: list[LiveMemberSchema]  # 基準版から追加された部材
+    removed: list[str]  # 基準版から削除された部材ID
+    quantities: list[QuantityRow]  # 基準版から数量が変わった行（count=0 は削除）
+
+
+class RoofClashSchema(BaseModel):
+    """足場部材と屋根の干渉"""
+    member_index: int  # members 内の位置
+    member: ScaffoldMemberSchema
+    floor: int  # 干渉した屋根の階（最上階以外は下屋）
+    overlap: float  # 屋根の内側に入っている長さ (mm)
+    adjustment: Literal["height", "span"]  # 高さを変える / スパンを詰める
+    amount: float  # 調整量 (mm、height は上げる向きが正)
+
+
+class ScaffoldClashResponse(BaseModel):
+    """屋根との干渉チェックレスポンス"""
+    result_key: str
+    clashes: list[RoofClashSchema]
+
+
+class ScaffoldQuantityResponse(BaseModel):
+    """数量集計レスポンス"""
+    result_key: str
+    quantities: list[QuantityRow]
@@ -1,6 +1,30 @@
 """
 サービスレイヤー
+
+起動時間を抑えるため、各サービスは属性の初回参照時に読み込む。
 """
-from .gemini_outline_extractor import GeminiOutlineExtractor, OutlineExtractionResult, DimensionLine
+import importlib
+
+# 公開名 → 定義モジュール
+_EXPORTS = {
+    "GeminiOutlineExtractor": ".gemini_outline_extractor",
+    "OutlineExtractionResult": ".gemini_outline_extractor",
+    "DimensionLine": ".gemini_outline_extractor",
+    "LocalDimensionReader": ".dimension_reader",
+    "ExtractionScheduler": ".extraction_scheduler",
+    "ScaffoldService": ".scaffold_service",
+    "ScaffoldCalculation": ".scaffold_service",
+    "get_scaffold_service": ".scaffold_service",
+    "LiveLayoutSession": ".live_session",
+}
+
+__all__ = list(_EXPORTS)
+
 
-__all__ = ["GeminiOutlineExtractor", "OutlineExtractionResult", "DimensionLine"]
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
@@ -1,13 +1,177 @@
 """
 BudgetCap プロキシ経由で Gemini API を呼び出すクライアント
 OpenAI形式でリクエスト、Geminiネイティブ形式でレスポンス
+
+画像付きリクエストのボディは一括で組み立てず、JSON の前半・画像の base64・後半を
+順に送出するストリームとして生成する。画像はファイルの場合 mmap で参照するため、
+処理中のメモリ使用量は画像サイズによらずほぼ一定になる。
+
+ヘッジ（HedgePolicy）を有効にすると、モデルごとのレイテンシの分位点を過ぎても応答が無い
+呼び出しに同じリクエストをもう1件送り、先に成功した方を採用してもう一方は中断する。
+追加で送る件数は通常の呼び出し件数に対する割合で上限を設ける。
 """
 import os
+import asyncio
 import base64
-import httpx
-from typing import Optional, Union
+import json
+import math
+import mmap
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import AsyncIterator, BinaryIO, Deque, Dict, Iterator, Optional, Union
 from pathlib import Path
 
+from app.core.metrics import HEDGED_REQUESTS, observe_bytes, track_stage
+
+# base64 を逐次エンコードする入力チャンクサイズ（3の倍数にして途中にパディングを入れない）
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+# 画像 URL を差し込む位置の目印
+_IMAGE_URL_MARKER = "__SCAFF_IMAGE_DATA_URL__"
+
+ImageData = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# ヘッジ判定に使う直近のレイテンシの件数（モデルごと）
+HEDGE_WINDOW = 200
+
+# 分位点を使い始めるまでに必要なレイテンシの件数
+HEDGE_MIN_SAMPLES = 20
+
+# ヘッジの予算: 通常の呼び出し1件ごとに貯まる追加送信の枠と、貯められる上限
+DEFAULT_HEDGE_BUDGET = 0.05
+HEDGE_BURST = 5.0
+
+
+class _ImageRequestBody:
+    """
+    画像付きリクエストボディを逐次生成する反復可能オブジェクト
+
+    画像データは memoryview で参照し、BASE64_CHUNK_SIZE ごとにエンコードして送出する。
+    長さが事前に分かるため Content-Length を付けて送信できる。
+    """
+
+    def __init__(self, model: str, prompt: str, image: memoryview, mime_type: str):
+        document = json.dumps({
+            "model": model,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": _IMAGE_URL_MARKER}},
+                ],
+            }],
+        }, ensure_ascii=False)
+        # 画像 URL はプロンプトより後ろにあるため、最後の目印で分割する
+        prefix, _, suffix = document.rpartition(json.dumps(_IMAGE_URL_MARKER))
+        self._prefix = f'{prefix}"data:{mime_type};base64,'.encode("utf-8")
+        self._suffix = f'"{suffix}'.encode("utf-8")
+        self._image = image
+        self.image_size = image.nbytes
+
+    def __len__(self) -> int:
+        encoded = 4 * ((self.image_size + 2) // 3)
+        return len(self._prefix) + encoded + len(self._suffix)
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._prefix
+        image = self._image
+        for offset in range(0, self.image_size, BASE64_CHUNK_SIZE):
+            yield base64.b64encode(image[offset:offset + BASE64_CHUNK_SIZE])
+        yield self._suffix
+
+    async def async_chunks(self) -> AsyncIterator[bytes]:
+        """非同期クライアント用にボディを送出する（呼び出すごとに先頭から生成する）"""
+        for chunk in self:
+            yield chunk
+
+
+@contextmanager
+def _map_file(f: BinaryIO) -> Iterator[ImageData]:
+    """ファイルを読み取り専用で mmap する（空ファイルは空バイト列）"""
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b""
+        return
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+class HedgePolicy:
+    """
+    ヘッジの判定（モデルごとのレイテンシの分位点と追加送信の予算）
+
+    レイテンシは直近 HEDGE_WINDOW 件を保持し、呼び出しのたびに分位点を求める。
+    予算はトークンバケットで、通常の呼び出し1件ごとに budget_ratio 件分が貯まり、
+    ヘッジを1件送るごとに1件分を使う（長期的に追加送信は呼び出し件数の budget_ratio 倍以下）。
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget_ratio: float = DEFAULT_HEDGE_BUDGET,
+        burst: float = HEDGE_BURST,
+    ):
+        """
+        初期化
+
+        Args:
+            percentile: この分位点（%）のレイテンシを過ぎても応答が無ければヘッジを送る
+            budget_ratio: 通常の呼び出し1件あたりに許す追加送信の件数
+            burst: 貯められる追加送信の件数の上限
+        """
+        if not 0 < percentile < 100:
+            raise ValueError("percentile は 0 より大きく 100 未満である必要があります")
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._tokens = 0.0
+
+    def on_request(self, model: str) -> Optional[float]:
+        """
+        呼び出しの開始を記録し、ヘッジを送るまでの待ち時間を返す
+
+        Returns:
+            待ち時間（秒）。レイテンシの件数が足りない間は None（ヘッジしない）
+        """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.budget_ratio)
+            samples = self._latencies.get(model)
+            if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(samples)
+        rank = math.ceil(self.percentile / 100 * len(ordered)) - 1
+        return ordered[rank]
+
+    def record(self, model: str, latency: float) -> None:
+        """呼び出しのレイテンシ（秒）を記録する"""
+        with self._lock:
+            samples = self._latencies.get(model)
+            if samples is None:
+                samples = self._latencies[model] = deque(maxlen=HEDGE_WINDOW)
+            samples.append(latency)
+
+    def try_acquire(self) -> bool:
+        """予算が残っていればヘッジ1件分を使う"""
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
 
 class BudgetCapGeminiClient:
     """BudgetCap経由でGemini APIを呼び出すクライアント"""
@@ -15,16 +179,18 @@ class BudgetCapGeminiClient:
     PROXY_URL = "https://btvjysmcareurvbmhnkv.supabase.co/functions/v1/proxy"
     PROVIDER = "gemini"
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, hedging: Optional[HedgePolicy] = None):
         """
         初期化
 
         Args:
             api_key: BudgetCap API キー（省略時は環境変数から取得）
+            hedging: ヘッジの判定（省略時はヘッジしない）
         """
         self.api_key = api_key or os.getenv("BUDGETCAP_API_KEY")
         if not self.api_key:
             raise ValueError("BUDGETCAP_API_KEY 環境変数が設定されていません")
+        self.hedging = hedging
 
     def _get_headers(self) -> dict:
         """リクエストヘッダーを生成"""
@@ -34,43 +200,22 @@ class BudgetCapGeminiClient:
             "Content-Type": "application/json",
         }
 
-    def _build_messages(
-        self,
-        prompt: str,
-        image_data: Optional[bytes] = None,
-        mime_type: str = "image/jpeg"
-    ) -> list:
+    def _build_messages(self, prompt: str) -> list:
         """
-        OpenAI形式のmessages配列を構築
+        テキストのみのOpenAI形式messages配列を構築
+
+        画像付きの場合は _ImageRequestBody でボディ全体をストリーム生成する。
 
         Args:
             prompt: テキストプロンプト
-            image_data: 画像のバイトデータ（オプション）
-            mime_type: 画像のMIMEタイプ
         """
-        if image_data:
-            # 画像付きメッセージ（OpenAI Vision形式）
-            base64_image = base64.b64encode(image_data).decode("utf-8")
-            content = [
-                {"type": "text", "text": prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{mime_type};base64,{base64_image}"
-                    }
-                }
-            ]
-        else:
-            # テキストのみ
-            content = prompt
-
-        return [{"role": "user", "content": content}]
+        return [{"role": "user", "content": prompt}]
 
     def generate_content(
         self,
         model: str,
         prompt: str,
-        image_data: Optional[bytes] = None,
+        image_data: Optional[ImageData] = None,
         mime_type: str = "image/jpeg",
         timeout: float = 120.0
     ) -> str:
@@ -80,29 +225,47 @@ class BudgetCapGeminiClient:
         Args:
             model: 使用するモデル名（例: "gemini-2.5-flash-lite"）
             prompt: テキストプロンプト
-            image_data: 画像のバイトデータ（オプション）
+            image_data: 画像のバイトデータ（bytes / memoryview / mmap、オプション）
             mime_type: 画像のMIMEタイプ
             timeout: タイムアウト秒数
 
         Returns:
             生成されたテキスト
         """
-        messages = self._build_messages(prompt, image_data, mime_type)
+        import httpx  # 起動時間短縮のため初回呼び出し時に読み込む
 
-        payload = {
-            "model": model,
-            "messages": messages,
-        }
+        headers = self._get_headers()
+        image = memoryview(image_data) if image_data else None
+        try:
+            body = None
+            if image is not None:
+                # 画像付き: ボディをストリーム生成（画像全体の base64 文字列は作らない）
+                body = _ImageRequestBody(model, prompt, image, mime_type)
+                observe_bytes("image", body.image_size)
+                headers["Content-Length"] = str(len(body))
+                request_kwargs = {"content": body}
+            else:
+                request_kwargs = {
+                    "json": {"model": model, "messages": self._build_messages(prompt)}
+                }
 
-        with httpx.Client(timeout=timeout) as client:
-            response = client.post(
-                self.PROXY_URL,
-                headers=self._get_headers(),
-                json=payload
-            )
-            response.raise_for_status()
+            with track_stage("proxy_request", model):
+                # イベントループ上から直接呼ばれた場合はヘッジせず従来どおり送る
+                if self.hedging is not None and not _in_event_loop():
+                    response = asyncio.run(
+                        self._post_hedged(model, headers, body, request_kwargs, timeout)
+                    )
+                else:
+                    with httpx.Client(timeout=timeout) as client:
+                        response = client.post(self.PROXY_URL, headers=headers, **request_kwargs)
+                        response.raise_for_status()
+        finally:
+            if image is not None:
+                image.release()
+        observe_bytes("proxy_response", len(response.content))
 
-        result = response.json()
+        with track_stage("json_parse", model):
+            result = response.json()
 
         # Gemini APIのレスポンス構造からテキストを抽出
         # 通常: candidates[0].content.parts[0].text
@@ -120,6 +283,74 @@ class BudgetCapGeminiClient:
         except (KeyError, IndexError) as e:
             raise ValueError(f"レスポンスのパースに失敗しました: {e}\nレスポンス: {result}")
 
+    async def _post_hedged(
+        self,
+        model: str,
+        headers: dict,
+        body: Optional[_ImageRequestBody],
+        request_kwargs: dict,
+        timeout: float,
+    ) -> "httpx.Response":
+        """
+        ヘッジ付きでリクエストを送る
+
+        最初の送信から分位点の時間が過ぎても応答が無く予算が残っていれば同じリクエストを
+        もう1件送り、先に成功した方を返してもう一方は中断する。両方失敗した場合は
+        最初の送信のエラーを送出する。
+        """
+        import httpx
+
+        policy = self.hedging
+        delay = policy.on_request(model)
+
+        async with httpx.AsyncClient(timeout=timeout) as client:
+
+            async def attempt(primary: bool) -> httpx.Response:
+                # ボディは送信ごとに先頭から生成する（画像は同じ memoryview を参照する）
+                kwargs = {"content": body.async_chunks()} if body is not None else request_kwargs
+                start = time.perf_counter()
+                try:
+                    response = await client.post(self.PROXY_URL, headers=headers, **kwargs)
+                    response.raise_for_status()
+                except asyncio.CancelledError:
+                    # 中断された最初の送信も、その時点までの経過時間を記録する
+                    # （遅い呼び出しを記録から外すと分位点が下がり、ヘッジが増え続けるため）
+                    if primary:
+                        policy.record(model, time.perf_counter() - start)
+                    raise
+                if primary:
+                    policy.record(model, time.perf_counter() - start)
+                return response
+
+            first = asyncio.ensure_future(attempt(primary=True))
+            if delay is None:
+                return await first
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+            if not policy.try_acquire():
+                HEDGED_REQUESTS.labels(model, "budget_exhausted").inc()
+                return await first
+
+            second = asyncio.ensure_future(attempt(primary=False))
+            pending = {first, second}
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        if task.exception() is None:
+                            outcome = "primary_won" if task is first else "hedge_won"
+                            HEDGED_REQUESTS.labels(model, outcome).inc()
+                            return task.result()
+                HEDGED_REQUESTS.labels(model, "failed").inc()
+                return first.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
     def generate_content_from_file(
         self,
         model: str,
@@ -128,7 +359,7 @@ class BudgetCapGeminiClient:
         timeout: float = 120.0
     ) -> str:
         """
-        ファイルパスから画像を読み込んでコンテンツを生成
+        ファイルパスから画像を読み込んでコンテンツを生成（mmap で参照し、全体を読み込まない）
 
         Args:
             model: 使用するモデル名
@@ -153,8 +384,8 @@ class BudgetCapGeminiClient:
         }
         mime_type = mime_types.get(path.suffix.lower(), "image/jpeg")
 
-        image_data = path.read_bytes()
-        return self.generate_content(model, prompt, image_data, mime_type, timeout)
+        with open(path, "rb") as f, _map_file(f) as image_data:
+            return self.generate_content(model, prompt, image_data, mime_type, timeout)
 
 
 # シングルトンインスタンス（遅延初期化）
@@ -165,5 +396,12 @@ def get_client() -> BudgetCapGeminiClient:
     """BudgetCapクライアントのシングルトンインスタンスを取得"""
     global _client
     if _client is None:
-        _client = BudgetCapGeminiClient()
+        hedging = None
+        percentile = float(os.getenv("BUDGETCAP_HEDGE_PERCENTILE", "0") or 0)
+        if percentile > 0:
+            hedging = HedgePolicy(
+                percentile=percentile,
+                budget_ratio=float(os.getenv("BUDGETCAP_HEDGE_BUDGET", DEFAULT_HEDGE_BUDGET)),
+            )
+        _client = BudgetCapGeminiClient(hedging=hedging)
     return _client
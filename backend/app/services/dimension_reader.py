@@ -0,0 +1,405 @@
+"""
+図面の寸法値のローカル読み取り（OpenCV + Tesseract）
+
+図面を外部に送らずに、寸法線とその寸法値を読み取って DimensionLine を返す。
+
+1. 2値化した図面から、細長い矩形カーネルのオープニングで水平・垂直の細線を抽出する
+2. 細線を除いた画素を文字方向に膨張させて文字列の塊にまとめ、
+   寸法線の近く（水平線の上下・垂直線の左右）にある塊だけを寸法値の候補とする
+3. 候補領域だけを切り出し、ワーカープロセスで並列に Tesseract（1行・数字のみ）に掛ける
+
+ページ全体ではなく候補領域だけを OCR するため、大きな図面でも数秒で読み取れる。
+"""
+import logging
+import math
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from app.core.metrics import track_stage
+
+from .gemini_outline_extractor import DimensionLine
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 寸法値として採用する範囲（mm）
+MIN_DIMENSION_MM = 10.0
+MAX_DIMENSION_MM = 100_000.0
+
+# Tesseract の設定（1行として読み、数字と区切り記号だけを認識する）
+TESSERACT_CONFIG = "--psm 7 -c tessedit_char_whitelist=0123456789,."
+
+# OCR に渡す文字の高さ（px）。これより小さい候補は拡大する
+OCR_TEXT_HEIGHT = 40
+
+# 切り出し時の余白（px）
+TILE_PADDING = 4
+
+# 寸法値の文字の最小高さ（px）
+MIN_TEXT_HEIGHT = 6
+
+# 候補検出に使う画像の長辺の上限（px）。大きな図面は縮小して検出する
+DETECT_MAX_SIDE = 4000
+
+# 数値（3桁区切りのカンマ・小数点を許容）
+_NUMBER = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+
+
+@dataclass
+class _Box:
+    """画像上の矩形（px）"""
+    x: int
+    y: int
+    w: int
+    h: int
+
+    @property
+    def cx(self) -> float:
+        return self.x + self.w / 2
+
+    @property
+    def cy(self) -> float:
+        return self.y + self.h / 2
+
+
+@dataclass
+class _DetectParams:
+    """検出用画像の解像度に合わせた検出パラメータ（px）"""
+    min_line_length: int
+    max_line_thickness: int
+    min_text_height: int
+    max_text_height: int
+    max_text_gap: int
+
+
+def _unscale(box: _Box, scale: float) -> _Box:
+    """検出用画像の矩形を元画像の矩形に戻す"""
+    if scale >= 1.0:
+        return box
+    x, y = int(box.x / scale), int(box.y / scale)
+    right, bottom = math.ceil((box.x + box.w) / scale), math.ceil((box.y + box.h) / scale)
+    return _Box(x, y, right - x, bottom - y)
+
+
+# OCR タスク: (切り出し画像, 試す回転の列)。回転は cv2.rotate のコード（None は回転なし）
+_Task = Tuple["np.ndarray", Tuple[Optional[int], ...]]
+
+
+def parse_dimension_text(text: str) -> Optional[float]:
+    """
+    OCR 結果から寸法値（mm）を取り出す
+
+    全角数字・全角記号は半角に揃え、最も長い数値を採用する。
+    3桁区切りのカンマは除き、範囲外の値は None とする。
+    """
+    normalized = unicodedata.normalize("NFKC", text).replace(" ", "")
+    numbers = _NUMBER.findall(normalized)
+    if not numbers:
+        return None
+    value = float(max(numbers, key=len).replace(",", ""))
+    if not MIN_DIMENSION_MM <= value <= MAX_DIMENSION_MM:
+        return None
+    return value
+
+
+def _recognize(task: _Task) -> Tuple[str, Optional[float]]:
+    """
+    切り出し画像を OCR して寸法値を読む（ワーカープロセスで実行）
+
+    回転の候補を順に試し、寸法値として読めた時点で返す。
+    """
+    import cv2
+    import pytesseract
+
+    tile, rotations = task
+    text = ""
+    for rotation in rotations:
+        image = tile if rotation is None else cv2.rotate(tile, rotation)
+        text = pytesseract.image_to_string(image, config=TESSERACT_CONFIG).strip()
+        value = parse_dimension_text(text)
+        if value is not None:
+            return text, value
+    return text, None
+
+
+@lru_cache(maxsize=1)
+def _check_tesseract() -> None:
+    """Tesseract 本体が利用できることを確認する（結果はキャッシュ）"""
+    import pytesseract
+
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError as e:
+        raise RuntimeError(
+            "Tesseract が見つかりません。tesseract-ocr をインストールしてください"
+        ) from e
+
+
+# OCR 用ワーカープロセス（初回利用時に起動し、以降は使い回す）
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+            # マルチスレッドのサーバーから fork しない（fork 時に保持されたロックでの停止を避ける）
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class LocalDimensionReader:
+    """図面の寸法線と寸法値をローカルで読み取る"""
+
+    def __init__(
+        self,
+        min_line_length: Optional[int] = None,
+        max_line_thickness: int = 3,
+        max_text_height: int = 80,
+        max_text_gap: int = 30,
+        detect_max_side: int = DETECT_MAX_SIDE,
+        parallel: bool = True,
+    ):
+        """
+        初期化
+
+        Args:
+            min_line_length: 寸法線とみなす線の最小長（px、省略時は画像の短辺の 1/40）
+            max_line_thickness: 寸法線とみなす線の最大太さ（px、壁などの太線を除く）
+            max_text_height: 寸法値の文字の最大高さ（px）
+            max_text_gap: 寸法線と寸法値の最大距離（px）
+            detect_max_side: 候補検出に使う画像の長辺の上限（px、超える図面は縮小して検出する）
+            parallel: ワーカープロセスで並列に OCR するか（False はプロセス内で順に処理）
+        """
+        self.min_line_length = min_line_length
+        self.max_line_thickness = max_line_thickness
+        self.max_text_height = max_text_height
+        self.max_text_gap = max_text_gap
+        self.detect_max_side = detect_max_side
+        self.parallel = parallel
+
+    def read_file(self, image_path: str) -> List[DimensionLine]:
+        """画像ファイルから寸法を読み取る"""
+        import cv2
+
+        gray = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"画像を読み込めません: {image_path}")
+        return self.read_image(gray)
+
+    def read_bytes(self, image_bytes: bytes) -> List[DimensionLine]:
+        """画像のバイトデータから寸法を読み取る"""
+        import cv2
+        import numpy as np
+
+        gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("画像を読み込めません")
+        return self.read_image(gray)
+
+    def read_image(self, gray: "np.ndarray") -> List[DimensionLine]:
+        """
+        グレースケール画像から寸法を読み取る
+
+        Returns:
+            List[DimensionLine]: 水平寸法（上から順）・垂直寸法（左から順）の順。
+                ラベルは方向ごとの通し番号（水平 "H1"…、垂直 "V1"…）
+        """
+        _check_tesseract()
+        with track_stage("dimension_detect"):
+            candidates = self.find_candidates(gray)
+        if not candidates:
+            return []
+
+        tasks = [self._task(gray, box, direction) for box, direction in candidates]
+        with track_stage("dimension_ocr"):
+            results = self._recognize_all(tasks)
+
+        lines: List[DimensionLine] = []
+        counters = {"horizontal": 0, "vertical": 0}
+        for (_, direction), (text, value) in zip(candidates, results):
+            if value is None:
+                continue
+            counters[direction] += 1
+            prefix = "H" if direction == "horizontal" else "V"
+            lines.append(DimensionLine(
+                label=f"{prefix}{counters[direction]}",
+                value_mm=value,
+                direction=direction,
+                raw_text=text,
+            ))
+        return lines
+
+    def find_candidates(self, gray: "np.ndarray") -> List[Tuple[_Box, str]]:
+        """
+        寸法値の候補領域を求める
+
+        大きな図面は長辺が detect_max_side 以下になるよう縮小した2値画像で検出し、
+        候補の矩形だけを元の解像度に戻す。
+
+        Returns:
+            List[Tuple[_Box, str]]: (文字列の塊の矩形（元画像の px）, 寸法の方向)。
+                水平寸法は上から、垂直寸法は左から順に並べる
+        """
+        import cv2
+
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        scale = min(1.0, self.detect_max_side / max(gray.shape[:2]))
+        if scale < 1.0:
+            # 細線が消えないよう、縮小後に少しでも線が掛かる画素を黒とする
+            binary = cv2.resize(binary, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            _, binary = cv2.threshold(binary, 0, 255, cv2.THRESH_BINARY)
+
+        min_length = self.min_line_length or max(40, min(gray.shape[:2]) // 40)
+        params = _DetectParams(
+            min_line_length=max(2, round(min_length * scale)),
+            max_line_thickness=max(1, math.ceil(self.max_line_thickness * scale)),
+            min_text_height=max(2, round(MIN_TEXT_HEIGHT * scale)),
+            max_text_height=max(2, round(self.max_text_height * scale)),
+            max_text_gap=max(1, round(self.max_text_gap * scale)),
+        )
+
+        h_mask, h_lines = self._lines(binary, params, horizontal=True)
+        v_mask, v_lines = self._lines(binary, params, horizontal=False)
+        # 線を除いた残りを文字とみなす
+        text_mask = cv2.bitwise_and(binary, cv2.bitwise_not(cv2.bitwise_or(h_mask, v_mask)))
+
+        found: List[Tuple[_Box, str]] = []
+        for horizontal, lines in ((True, h_lines), (False, v_lines)):
+            blobs = self._text_blobs(text_mask, params, horizontal)
+            boxes = [_unscale(box, scale) for box in self._match(lines, blobs, params, horizontal)]
+            if horizontal:
+                boxes.sort(key=lambda box: (box.y, box.x))
+            else:
+                boxes.sort(key=lambda box: (box.x, box.y))
+            found.extend((box, "horizontal" if horizontal else "vertical") for box in boxes)
+        return found
+
+    def _lines(
+        self, binary: "np.ndarray", params: _DetectParams, horizontal: bool
+    ) -> Tuple["np.ndarray", List[_Box]]:
+        """水平（または垂直）の細線のマスクと線分の矩形"""
+        import cv2
+
+        length = params.min_line_length
+        size = (length, 1) if horizontal else (1, length)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, size)
+        mask = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        lines = []
+        for x, y, w, h, _ in stats[1:].tolist():
+            if (h if horizontal else w) <= params.max_line_thickness:
+                lines.append(_Box(x, y, w, h))
+        return mask, lines
+
+    def _text_blobs(
+        self, text_mask: "np.ndarray", params: _DetectParams, horizontal: bool
+    ) -> List[_Box]:
+        """文字を文字列方向に繋げた塊の矩形（文字の高さで絞り込む）"""
+        import cv2
+
+        gap = max(2, params.max_text_height // 8)
+        size = (gap, 1) if horizontal else (1, gap)
+        merged = cv2.dilate(text_mask, cv2.getStructuringElement(cv2.MORPH_RECT, size))
+        _, _, stats, _ = cv2.connectedComponentsWithStats(merged, connectivity=8)
+        blobs = []
+        for x, y, w, h, _ in stats[1:].tolist():
+            # 文字列の向きに長く、文字の高さが妥当なものだけ
+            length, height = (w, h) if horizontal else (h, w)
+            if params.min_text_height <= height <= params.max_text_height and length >= height:
+                blobs.append(_Box(x, y, w, h))
+        return blobs
+
+    def _match(
+        self,
+        lines: Sequence[_Box],
+        blobs: Sequence[_Box],
+        params: _DetectParams,
+        horizontal: bool,
+    ) -> List[_Box]:
+        """
+        寸法線の近くにある文字列の塊を選ぶ
+
+        水平線は上下、垂直線は左右の max_text_gap 以内で、中心が線の範囲内にある塊を採る。
+        連続寸法（1本の線に複数の寸法値）にも対応するため、1本の線に複数の塊を許す。
+        """
+        # 線に直交する方向の座標で線を格子に分け、隣接する格子だけを調べる
+        cell = params.max_text_gap + params.max_text_height
+        grid: Dict[int, List[_Box]] = defaultdict(list)
+        for line in lines:
+            grid[int((line.cy if horizontal else line.cx) // cell)].append(line)
+
+        tolerance = params.max_line_thickness
+        matched: List[_Box] = []
+        for blob in blobs:
+            key = int((blob.cy if horizontal else blob.cx) // cell)
+            for line in grid[key - 1] + grid[key] + grid[key + 1]:
+                if horizontal:
+                    inside = line.x <= blob.cx <= line.x + line.w
+                    gap = max(blob.y - (line.y + line.h), line.y - (blob.y + blob.h))
+                else:
+                    inside = line.y <= blob.cy <= line.y + line.h
+                    gap = max(blob.x - (line.x + line.w), line.x - (blob.x + blob.w))
+                if inside and -tolerance <= gap <= params.max_text_gap:
+                    matched.append(blob)
+                    break
+        return matched
+
+    def _task(self, gray: "np.ndarray", box: _Box, direction: str) -> _Task:
+        """候補領域を切り出して OCR タスクにする"""
+        import cv2
+
+        height, width = gray.shape[:2]
+        x0, y0 = max(0, box.x - TILE_PADDING), max(0, box.y - TILE_PADDING)
+        x1 = min(width, box.x + box.w + TILE_PADDING)
+        y1 = min(height, box.y + box.h + TILE_PADDING)
+        tile = gray[y0:y1, x0:x1]
+
+        text_height = box.h if direction == "horizontal" else box.w
+        if text_height < OCR_TEXT_HEIGHT:
+            scale = OCR_TEXT_HEIGHT / max(1, text_height)
+            tile = cv2.resize(tile, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+        if direction == "horizontal":
+            rotations: Tuple[Optional[int], ...] = (None,)
+        else:
+            # 縦書きの寸法値は下から上へ読む向きが多いため、時計回りを先に試す
+            rotations = (cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        return tile, rotations
+
+    def _recognize_all(self, tasks: List[_Task]) -> List[Tuple[str, Optional[float]]]:
+        """OCR タスクをワーカープロセスで並列に処理する"""
+        if self.parallel and len(tasks) > 1:
+            try:
+                # 1件あたり数十ms以上かかるため、1件ずつ配る
+                return list(_get_pool().map(_recognize, tasks))
+            except (OSError, BrokenProcessPool) as e:
+                # ワーカーが落ちた・起動できない場合はプロセス内で処理する
+                logger.warning("OCR ワーカーを利用できません（プロセス内で処理します）: %s", e)
+                _reset_pool()
+        return [_recognize(task) for task in tasks]
@@ -0,0 +1,327 @@
+"""
+図面の類似判定サービス
+
+アップロード画像の知覚ハッシュ（pHash, 63bit）を BK-tree に登録し、
+ハミング距離による近傍検索で「同じ図面の再スキャン・再保存」を見つける。
+抽出結果を図面ごとに保持しておき、近似重複が見つかった場合は
+Gemini による再抽出の代わりに以前の結果を提示できるようにする。
+
+- 図面はアップロードしたテナント（X-Tenant-ID）ごとの BK-tree に登録し、
+  他のテナントの図面の抽出結果は返さない
+- 索引は変更ごとに1行の JSON を追記する（全体の書き直しは、不要になった行が
+  有効な行より多くなった場合の圧縮時のみ）。削除した図面は圧縮時に BK-tree からも除く。
+  呼び出し側はスレッドプールから呼ぶ
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from .extraction_scheduler import DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+# pHash のビット数（低周波 8x8 成分から直流成分を除いたもの）
+HASH_BITS = 63
+
+# 近似重複とみなす最大ハミング距離の既定値（類似度 約 0.9）
+DEFAULT_MAX_DISTANCE = 6
+
+# ハッシュ対象の画像拡張子
+HASHABLE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+# 追記した行数がこれを超え、かつ有効な行の2倍を超えたら索引を書き直す
+COMPACT_MIN_RECORDS = 1000
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """ハミング距離"""
+    return (a ^ b).bit_count()
+
+
+def compute_phash(image: Union[str, Path, bytes]) -> int:
+    """
+    画像の知覚ハッシュ（DCT ベースの pHash）を計算
+
+    グレースケール 32x32 に縮小して DCT を取り、直流成分を除いた低周波 8x8 成分を
+    中央値で2値化する（直流成分は画像全体の明るさで決まり、形の違いを表さないため）。
+
+    Args:
+        image: 画像ファイルのパスまたはバイトデータ
+
+    Returns:
+        int: 63bit のハッシュ値
+    """
+    import io
+
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    source = io.BytesIO(image) if isinstance(image, bytes) else str(image)
+    with Image.open(source) as img:
+        # JPEG は縮小デコードで読み込みを軽くする
+        img.draft("L", (128, 128))
+        gray = img.convert("L").resize((32, 32), Image.Resampling.LANCZOS)
+
+    pixels = np.asarray(gray, dtype=np.float32)
+    low = cv2.dct(pixels)[:8, :8].flatten()[1:]
+    median = np.median(low)
+    value = 0
+    for bit in low > median:
+        value = (value << 1) | int(bit)
+    return value
+
+
+class BKTree:
+    """ハミング距離の BK-tree"""
+
+    def __init__(self):
+        # ノード: [ハッシュ値, 登録アイテム, {距離: 子ノード}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def add(self, value: int, item: str) -> None:
+        """ハッシュ値とアイテムを登録"""
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        距離 max_distance 以内のアイテムを検索
+
+        Returns:
+            List[Tuple[int, str]]: (距離, アイテム) を距離順に並べたもの
+        """
+        if self._root is None:
+            return []
+        found: List[Tuple[int, str]] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                found.extend((distance, item) for item in node[1])
+            # 三角不等式により探索範囲を絞る
+            lo, hi = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in node[2].items() if lo <= d <= hi)
+        found.sort()
+        return found
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class DrawingSimilarityIndex:
+    """図面の知覚ハッシュと抽出結果の索引"""
+
+    def __init__(
+        self,
+        storage_path: Optional[Path] = None,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+    ):
+        """
+        初期化
+
+        Args:
+            storage_path: 索引の保存先（1行1レコードの JSON。省略時はメモリ上のみ）
+            max_distance: 近似重複とみなす最大ハミング距離
+        """
+        self.storage_path = storage_path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._trees: Dict[str, BKTree] = {}
+        self._hashes: Dict[str, int] = {}
+        self._tenants: Dict[str, str] = {}
+        self._results: Dict[str, Dict[str, dict]] = {}
+        self._records = 0  # 保存先の行数
+        self._load()
+
+    def _register(self, file_id: str, value: int, tenant: str) -> None:
+        self._hashes[file_id] = value
+        self._tenants[file_id] = tenant
+        self._trees.setdefault(tenant, BKTree()).add(value, file_id)
+
+    def _load(self) -> None:
+        if self.storage_path is None or not self.storage_path.exists():
+            return
+        try:
+            text = self.storage_path.read_text(encoding="utf-8")
+        except OSError as e:
+            logger.warning("類似判定索引の読み込みに失敗しました: %s", e)
+            return
+        for line in text.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 書き込み途中で終了した最後の行など
+                logger.warning("類似判定索引の壊れた行を読み飛ばしました")
+                continue
+            self._apply(record)
+            self._records += 1
+        if text and not text.endswith("\n"):
+            # 書き込み途中の行の後ろに追記しないよう書き直す
+            self._rewrite(self._live_records())
+        else:
+            self._rebuild_trees()
+
+    def _apply(self, record: dict) -> None:
+        """保存先の1行を反映する"""
+        op = record.get("op")
+        file_id = record.get("id")
+        if op == "add":
+            if file_id not in self._hashes:
+                tenant = record.get("tenant", DEFAULT_TENANT)
+                self._register(file_id, int(record["hash"], 16), tenant)
+        elif op == "result":
+            if file_id in self._hashes:
+                self._results.setdefault(file_id, {})[record["kind"]] = record["result"]
+        elif op == "remove":
+            self._hashes.pop(file_id, None)
+            self._tenants.pop(file_id, None)
+            self._results.pop(file_id, None)
+
+    def _rebuild_trees(self) -> None:
+        """削除済みの図面を除いてテナントごとの BK-tree を作り直す"""
+        trees: Dict[str, BKTree] = {}
+        for file_id, value in self._hashes.items():
+            trees.setdefault(self._tenants[file_id], BKTree()).add(value, file_id)
+        self._trees = trees
+
+    def _live_records(self) -> List[dict]:
+        records = [
+            {"op": "add", "id": file_id, "hash": f"{value:016x}", "tenant": self._tenants[file_id]}
+            for file_id, value in self._hashes.items()
+        ]
+        records.extend(
+            {"op": "result", "id": file_id, "kind": kind, "result": result}
+            for file_id, results in self._results.items()
+            for kind, result in results.items()
+        )
+        return records
+
+    def _append(self, record: dict) -> None:
+        """変更を1行追記する（不要な行が増えたら書き直す）"""
+        if self.storage_path is None:
+            return
+        with self.storage_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._records += 1
+        if self._records > COMPACT_MIN_RECORDS:
+            live = self._live_records()
+            if self._records > 2 * len(live):
+                self._rewrite(live)
+
+    def _rewrite(self, records: List[dict]) -> None:
+        tmp = self.storage_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.storage_path)
+        self._records = len(records)
+        self._rebuild_trees()
+
+    def add(self, file_id: str, value: int, tenant: str = DEFAULT_TENANT) -> None:
+        """図面のハッシュを登録"""
+        with self._lock:
+            if file_id in self._hashes:
+                return
+            self._register(file_id, value, tenant)
+            self._append({"op": "add", "id": file_id, "hash": f"{value:016x}", "tenant": tenant})
+
+    def add_file(
+        self, file_id: str, path: Path, tenant: str = DEFAULT_TENANT
+    ) -> Optional[int]:
+        """画像ファイルのハッシュを計算して登録（登録済みなら再計算しない。画像以外・失敗時は None）"""
+        if file_id in self._hashes:
+            return self._hashes[file_id]
+        if path.suffix.lower() not in HASHABLE_EXTENSIONS:
+            return None
+        try:
+            value = compute_phash(path)
+        except Exception as e:
+            logger.warning("知覚ハッシュの計算に失敗しました (%s): %s", file_id, e)
+            return None
+        self.add(file_id, value, tenant)
+        return value
+
+    def remove(self, file_id: str) -> None:
+        """図面を索引から外す（BK-tree のノードは索引の圧縮まで残し、検索時に除外する）"""
+        with self._lock:
+            if file_id not in self._hashes:
+                return
+            self._hashes.pop(file_id)
+            self._tenants.pop(file_id)
+            self._results.pop(file_id, None)
+            self._append({"op": "remove", "id": file_id})
+
+    def store_result(self, file_id: str, kind: str, result: dict) -> None:
+        """
+        抽出結果を保存
+
+        Args:
+            file_id: 図面ID
+            kind: 抽出種別（"outline" / "roof" など）
+            result: 抽出結果（model_dump() した dict）
+        """
+        with self._lock:
+            if file_id not in self._hashes:
+                return
+            self._results.setdefault(file_id, {})[kind] = result
+            self._append({"op": "result", "id": file_id, "kind": kind, "result": result})
+
+    def find_reusable(self, file_id: str, kind: str) -> Optional[Tuple[str, float, dict]]:
+        """
+        同じテナントの近似重複の図面から再利用できる抽出結果を探す
+
+        Args:
+            file_id: 抽出対象の図面ID
+            kind: 抽出種別
+
+        Returns:
+            Optional[Tuple[str, float, dict]]: (元の図面ID, 類似度, 抽出結果)。無ければ None
+        """
+        with self._lock:
+            value = self._hashes.get(file_id)
+            if value is None:
+                return None
+            tenant = self._tenants[file_id]
+            for distance, candidate in self._trees[tenant].search(value, self.max_distance):
+                # 削除済みの図面、または削除後に同じIDで別のテナントが登録した図面は除く
+                if self._tenants.get(candidate) != tenant:
+                    continue
+                result = self._results.get(candidate, {}).get(kind)
+                if result is not None:
+                    return candidate, 1.0 - distance / HASH_BITS, result
+        return None
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+# シングルトンインスタンス（遅延初期化）
+_index: Optional[DrawingSimilarityIndex] = None
+
+
+def get_similarity_index(upload_dir: Path = Path("uploads")) -> DrawingSimilarityIndex:
+    """図面類似判定索引のシングルトンインスタンスを取得"""
+    global _index
+    if _index is None:
+        max_distance = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", DEFAULT_MAX_DISTANCE))
+        _index = DrawingSimilarityIndex(upload_dir / ".drawing_hashes.json", max_distance)
+    return _index
@@ -0,0 +1,265 @@
+"""
+図面抽出処理のスケジューラ
+
+抽出処理（Gemini・ローカル OCR）の同時実行数を制限し、待ち行列から次に実行する要求を選ぶ。
+
+- 優先度クラス: 対話的な単一図面の抽出（interactive）を一括再解析（batch）より優先する。
+  ただし batch が枯渇しないよう、両方が待っている間は interactive
+  INTERACTIVE_SHARE 件ごとに batch を1件実行する
+- テナント間の公平性: クラスごとにテナント（顧客・プロジェクト）単位の重み付き公平キューイング
+  （仮想終了時刻の小さい順に実行する終了時刻タグ方式の WFQ）を行い、
+  大量に投入したテナントが他を待たせ続けないようにする
+- 期限: 待ち時間の上限を過ぎた要求と、クライアントが切断した要求は実行せずに破棄する。
+  破棄した要求の分はテナントの仮想終了時刻から差し引き、後続の要求を不利にしない
+- 待ち時間・待ち件数・破棄件数をメトリクスに記録する
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from app.core.metrics import SCHEDULER_QUEUED, SCHEDULER_WAIT
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH)
+
+DEFAULT_TENANT = "default"
+
+# 同時に実行する抽出処理の数の既定値
+DEFAULT_CONCURRENCY = 4
+
+# 両クラスが待っている間、batch 1件に対して実行する interactive の件数
+INTERACTIVE_SHARE = 4
+
+# クラスごとの待ち時間の上限の既定値（秒）
+DEFAULT_MAX_WAIT = {INTERACTIVE: 30.0, BATCH: 600.0}
+
+# クライアントの切断を確認する間隔（秒）
+ABANDON_POLL_INTERVAL = 1.0
+
+
+class ExtractionRejected(RuntimeError):
+    """待ち時間の上限超過・クライアント切断により実行されなかった"""
+
+
+@dataclass(order=True)
+class _Waiter:
+    """待ち行列の要求（仮想終了時刻の順に並べる）"""
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    tenant: str = field(compare=False)
+    priority: str = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+
+
+@dataclass
+class _ClassQueue:
+    """優先度クラスごとの WFQ の状態"""
+    heap: List[_Waiter] = field(default_factory=list)
+    virtual_time: float = 0.0
+    last_finish: Dict[str, float] = field(default_factory=dict)  # テナント → 最後の仮想終了時刻
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """"tenant=2,other=0.5" 形式のテナントの重みを読む（不正な項目は無視する）"""
+    weights: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if name.strip() and weight > 0:
+            weights[name.strip()] = weight
+    return weights
+
+
+class ExtractionScheduler:
+    """抽出処理の優先度付き・テナント間公平スケジューラ"""
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        interactive_share: int = INTERACTIVE_SHARE,
+    ):
+        """
+        初期化
+
+        Args:
+            concurrency: 同時に実行する抽出処理の数
+            tenant_weights: テナントごとの重み（省略したテナントは 1.0）
+            interactive_share: 両クラスが待っている間、batch 1件に対して実行する interactive の件数
+        """
+        self.concurrency = max(1, concurrency)
+        self.tenant_weights = tenant_weights or {}
+        self.interactive_share = max(1, interactive_share)
+        self._queues = {priority: _ClassQueue() for priority in PRIORITY_CLASSES}
+        self._active = 0
+        self._interactive_streak = 0
+        self._seq = itertools.count()
+
+    @property
+    def active(self) -> int:
+        """実行中の件数"""
+        return self._active
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        """待ち件数"""
+        queues = [self._queues[priority]] if priority else self._queues.values()
+        return sum(not w.future.done() for q in queues for w in q.heap)
+
+    def _enqueue(self, tenant: str, priority: str, cost: float) -> _Waiter:
+        queue = self._queues[priority]
+        start = max(queue.virtual_time, queue.last_finish.get(tenant, 0.0))
+        finish = start + cost / self.tenant_weights.get(tenant, 1.0)
+        queue.last_finish[tenant] = finish
+        waiter = _Waiter(
+            finish=finish,
+            seq=next(self._seq),
+            start=start,
+            tenant=tenant,
+            priority=priority,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(queue.heap, waiter)
+        SCHEDULER_QUEUED.labels(priority).inc()
+        return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        """実行前の要求を取り下げ、同じテナントの後続の要求と仮想終了時刻をその分だけ戻す"""
+        waiter.future.cancel()
+        SCHEDULER_QUEUED.labels(waiter.priority).dec()
+        queue = self._queues[waiter.priority]
+        # 仮想時刻に追い越された部分は他の要求の順番に影響しないため戻さない
+        length = waiter.finish - max(waiter.start, queue.virtual_time)
+        if length <= 0:
+            return
+        last_finish = queue.last_finish.get(waiter.tenant)
+        if last_finish is not None:
+            queue.last_finish[waiter.tenant] = last_finish - length
+        shifted = False
+        for other in queue.heap:
+            if other.tenant == waiter.tenant and other.seq > waiter.seq:
+                other.start -= length
+                other.finish -= length
+                shifted = True
+        if shifted:
+            heapq.heapify(queue.heap)
+
+    def _next_class(self) -> Optional[str]:
+        """次に実行するクラス（待ちが無ければ None）"""
+        interactive = bool(self._queues[INTERACTIVE].heap)
+        batch = bool(self._queues[BATCH].heap)
+        if interactive and (not batch or self._interactive_streak < self.interactive_share):
+            return INTERACTIVE
+        if batch:
+            return BATCH
+        return None
+
+    def _dispatch(self) -> None:
+        """空いている実行枠に待ち行列の先頭を割り当てる"""
+        while self._active < self.concurrency:
+            priority = self._next_class()
+            if priority is None:
+                return
+            queue = self._queues[priority]
+            waiter = heapq.heappop(queue.heap)
+            if waiter.future.done():
+                # 待ち側で破棄済み
+                continue
+            SCHEDULER_QUEUED.labels(priority).dec()
+            queue.virtual_time = max(queue.virtual_time, waiter.start)
+            # 仮想時刻に追い越されたテナントは、次に投入した時点から数え直せばよい
+            for tenant in [t for t, f in queue.last_finish.items() if f <= queue.virtual_time]:
+                del queue.last_finish[tenant]
+            self._interactive_streak = (
+                self._interactive_streak + 1 if priority == INTERACTIVE else 0
+            )
+            self._active += 1
+            waiter.future.set_result(None)
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = INTERACTIVE,
+        max_wait: Optional[float] = None,
+        abandoned: Optional[Callable[[], Awaitable[bool]]] = None,
+        cost: float = 1.0,
+    ) -> AsyncIterator[None]:
+        """
+        実行枠を取得し、ブロックを抜けるまで保持する
+
+        Args:
+            tenant: テナント（顧客・プロジェクト）の識別子
+            priority: 優先度クラス（interactive / batch）
+            max_wait: 待ち時間の上限（秒、省略時はクラスの既定値）
+            abandoned: クライアントが切断したかを返す関数（待っている間、定期的に確認する）
+            cost: 要求の重さ（同じテナントの要求は cost / 重み ずつ後ろに並ぶ）
+
+        Raises:
+            ExtractionRejected: 待ち時間の上限を超えた、またはクライアントが切断した
+        """
+        if priority not in self._queues:
+            raise ValueError(f"不明な優先度です: {priority}")
+        if cost <= 0:
+            raise ValueError("cost は正の値である必要があります")
+        loop = asyncio.get_running_loop()
+        enqueued = loop.time()
+        deadline = enqueued + (DEFAULT_MAX_WAIT[priority] if max_wait is None else max_wait)
+
+        waiter = self._enqueue(tenant, priority, cost)
+        self._dispatch()
+        outcome = "granted"
+        try:
+            while not waiter.future.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    outcome = "deadline"
+                    raise ExtractionRejected("混雑のため待ち時間の上限を超えました")
+                timeout = min(remaining, ABANDON_POLL_INTERVAL) if abandoned else remaining
+                await asyncio.wait({waiter.future}, timeout=timeout)
+                if not waiter.future.done() and abandoned is not None and await abandoned():
+                    outcome = "abandoned"
+                    raise ExtractionRejected("クライアントが切断しました")
+        except BaseException:
+            if outcome == "granted":
+                outcome = "cancelled"
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 枠の割り当てと同時に中断された場合は枠を返す
+                self._release()
+            else:
+                self._withdraw(waiter)
+            raise
+        finally:
+            SCHEDULER_WAIT.labels(priority, outcome).observe(loop.time() - enqueued)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+
+# シングルトンインスタンス（遅延初期化）
+_scheduler: Optional[ExtractionScheduler] = None
+
+
+def get_extraction_scheduler() -> ExtractionScheduler:
+    """抽出スケジューラのシングルトンインスタンスを取得"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ExtractionScheduler(
+            concurrency=int(os.getenv("EXTRACTION_CONCURRENCY", DEFAULT_CONCURRENCY)),
+            tenant_weights=parse_weights(os.getenv("EXTRACTION_TENANT_WEIGHTS", "")),
+        )
+    return _scheduler
@@ -4,28 +4,15 @@ BudgetCap プロキシ経由で Gemini を使用した建築図面外周座標
 import os
 import json
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional
 
-from pydantic import BaseModel
+from app.core.metrics import track_stage
+# 応答モデルはスキーマに定義（ここからも import できるよう再公開する）
+from app.schemas.drawing import CoordinatePoint, DimensionLine, OutlineExtractionResult
 
 from .budgetcap_client import BudgetCapGeminiClient
 
 
-class CoordinatePoint(BaseModel):
-    """座標点"""
-    point: str
-    x: float
-    y: float
-
-
-class DimensionLine(BaseModel):
-    """寸法線"""
-    label: str  # 寸法線のラベル（例: "X1-X2", "Y1-Y2"）
-    value_mm: float  # 読み取った寸法値 (mm)
-    direction: str  # "horizontal" or "vertical"
-    raw_text: str  # 図面上に記載されたテキスト
-
-
 # Floor colors (mirroring frontend)
 FLOOR_COLORS = {
     1: '#22c55e',  # Green - 1F
@@ -35,15 +22,6 @@ FLOOR_COLORS = {
     5: '#8b5cf6',  # Purple - 5F
 }
 
-class OutlineExtractionResult(BaseModel):
-    """建物の外周座標抽出結果"""
-    width_mm: float
-    height_mm: float
-    dimensions: List[DimensionLine]
-    coordinates: List[CoordinatePoint]
-    floor: Optional[int] = None
-    color: Optional[str] = None
-
 
 class GeminiOutlineExtractor:
     """BudgetCap経由でGeminiを使用した図面解析クラス"""
@@ -87,24 +65,26 @@ class GeminiOutlineExtractor:
         """
         ローカル画像ファイルから建物外周座標を抽出
         """
-        response_text = self.client.generate_content_from_file(
-            model=self.MODEL,
-            prompt=self._build_prompt(),
-            image_path=image_path
-        )
-        return self._parse_response(response_text, floor)
+        with track_stage("extract_outline", self.MODEL):
+            response_text = self.client.generate_content_from_file(
+                model=self.MODEL,
+                prompt=self._build_prompt(),
+                image_path=image_path
+            )
+            return self._parse_response(response_text, floor)
 
     def extract_outline_from_bytes(self, image_bytes: bytes, mime_type: str = "image/jpeg", floor: Optional[int] = None) -> OutlineExtractionResult:
         """
         バイトデータから建物外周座標を抽出
         """
-        response_text = self.client.generate_content(
-            model=self.MODEL,
-            prompt=self._build_prompt(),
-            image_data=image_bytes,
-            mime_type=mime_type
-        )
-        return self._parse_response(response_text, floor)
+        with track_stage("extract_outline", self.MODEL):
+            response_text = self.client.generate_content(
+                model=self.MODEL,
+                prompt=self._build_prompt(),
+                image_data=image_bytes,
+                mime_type=mime_type
+            )
+            return self._parse_response(response_text, floor)
 
     def _calculate_coordinates(self, width: float, height: float) -> list[CoordinatePoint]:
         """
@@ -139,30 +119,31 @@ class GeminiOutlineExtractor:
             # 失敗時はログに出してエラー
             raise ValueError(f"JSONのパースに失敗しました: {e}\nレスポンス: {response_text}")
 
-        width_mm = float(data.get("width_mm", 0))
-        height_mm = float(data.get("height_mm", 0))
-
-        # Python側で座標計算
-        coordinates = self._calculate_coordinates(width_mm, height_mm)
-
-        dimensions = [
-            DimensionLine(**dim)
-            for dim in data.get("dimensions", [])
-        ]
-
-        # Color logic
-        color = None
-        if floor and floor in FLOOR_COLORS:
-            color = FLOOR_COLORS[floor]
-
-        return OutlineExtractionResult(
-            dimensions=dimensions,
-            coordinates=coordinates,
-            width_mm=width_mm,
-            height_mm=height_mm,
-            floor=floor,
-            color=color
-        )
+        with track_stage("response_validation", self.MODEL):
+            width_mm = float(data.get("width_mm", 0))
+            height_mm = float(data.get("height_mm", 0))
+
+            # Python側で座標計算
+            coordinates = self._calculate_coordinates(width_mm, height_mm)
+
+            dimensions = [
+                DimensionLine(**dim)
+                for dim in data.get("dimensions", [])
+            ]
+
+            # Color logic
+            color = None
+            if floor and floor in FLOOR_COLORS:
+                color = FLOOR_COLORS[floor]
+
+            return OutlineExtractionResult(
+                dimensions=dimensions,
+                coordinates=coordinates,
+                width_mm=width_mm,
+                height_mm=height_mm,
+                floor=floor,
+                color=color
+            )
 
 
 # CLI用のメイン関数
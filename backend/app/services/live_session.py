@@ -0,0 +1,172 @@
+"""
+足場のライブ再計算セッション
+
+WebSocket 接続ごとに1つ保持し、次の2つを受け持つ。
+
+- 編集の集約: 計算中に届いた編集は最新の1件だけを残し、途中の版は計算せずに破棄する
+- 差分の生成: クライアントが最後に受信確認（ack）した版を基準に、
+  部材の追加・削除と数量の変化だけを返す
+
+部材IDは種別・面・長さ・端点座標から決まるため、同じ位置の部材は版をまたいで同じIDになる。
+"""
+import asyncio
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.metrics import LIVE_EDITS
+from app.schemas.scaffold import LiveDeltaMessage, LiveMemberSchema, Point3DSchema, QuantityRow
+from scaffold_logic import ScaffoldMember
+
+from .scaffold_service import ScaffoldCalculation
+
+# ack 待ちで保持する送信済みスナップショットの件数
+DEFAULT_HISTORY = 8
+
+QuantityKey = Tuple[str, float, str]
+
+
+@dataclass
+class _Snapshot:
+    """送信済みの版の状態"""
+    members: Dict[str, ScaffoldMember]  # 部材ID → 部材
+    quantities: Dict[QuantityKey, int]  # (部材種別, 長さ, 面) → 数量
+
+
+def member_ids(members: List[ScaffoldMember]) -> List[str]:
+    """部材の安定ID（同じ位置に重なる部材は出現順の連番で区別する）"""
+    seen: Counter = Counter()
+    ids = []
+    for m in members:
+        s, e = m.position_start, m.position_end
+        base = (
+            f"{m.member_type.name}:{m.face.name}:{m.length:g}:"
+            f"{s.x:.1f},{s.y:.1f},{s.z:.1f}:{e.x:.1f},{e.y:.1f},{e.z:.1f}"
+        )
+        seen[base] += 1
+        ids.append(base if seen[base] == 1 else f"{base}#{seen[base]}")
+    return ids
+
+
+def _to_member_schema(member_id: str, m: ScaffoldMember) -> LiveMemberSchema:
+    s, e = m.position_start, m.position_end
+    return LiveMemberSchema(
+        id=member_id,
+        member_type=m.member_type.value,
+        length=m.length,
+        face=m.face.value,
+        position_start=Point3DSchema(x=s.x, y=s.y, z=s.z),
+        position_end=Point3DSchema(x=e.x, y=e.y, z=e.z),
+    )
+
+
+class LiveLayoutSession:
+    """WebSocket 接続ごとのライブ再計算セッション"""
+
+    def __init__(self, history: int = DEFAULT_HISTORY):
+        """
+        初期化
+
+        Args:
+            history: ack 待ちで保持する送信済みの版の数（超えた古い版は基準にできない）
+        """
+        self.history = history
+        self._pending: Optional[Tuple[int, Any]] = None
+        self._ready = asyncio.Event()
+        self._latest_version: Optional[int] = None
+        self._sent: "OrderedDict[int, _Snapshot]" = OrderedDict()
+        self._base_version: Optional[int] = None
+        self._base: Optional[_Snapshot] = None
+
+    def submit(self, version: int, payload: Any) -> bool:
+        """
+        編集を受け付ける（未計算の編集は置き換える）
+
+        Args:
+            version: クライアントが付けた版（単調増加）
+            payload: 足場計算リクエスト（未検証の JSON）
+
+        Returns:
+            bool: 受け付けた場合 True（受信済みより古い版は破棄して False）
+        """
+        if self._latest_version is not None and version <= self._latest_version:
+            LIVE_EDITS.labels("stale").inc()
+            return False
+        self._latest_version = version
+        if self._pending is not None:
+            LIVE_EDITS.labels("superseded").inc()
+        self._pending = (version, payload)
+        self._ready.set()
+        return True
+
+    async def next_edit(self) -> Tuple[int, Any]:
+        """次に計算すべき最新の編集を待って取り出す"""
+        while self._pending is None:
+            self._ready.clear()
+            await self._ready.wait()
+        edit, self._pending = self._pending, None
+        LIVE_EDITS.labels("solved").inc()
+        return edit
+
+    def ack(self, version: int) -> bool:
+        """
+        クライアントが版を適用したことを記録し、以降の差分の基準にする
+
+        Returns:
+            bool: 基準を更新した場合 True（保持していない版なら False）
+        """
+        snapshot = self._sent.get(version)
+        if snapshot is None:
+            return False
+        self._base_version, self._base = version, snapshot
+        for sent_version in list(self._sent):
+            if sent_version <= version:
+                del self._sent[sent_version]
+        return True
+
+    def delta(self, version: int, calculation: ScaffoldCalculation) -> LiveDeltaMessage:
+        """
+        計算結果を基準版との差分に変換し、送信済みとして記録する
+
+        Args:
+            version: 計算した編集の版
+            calculation: 足場計算の結果
+
+        Returns:
+            LiveDeltaMessage: 部材の追加・削除と数量の変化
+        """
+        members = calculation.result.members
+        snapshot = _Snapshot(
+            members=dict(zip(member_ids(members), members)),
+            quantities=calculation.result.get_quantity_by_type_and_face(),
+        )
+        base = self._base or _Snapshot(members={}, quantities={})
+
+        added = [
+            _to_member_schema(member_id, m)
+            for member_id, m in snapshot.members.items()
+            if member_id not in base.members
+        ]
+        removed = [member_id for member_id in base.members if member_id not in snapshot.members]
+        changed = {
+            key: snapshot.quantities.get(key, 0)
+            for key in snapshot.quantities.keys() | base.quantities.keys()
+            if snapshot.quantities.get(key, 0) != base.quantities.get(key, 0)
+        }
+
+        self._sent[version] = snapshot
+        while len(self._sent) > self.history:
+            self._sent.popitem(last=False)
+
+        return LiveDeltaMessage(
+            version=version,
+            base_version=self._base_version,
+            result_key=calculation.key,
+            cached=calculation.cached,
+            added=added,
+            removed=removed,
+            quantities=[
+                QuantityRow(member_type=member_type, length=length, face=face, count=count)
+                for (member_type, length, face), count in sorted(changed.items())
+            ],
+        )
@@ -0,0 +1,100 @@
+"""
+数量表エクスポートサービス
+
+部材種別×長さ×面の数量表を CSV / Excel 形式で書き出す。
+CSV は一定サイズごとのチャンクで逐次生成し、
+Excel は xlsxwriter の constant_memory モードで行単位に書き出す。
+"""
+import csv
+import io
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple, Union
+
+# 数量表の列見出し
+HEADER = ["建物", "部材種別", "長さ(mm)", "面", "数量"]
+
+# CSV チャンクを送出するバッファサイズ（文字数）
+CSV_CHUNK_SIZE = 64 * 1024
+
+# (建物ラベル, 部材種別, 長さ, 面, 数量)
+QuantityExportRow = Tuple[str, str, Union[int, float], str, int]
+
+
+def _format_length(length: float) -> Union[int, float]:
+    """整数の長さは小数点なしで出力する"""
+    return int(length) if float(length).is_integer() else length
+
+
+def iter_quantity_rows(summaries: Iterable[Tuple[str, dict]]) -> Iterator[QuantityExportRow]:
+    """
+    建物ごとの数量集計を数量表の行に展開する
+
+    Args:
+        summaries: (建物ラベル, get_scaffold_summary の結果) の列。遅延評価でよい
+
+    Yields:
+        QuantityExportRow: 数量表の1行
+    """
+    for label, summary in summaries:
+        for (member_type, length, face), count in sorted(summary.items()):
+            yield (label, member_type, _format_length(length), face, count)
+
+
+def iter_csv_chunks(
+    rows: Iterable[QuantityExportRow], chunk_size: int = CSV_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    数量表を CSV のチャンク列として生成する
+
+    見出し行は最初のチャンクとして即座に送出し、以降は chunk_size ごとに送出する。
+    Excel で文字化けしないよう UTF-8 BOM を付与する。
+
+    Args:
+        rows: 数量表の行
+        chunk_size: チャンクの目安サイズ（文字数）
+
+    Yields:
+        bytes: CSV のチャンク
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+
+    buffer.write("\ufeff")
+    writer.writerow(HEADER)
+    yield buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_xlsx(
+    rows: Iterable[QuantityExportRow], path: Union[str, Path], sheet_name: str = "数量表"
+) -> None:
+    """
+    数量表を Excel ファイルに書き出す（constant_memory モード）
+
+    Args:
+        rows: 数量表の行
+        path: 出力先ファイルパス
+        sheet_name: シート名
+    """
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({"bold": True})
+        worksheet.write_row(0, 0, HEADER, header_format)
+        for i, row in enumerate(rows, start=1):
+            worksheet.write_row(i, 0, row)
+    finally:
+        workbook.close()
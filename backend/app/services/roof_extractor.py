@@ -5,31 +5,15 @@ BudgetCap プロキシ経由で Gemini を使用した立面図からの屋根
 import os
 import json
 from pathlib import Path
-from typing import Optional, List, Literal
+from typing import Optional
 
-from pydantic import BaseModel
+from app.core.metrics import track_stage
+# 応答モデルはスキーマに定義（ここからも import できるよう再公開する）
+from app.schemas.drawing import RoofConfig, RoofExtractionResult
 
 from .budgetcap_client import BudgetCapGeminiClient
 
 
-class RoofConfig(BaseModel):
-    """屋根設定"""
-    eaveOverhang: float = 0  # 軒出 (mm)
-    gableOverhang: float = 0  # ケラバ出幅 (mm)
-    slopeRatio: Optional[str] = None  # 勾配（例: "4/10"）
-    slopeAngle: Optional[float] = None  # 傾斜角度（度）
-    roofType: Literal["flat", "gable", "hip", "shed"] = "flat"  # 屋根形状
-    ridgeHeight: Optional[float] = None  # 棟高さ (mm)
-    rawTexts: List[str] = []  # 図面から読み取った元テキスト
-
-
-class RoofExtractionResult(BaseModel):
-    """屋根情報抽出結果"""
-    success: bool
-    config: Optional[RoofConfig] = None
-    error: Optional[str] = None
-
-
 class GeminiRoofExtractor:
     """BudgetCap経由でGeminiを使用した立面図からの屋根情報抽出クラス"""
 
@@ -90,12 +74,13 @@ class GeminiRoofExtractor:
             )
 
         try:
-            response_text = self.client.generate_content_from_file(
-                model=self.MODEL,
-                prompt=self._build_prompt(),
-                image_path=image_path
-            )
-            config = self._parse_response(response_text)
+            with track_stage("extract_roof", self.MODEL):
+                response_text = self.client.generate_content_from_file(
+                    model=self.MODEL,
+                    prompt=self._build_prompt(),
+                    image_path=image_path
+                )
+                config = self._parse_response(response_text)
             return RoofExtractionResult(success=True, config=config)
         except Exception as e:
             return RoofExtractionResult(success=False, error=str(e))
@@ -105,13 +90,14 @@ class GeminiRoofExtractor:
         バイトデータから屋根情報を抽出
         """
         try:
-            response_text = self.client.generate_content(
-                model=self.MODEL,
-                prompt=self._build_prompt(),
-                image_data=image_bytes,
-                mime_type=mime_type
-            )
-            config = self._parse_response(response_text)
+            with track_stage("extract_roof", self.MODEL):
+                response_text = self.client.generate_content(
+                    model=self.MODEL,
+                    prompt=self._build_prompt(),
+                    image_data=image_bytes,
+                    mime_type=mime_type
+                )
+                config = self._parse_response(response_text)
             return RoofExtractionResult(success=True, config=config)
         except Exception as e:
             return RoofExtractionResult(success=False, error=str(e))
@@ -142,15 +128,16 @@ class GeminiRoofExtractor:
         if slope_angle is None and slope_ratio:
             slope_angle = self._calculate_slope_angle(slope_ratio)
 
-        return RoofConfig(
-            eaveOverhang=data.get("eaveOverhang") or 0,
-            gableOverhang=data.get("gableOverhang") or 0,
-            slopeRatio=slope_ratio,
-            slopeAngle=slope_angle,
-            roofType=data.get("roofType", "flat"),
-            ridgeHeight=data.get("ridgeHeight"),
-            rawTexts=data.get("rawTexts", [])
-        )
+        with track_stage("response_validation", self.MODEL):
+            return RoofConfig(
+                eaveOverhang=data.get("eaveOverhang") or 0,
+                gableOverhang=data.get("gableOverhang") or 0,
+                slopeRatio=slope_ratio,
+                slopeAngle=slope_angle,
+                roofType=data.get("roofType", "flat"),
+                ridgeHeight=data.get("ridgeHeight"),
+                rawTexts=data.get("rawTexts", [])
+            )
 
     def _calculate_slope_angle(self, slope_ratio: str) -> Optional[float]:
         """
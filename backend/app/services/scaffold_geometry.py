@@ -0,0 +1,367 @@
+"""
+足場の3Dワイヤーフレーム形状バッファ生成サービス
+
+ScaffoldResult から glTF 2.0 バイナリ（GLB）互換の頂点・インデックスバッファを生成する。
+頂点は float32、インデックスは uint32 の連続バッファとし、部材種別ごとに1メッシュにまとめる
+（クライアントは種別ごとに1回の描画呼び出しで描画できる）。
+
+詳細度（LOD）:
+- full: 全部材を線分で表現
+- faces: 足場ラインの連続区間（ラン）ごとに部材をまとめた外接箱
+- outline: ランごとの足場ライン（地上と最上部）のみ
+
+バッファは正規化座標系で生成してキャッシュし、呼び出し元座標系への平行移動は
+ルートノードの translation で表す。
+"""
+import json
+import math
+import struct
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from scaffold_logic import FaceDirection, ScaffoldMember, ScaffoldResult
+
+LOD_LEVELS = ("full", "faces", "outline")
+
+# glTF 定数
+_GLB_MAGIC = 0x46546C67  # "glTF"
+_GLB_VERSION = 2
+_CHUNK_JSON = 0x4E4F534A  # "JSON"
+_CHUNK_BIN = 0x004E4942  # "BIN\0"
+_COMPONENT_FLOAT = 5126
+_COMPONENT_UINT32 = 5125
+_TARGET_ARRAY_BUFFER = 34962
+_TARGET_ELEMENT_ARRAY_BUFFER = 34963
+_MODE_LINES = 1
+
+# mm → m
+_SCALE = 0.001
+
+# 同じ足場ライン上の部材を1つのランとみなす隙間の上限（mm）
+_RUN_GAP = 1.0
+
+# 形状キャッシュ件数の既定値
+DEFAULT_GEOMETRY_CACHE_SIZE = 64
+
+Vertex = Tuple[float, float, float]
+
+# 外接箱の12辺（頂点番号は x*4 + y*2 + z で min/max を 0/1 とする）
+_BOX_EDGES = (
+    0, 1, 1, 3, 3, 2, 2, 0,
+    4, 5, 5, 7, 7, 6, 6, 4,
+    0, 4, 1, 5, 2, 6, 3, 7,
+)
+
+
+@dataclass
+class GeometryPrimitive:
+    """線分プリミティブ（glTF 座標系、m 単位）"""
+    name: str
+    positions: array  # float32, xyz の連続配列
+    indices: array  # uint32, 線分の頂点インデックス
+    extras: dict
+
+
+@dataclass(frozen=True)
+class GeometryBuffers:
+    """GLB 組み立て前の形状バッファ（ルートノード以外）"""
+    meshes: list
+    accessors: list
+    buffer_views: list
+    binary: bytes
+
+
+def _to_gltf(x: float, y: float, z: float) -> Vertex:
+    """mm・Z上 の座標を m・Y上 の glTF 座標に変換"""
+    return (x * _SCALE, z * _SCALE, -y * _SCALE)
+
+
+class _PrimitiveBuilder:
+    """頂点を重複排除しながら線分を蓄積する"""
+
+    def __init__(self):
+        self.positions = array("f")
+        self.indices = array("I")
+        self._lookup: Dict[Vertex, int] = {}
+
+    def vertex(self, v: Vertex) -> int:
+        key = (round(v[0], 6), round(v[1], 6), round(v[2], 6))
+        index = self._lookup.get(key)
+        if index is None:
+            index = len(self._lookup)
+            self._lookup[key] = index
+            self.positions.extend(key)
+        return index
+
+    def line(self, a: Vertex, b: Vertex) -> None:
+        self.indices.append(self.vertex(a))
+        self.indices.append(self.vertex(b))
+
+    def box(self, lo: Vertex, hi: Vertex) -> None:
+        base = [
+            self.vertex((x, y, z))
+            for x in (lo[0], hi[0])
+            for y in (lo[1], hi[1])
+            for z in (lo[2], hi[2])
+        ]
+        self.indices.extend(base[i] for i in _BOX_EDGES)
+
+
+def _run_extents(result: ScaffoldResult) -> List[Tuple[FaceDirection, Vertex, Vertex]]:
+    """
+    足場ラインの連続区間（ラン）ごとの部材の外接箱（mm・Z上）
+
+    部材は足場ライン上にあるため、面と足場ラインの位置（南北面は y、東西面は x）が同じで
+    軸方向に途切れずつながる部材を1つのランとする。L字・セットバック・中庭のように
+    同じ面方向に複数の足場ラインがある外周でも、ランごとに別の箱になる。
+    """
+    # (面, 足場ラインの位置) → [(軸方向の始点, 終点, 部材)]
+    lines: Dict[Tuple[FaceDirection, float], List[Tuple[float, float, ScaffoldMember]]] = {}
+    for m in result.members:
+        s, e = m.position_start, m.position_end
+        along_x = m.face in (FaceDirection.SOUTH, FaceDirection.NORTH)
+        a, b = (s.x, e.x) if along_x else (s.y, e.y)
+        across = round(s.y if along_x else s.x, 3)
+        lines.setdefault((m.face, across), []).append((min(a, b), max(a, b), m))
+
+    runs: List[Tuple[FaceDirection, Vertex, Vertex]] = []
+    for (face, _), items in lines.items():
+        items.sort(key=lambda item: item[0])
+        groups: List[List[ScaffoldMember]] = []
+        reach = -math.inf
+        for lo, hi, m in items:
+            if not groups or lo > reach + _RUN_GAP:
+                groups.append([])
+                reach = hi
+            groups[-1].append(m)
+            reach = max(reach, hi)
+        for group in groups:
+            points = [p for m in group for p in (m.position_start, m.position_end)]
+            runs.append((
+                face,
+                (min(p.x for p in points), min(p.y for p in points), min(p.z for p in points)),
+                (max(p.x for p in points), max(p.y for p in points), max(p.z for p in points)),
+            ))
+    return runs
+
+
+def build_primitives(result: ScaffoldResult, lod: str = "full") -> List[GeometryPrimitive]:
+    """
+    足場計算結果から線分プリミティブを生成
+
+    Args:
+        result: 足場計算結果
+        lod: 詳細度（full / faces / outline）
+
+    Returns:
+        List[GeometryPrimitive]: full は部材種別ごと、faces / outline は足場ラインのランごとの
+            プリミティブ
+    """
+    if lod not in LOD_LEVELS:
+        raise ValueError(f"未対応のLODです: {lod}")
+
+    builders: Dict[str, _PrimitiveBuilder] = {}
+    extras: Dict[str, dict] = {}
+
+    if lod == "full":
+        for m in result.members:
+            name = m.member_type.name
+            builder = builders.get(name)
+            if builder is None:
+                builder = builders[name] = _PrimitiveBuilder()
+                extras[name] = {"memberType": m.member_type.value, "count": 0}
+            s, e = m.position_start, m.position_end
+            builder.line(_to_gltf(s.x, s.y, s.z), _to_gltf(e.x, e.y, e.z))
+            extras[name]["count"] += 1
+    else:
+        run_numbers: Dict[FaceDirection, int] = {}
+        for face, lo, hi in _run_extents(result):
+            run = run_numbers[face] = run_numbers.get(face, 0) + 1
+            name = f"{face.name}_{run}"
+            builder = builders[name] = _PrimitiveBuilder()
+            extras[name] = {"face": face.value, "run": run}
+            if lod == "faces":
+                builder.box(_to_gltf(*lo), _to_gltf(*hi))
+                continue
+            # 足場ラインを地上と最上部の2本＋両端の縦線で表す
+            if face in (FaceDirection.SOUTH, FaceDirection.NORTH):
+                a, b = (lo[0], lo[1]), (hi[0], lo[1])
+            else:
+                a, b = (lo[0], lo[1]), (lo[0], hi[1])
+            for z in (lo[2], hi[2]):
+                builder.line(_to_gltf(a[0], a[1], z), _to_gltf(b[0], b[1], z))
+            for px, py in (a, b):
+                builder.line(_to_gltf(px, py, lo[2]), _to_gltf(px, py, hi[2]))
+
+    return [
+        GeometryPrimitive(name=name, positions=b.positions, indices=b.indices, extras=extras[name])
+        for name, b in builders.items()
+        if len(b.indices)
+    ]
+
+
+def pack_buffers(primitives: List[GeometryPrimitive]) -> GeometryBuffers:
+    """
+    プリミティブを1つのバイナリバッファに詰め、glTF のアクセサ定義を生成
+
+    Args:
+        primitives: 線分プリミティブ
+
+    Returns:
+        GeometryBuffers: メッシュ・アクセサ・バッファビュー定義と BIN チャンク
+    """
+    chunks: List[bytes] = []
+    offset = 0
+    meshes, accessors, buffer_views = [], [], []
+
+    def append(data: array, target: int) -> int:
+        nonlocal offset
+        if sys.byteorder == "big":
+            data = array(data.typecode, data)
+            data.byteswap()
+        raw = data.tobytes()
+        buffer_views.append(
+            {"buffer": 0, "byteOffset": offset, "byteLength": len(raw), "target": target}
+        )
+        chunks.append(raw)
+        offset += len(raw)
+        # 各ビューは4バイト境界に揃える
+        padding = (-offset) % 4
+        if padding:
+            chunks.append(b"\x00" * padding)
+            offset += padding
+        return len(buffer_views) - 1
+
+    for prim in primitives:
+        positions = prim.positions
+        count = len(positions) // 3
+        pos_view = append(positions, _TARGET_ARRAY_BUFFER)
+        accessors.append({
+            "bufferView": pos_view,
+            "componentType": _COMPONENT_FLOAT,
+            "count": count,
+            "type": "VEC3",
+            "min": [min(positions[i::3]) for i in range(3)],
+            "max": [max(positions[i::3]) for i in range(3)],
+        })
+        idx_view = append(prim.indices, _TARGET_ELEMENT_ARRAY_BUFFER)
+        accessors.append({
+            "bufferView": idx_view,
+            "componentType": _COMPONENT_UINT32,
+            "count": len(prim.indices),
+            "type": "SCALAR",
+        })
+        meshes.append({
+            "name": prim.name,
+            "primitives": [{
+                "attributes": {"POSITION": len(accessors) - 2},
+                "indices": len(accessors) - 1,
+                "mode": _MODE_LINES,
+            }],
+            "extras": prim.extras,
+        })
+
+    return GeometryBuffers(
+        meshes=meshes,
+        accessors=accessors,
+        buffer_views=buffer_views,
+        binary=b"".join(chunks),
+    )
+
+
+def to_glb(
+    buffers: GeometryBuffers,
+    offset_x: float = 0.0,
+    offset_y: float = 0.0,
+    extras: Optional[dict] = None,
+) -> bytes:
+    """
+    形状バッファを GLB（glTF 2.0 バイナリ）に組み立てる
+
+    Args:
+        buffers: 形状バッファ
+        offset_x: 呼び出し元座標系への平行移動量（X, mm）
+        offset_y: 呼び出し元座標系への平行移動量（Y, mm）
+        extras: ルートノードに付与する追加情報
+
+    Returns:
+        bytes: GLB データ
+    """
+    root = {
+        "name": "scaffold",
+        "translation": list(_to_gltf(offset_x, offset_y, 0.0)),
+    }
+    if buffers.meshes:
+        root["children"] = list(range(1, len(buffers.meshes) + 1))
+    if extras:
+        root["extras"] = extras
+    nodes = [root] + [{"name": m["name"], "mesh": i} for i, m in enumerate(buffers.meshes)]
+
+    document = {
+        "asset": {"version": "2.0", "generator": "scaff-pro"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": nodes,
+    }
+    # glTF では空の配列を持てない（minItems 1）ため、部材が無い場合はメッシュ・バッファ定義ごと省く
+    if buffers.meshes:
+        document["meshes"] = buffers.meshes
+        document["accessors"] = buffers.accessors
+        document["bufferViews"] = buffers.buffer_views
+        document["buffers"] = [{"byteLength": len(buffers.binary)}]
+
+    json_chunk = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    json_chunk += b" " * ((-len(json_chunk)) % 4)
+    bin_chunk = buffers.binary
+
+    total = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if bin_chunk else 0)
+    parts = [
+        struct.pack("<III", _GLB_MAGIC, _GLB_VERSION, total),
+        struct.pack("<II", len(json_chunk), _CHUNK_JSON),
+        json_chunk,
+    ]
+    if bin_chunk:
+        parts.append(struct.pack("<II", len(bin_chunk), _CHUNK_BIN))
+        parts.append(bin_chunk)
+    return b"".join(parts)
+
+
+class GeometryCache:
+    """(結果キー, LOD) → 形状バッファ の LRU キャッシュ"""
+
+    def __init__(self, maxsize: int = DEFAULT_GEOMETRY_CACHE_SIZE):
+        """
+        初期化
+
+        Args:
+            maxsize: 保持する最大件数
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, str], GeometryBuffers]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: str, lod: str, result: ScaffoldResult) -> GeometryBuffers:
+        """キャッシュから取得し、無ければ生成して登録する"""
+        cache_key = (key, lod)
+        with self._lock:
+            buffers = self._entries.get(cache_key)
+            if buffers is not None:
+                self._entries.move_to_end(cache_key)
+                return buffers
+
+        buffers = pack_buffers(build_primitives(result, lod))
+
+        if self.maxsize > 0:
+            with self._lock:
+                self._entries[cache_key] = buffers
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return buffers
+
+    def __len__(self) -> int:
+        return len(self._entries)
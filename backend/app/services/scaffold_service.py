@@ -0,0 +1,482 @@
+"""
+足場計算サービス
+
+外周ポリラインを正規化（原点への平行移動・向き・開始頂点の固定）してハッシュ化し、
+同一形状の再計算を LRU キャッシュから返す。
+キャッシュには正規化座標系の結果を保持し、返却時に呼び出し元の座標系へ戻す。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app.core.metrics import track_stage
+from app.schemas.drawing import ExtractedEntrance
+from scaffold_logic import (
+    BuildingOutline,
+    HeightCondition,
+    IntOutline,
+    NGArea,
+    Point2D,
+    Point3D,
+    RoofClash,
+    RoofSpec,
+    ScaffoldMember,
+    ScaffoldResult,
+    ScaffoldSpec,
+    calculate_scaffold,
+    detect_roof_clashes,
+    get_scaffold_summary,
+)
+
+from .scaffold_geometry import GeometryCache, to_glb
+
+# 座標の丸め桁数（mm 単位で小数点以下3桁）
+COORD_PRECISION = 3
+
+# キャッシュ件数の既定値
+DEFAULT_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CanonicalOutline:
+    """正規化済みの外周ポリライン"""
+    vertices: Tuple[Tuple[float, float], ...]  # 原点基準・反時計回り・最小頂点始まり
+    offset_x: float  # 元座標系への平行移動量（X）
+    offset_y: float  # 元座標系への平行移動量（Y）
+
+
+@dataclass
+class ScaffoldCalculation:
+    """足場計算の実行結果"""
+    key: str  # 正規化入力のハッシュ
+    result: ScaffoldResult  # 呼び出し元座標系の計算結果
+    cached: bool  # キャッシュヒットしたかどうか
+
+
+def _round(value: float) -> float:
+    # -0.0 を 0.0 に揃える
+    return round(value, COORD_PRECISION) + 0.0
+
+
+def canonicalize_outline(points: Sequence[Tuple[float, float]]) -> CanonicalOutline:
+    """
+    外周ポリラインを正規化する
+
+    平行移動・開始頂点の違い・頂点順の反転を同一視できる形に揃える。
+
+    Args:
+        points: 外周頂点の (x, y) 列
+
+    Returns:
+        CanonicalOutline: 正規化済み頂点と元座標系への平行移動量
+    """
+    vertices = _dedupe_vertices(points)
+    if not vertices:
+        return CanonicalOutline(vertices=(), offset_x=0.0, offset_y=0.0)
+
+    offset_x = min(x for x, _ in vertices)
+    offset_y = min(y for _, y in vertices)
+    return CanonicalOutline(
+        vertices=_normalize_loop(vertices, offset_x, offset_y),
+        offset_x=offset_x,
+        offset_y=offset_y,
+    )
+
+
+def _dedupe_vertices(points: Sequence[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """座標を丸め、連続する重複頂点と閉じ点（始点の繰り返し）を除去する"""
+    vertices: List[Tuple[float, float]] = []
+    for x, y in points:
+        p = (_round(x), _round(y))
+        if not vertices or vertices[-1] != p:
+            vertices.append(p)
+    if len(vertices) > 1 and vertices[0] == vertices[-1]:
+        vertices.pop()
+    return vertices
+
+
+def _normalize_loop(
+    vertices: Sequence[Tuple[float, float]], offset_x: float, offset_y: float
+) -> Tuple[Tuple[float, float], ...]:
+    """平行移動し、反時計回り・辞書順最小の頂点始まりに揃える"""
+    translated = [(_round(x - offset_x), _round(y - offset_y)) for x, y in vertices]
+
+    # 向きを反時計回りに統一
+    if IntOutline.from_points(translated).orientation() < 0:
+        translated.reverse()
+
+    # 辞書順最小の頂点を始点にする
+    start = min(range(len(translated)), key=lambda i: translated[i])
+    return tuple(translated[start:] + translated[:start])
+
+
+def canonicalize_floor_outlines(
+    floor_outlines: Mapping[int, Sequence[Tuple[float, float]]], canonical: CanonicalOutline
+) -> Dict[int, Tuple[Tuple[float, float], ...]]:
+    """階ごとの外形を1階の外形と同じ正規化座標系へ移し、階順に揃える"""
+    normalized: Dict[int, Tuple[Tuple[float, float], ...]] = {}
+    for floor in sorted(floor_outlines):
+        vertices = _dedupe_vertices(floor_outlines[floor])
+        if vertices:
+            normalized[floor] = _normalize_loop(vertices, canonical.offset_x, canonical.offset_y)
+    return normalized
+
+
+def canonicalize_ng_areas(ng_areas: Sequence[NGArea], canonical: CanonicalOutline) -> List[NGArea]:
+    """NG エリアを正規化座標系へ平行移動し、順序を揃える"""
+    dx, dy = canonical.offset_x, canonical.offset_y
+    moved = [
+        NGArea(
+            min_point=Point2D(_round(a.min_point.x - dx), _round(a.min_point.y - dy)),
+            max_point=Point2D(_round(a.max_point.x - dx), _round(a.max_point.y - dy)),
+            kind=a.kind,
+        )
+        for a in ng_areas
+    ]
+    moved.sort(key=lambda a: (a.min_point.x, a.min_point.y, a.max_point.x, a.max_point.y, a.kind))
+    return moved
+
+
+def ng_area_from_entrance(entrance: ExtractedEntrance) -> NGArea:
+    """抽出された出入口を、幅を一辺とする正方形の NG エリアに変換"""
+    half = entrance.width / 2.0
+    return NGArea(
+        min_point=Point2D(entrance.position.x - half, entrance.position.y - half),
+        max_point=Point2D(entrance.position.x + half, entrance.position.y + half),
+        kind="entrance",
+    )
+
+
+def make_cache_key(
+    canonical: CanonicalOutline,
+    height_condition: HeightCondition,
+    scaffold_spec: ScaffoldSpec,
+    ng_areas: Sequence[NGArea] = (),
+    floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+    roof: Optional[RoofSpec] = None,
+) -> str:
+    """正規化済み入力からキャッシュキー（SHA-256）を生成"""
+    spec = asdict(scaffold_spec)
+    # 使用可能スパンは集合として扱う
+    spec["available_spans"] = sorted({float(s) for s in spec["available_spans"]}, reverse=True)
+    payload = {
+        "outline": canonical.vertices,
+        "height": asdict(height_condition),
+        "spec": spec,
+        "ng_areas": [asdict(a) for a in ng_areas],
+    }
+    if floor_outlines:
+        payload["floors"] = [[floor, floor_outlines[floor]] for floor in sorted(floor_outlines)]
+    if roof is not None:
+        payload["roof"] = asdict(roof)
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def translate_result(result: ScaffoldResult, dx: float, dy: float) -> ScaffoldResult:
+    """足場計算結果を平面方向に平行移動した新しい結果を返す"""
+    members = [
+        ScaffoldMember(
+            member_type=m.member_type,
+            length=m.length,
+            face=m.face,
+            position_start=Point3D(
+                m.position_start.x + dx, m.position_start.y + dy, m.position_start.z
+            ),
+            position_end=Point3D(m.position_end.x + dx, m.position_end.y + dy, m.position_end.z),
+        )
+        for m in result.members
+    ]
+    return ScaffoldResult(members=members, cost=result.cost)
+
+
+class ScaffoldResultCache:
+    """正規化キー → 足場計算結果（正規化座標系）の LRU キャッシュ"""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        """
+        初期化
+
+        Args:
+            maxsize: 保持する最大件数
+        """
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, ScaffoldResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ScaffoldResult]:
+        """キャッシュから取得（ヒット時は最新として扱う）"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: ScaffoldResult) -> None:
+        """キャッシュに登録（上限超過時は最も古いものを破棄）"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """キャッシュを空にする"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ScaffoldService:
+    """正規化キャッシュ付きの足場計算サービス"""
+
+    def __init__(
+        self,
+        cache: Optional[ScaffoldResultCache] = None,
+        geometry_cache: Optional[GeometryCache] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            cache: 結果キャッシュ（省略時は環境変数 SCAFFOLD_CACHE_SIZE の件数で生成）
+            geometry_cache: 3D形状バッファのキャッシュ（省略時は既定件数で生成）
+        """
+        if cache is None:
+            maxsize = int(os.getenv("SCAFFOLD_CACHE_SIZE", DEFAULT_CACHE_SIZE))
+            cache = ScaffoldResultCache(maxsize)
+        self.cache = cache
+        self.geometry_cache = geometry_cache or GeometryCache()
+
+    def calculate(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        scaffold_spec: Optional[ScaffoldSpec] = None,
+        ng_areas: Optional[Sequence[NGArea]] = None,
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+        roof: Optional[RoofSpec] = None,
+    ) -> ScaffoldCalculation:
+        """
+        足場の自動割付を行う（正規化キャッシュ経由）
+
+        Args:
+            points: 建物外周頂点の (x, y) 列（呼び出し元座標系）
+            height_condition: 高さ条件
+            scaffold_spec: 足場仕様テンプレート（省略時はデフォルト値）
+            ng_areas: 足場設置禁止エリア（呼び出し元座標系）
+            floor_outlines: 階 → 外形頂点の (x, y) 列（1階と異なる階のみ、呼び出し元座標系）
+            roof: 屋根条件（軒先・ケラバのクリアランス）
+
+        Returns:
+            ScaffoldCalculation: キャッシュキーと呼び出し元座標系の計算結果
+        """
+        canonical, key, result, cached = self._resolve(
+            points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+        )
+        return ScaffoldCalculation(
+            key=key,
+            result=translate_result(result, canonical.offset_x, canonical.offset_y),
+            cached=cached,
+        )
+
+    def summarize(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        scaffold_spec: Optional[ScaffoldSpec] = None,
+        ng_areas: Optional[Sequence[NGArea]] = None,
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+        roof: Optional[RoofSpec] = None,
+    ) -> Tuple[str, dict]:
+        """
+        数量集計（部材種別×長さ×面）のみを取得する
+
+        数量は平行移動の影響を受けないため、正規化座標系の結果をそのまま集計する。
+
+        Returns:
+            Tuple[str, dict]: キャッシュキーと (部材種別, 長さ, 面) → 数量
+        """
+        _, key, result, _ = self._resolve(
+            points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+        )
+        return key, get_scaffold_summary(result)
+
+    def quantity_in_polygon(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        polygon: Sequence[Tuple[float, float]],
+        scaffold_spec: Optional[ScaffoldSpec] = None,
+        ng_areas: Optional[Sequence[NGArea]] = None,
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+        roof: Optional[RoofSpec] = None,
+    ) -> Tuple[str, dict]:
+        """
+        投げ縄（多角形）で指定した範囲の部材数量を集計する
+
+        投げ縄を正規化座標系へ移し、キャッシュ済み結果の空間インデックスで検索する。
+
+        Args:
+            points: 建物外周頂点の (x, y) 列（呼び出し元座標系）
+            height_condition: 高さ条件
+            polygon: 投げ縄の頂点 (x, y) 列（呼び出し元座標系）
+            scaffold_spec: 足場仕様テンプレート（省略時はデフォルト値）
+            ng_areas: 足場設置禁止エリア（呼び出し元座標系）
+            floor_outlines: 階 → 外形頂点の (x, y) 列（1階と異なる階のみ、呼び出し元座標系）
+            roof: 屋根条件（軒先・ケラバのクリアランス）
+
+        Returns:
+            Tuple[str, dict]: キャッシュキーと (部材種別, 長さ, 面) → 数量
+        """
+        canonical, key, result, _ = self._resolve(
+            points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+        )
+        lasso = [Point2D(x - canonical.offset_x, y - canonical.offset_y) for x, y in polygon]
+        return key, result.get_quantity_in_polygon(lasso)
+
+    def roof_clashes(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        roof: RoofSpec,
+        scaffold_spec: Optional[ScaffoldSpec] = None,
+        ng_areas: Optional[Sequence[NGArea]] = None,
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+    ) -> Tuple[str, List[RoofClash]]:
+        """
+        足場部材と屋根（軒出・ケラバ・勾配・棟高さから作る立体）の干渉を検出する
+
+        部材と屋根の間には足場仕様の軒先・ケラバからのクリアランスを確保する。
+
+        Args:
+            points: 建物外周頂点の (x, y) 列（呼び出し元座標系）
+            height_condition: 高さ条件
+            roof: 屋根条件（割付と干渉チェックの両方に使う）
+            scaffold_spec: 足場仕様テンプレート（省略時はデフォルト値）
+            ng_areas: 足場設置禁止エリア（呼び出し元座標系）
+            floor_outlines: 階 → 外形頂点の (x, y) 列（1階と異なる階のみ、呼び出し元座標系）
+
+        Returns:
+            Tuple[str, List[RoofClash]]: キャッシュキーと干渉（部材は呼び出し元座標系）
+        """
+        if scaffold_spec is None:
+            scaffold_spec = ScaffoldSpec()
+        calculation = self.calculate(
+            points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+        )
+        outline = BuildingOutline(vertices=[Point2D(x, y) for x, y in points])
+        floors = {
+            floor: BuildingOutline(vertices=[Point2D(x, y) for x, y in vertices])
+            for floor, vertices in (floor_outlines or {}).items()
+        }
+        with track_stage("roof_clash"):
+            clashes = detect_roof_clashes(
+                calculation.result,
+                outline,
+                height_condition,
+                roof,
+                floors,
+                clearance=scaffold_spec.roof_clearance,
+            )
+        return calculation.key, clashes
+
+    def geometry(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        lod: str = "full",
+        scaffold_spec: Optional[ScaffoldSpec] = None,
+        ng_areas: Optional[Sequence[NGArea]] = None,
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+        roof: Optional[RoofSpec] = None,
+    ) -> Tuple[str, bytes]:
+        """
+        3Dワイヤーフレーム表示用の GLB を生成する
+
+        形状バッファは (キャッシュキー, LOD) 単位でキャッシュし、
+        呼び出し元座標系への平行移動はルートノードに設定する。
+
+        Args:
+            points: 建物外周頂点の (x, y) 列（呼び出し元座標系）
+            height_condition: 高さ条件
+            lod: 詳細度（full / faces / outline）
+            scaffold_spec: 足場仕様テンプレート（省略時はデフォルト値）
+            ng_areas: 足場設置禁止エリア（呼び出し元座標系）
+            floor_outlines: 階 → 外形頂点の (x, y) 列（1階と異なる階のみ、呼び出し元座標系）
+            roof: 屋根条件（軒先・ケラバのクリアランス）
+
+        Returns:
+            Tuple[str, bytes]: キャッシュキーと GLB データ
+        """
+        canonical, key, result, _ = self._resolve(
+            points, height_condition, scaffold_spec, ng_areas, floor_outlines, roof
+        )
+        buffers = self.geometry_cache.get_or_build(key, lod, result)
+        glb = to_glb(
+            buffers,
+            canonical.offset_x,
+            canonical.offset_y,
+            extras={"resultKey": key, "lod": lod},
+        )
+        return key, glb
+
+    def _resolve(
+        self,
+        points: Sequence[Tuple[float, float]],
+        height_condition: HeightCondition,
+        scaffold_spec: Optional[ScaffoldSpec],
+        ng_areas: Optional[Sequence[NGArea]],
+        floor_outlines: Optional[Mapping[int, Sequence[Tuple[float, float]]]] = None,
+        roof: Optional[RoofSpec] = None,
+    ) -> Tuple[CanonicalOutline, str, ScaffoldResult, bool]:
+        """入力を正規化し、正規化座標系の計算結果をキャッシュから取得または計算する"""
+        if scaffold_spec is None:
+            scaffold_spec = ScaffoldSpec()
+
+        canonical = canonicalize_outline(points)
+        canonical_ng = canonicalize_ng_areas(ng_areas or [], canonical)
+        canonical_floors = canonicalize_floor_outlines(floor_outlines or {}, canonical)
+        key = make_cache_key(
+            canonical, height_condition, scaffold_spec, canonical_ng, canonical_floors, roof
+        )
+
+        result = self.cache.get(key)
+        cached = result is not None
+        if result is None:
+            outline = BuildingOutline(vertices=[Point2D(x, y) for x, y in canonical.vertices])
+            floors = {
+                floor: BuildingOutline(vertices=[Point2D(x, y) for x, y in vertices])
+                for floor, vertices in canonical_floors.items()
+            }
+            with track_stage("scaffold_calculate"):
+                result = calculate_scaffold(
+                    outline, height_condition, scaffold_spec, canonical_ng, floors, roof
+                )
+            self.cache.put(key, result)
+        return canonical, key, result, cached
+
+
+# シングルトンインスタンス（遅延初期化）
+_service: Optional[ScaffoldService] = None
+
+
+def get_scaffold_service() -> ScaffoldService:
+    """足場計算サービスのシングルトンインスタンスを取得"""
+    global _service
+    if _service is None:
+        _service = ScaffoldService()
+    return _service
@@ -0,0 +1,325 @@
+"""
+アップロード領域の容量管理
+
+アップロード図面とその派生ファイル（`{図面ID}.{種別}.{拡張子}`）の最終アクセス時刻を記録し、
+容量上限を超えたら最近使われていない（cold な）ものからバックグラウンドで削除する。
+
+- 削除はリクエスト処理とは別のタスクで、ファイル操作はスレッドプールで行う
+- 抽出処理など実行中のジョブが参照している図面（pin 中）は削除しない。
+  削除する図面はロック内で pin が無いことを確かめて削除中として印を付け、ファイルの削除は
+  ロックの外で行う。削除中の図面の pin はその削除が終わるまで待つ
+- 元図面を削除する場合は派生ファイルもまとめて削除し、削除通知を呼び出す
+- 定期的にディレクトリを走査し、元図面の無い派生ファイルや古い一時ファイルを掃除する
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from app.core.metrics import STORAGE_BYTES, STORAGE_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+# 容量上限の既定値（バイト）
+DEFAULT_QUOTA_BYTES = 5 * 1024**3
+
+# 削除時に目標とする使用率（上限に対する割合）
+DEFAULT_LOW_WATERMARK = 0.9
+
+# これより最近アクセスされたファイルは削除しない（秒）
+DEFAULT_COLD_AFTER = 600.0
+
+# 定期走査の間隔（秒）
+DEFAULT_SCAN_INTERVAL = 300.0
+
+# 一時ファイルを孤立とみなすまでの時間（秒）
+STALE_TMP_AGE = 3600.0
+
+
+@dataclass
+class _Entry:
+    """管理対象ファイル"""
+    size: int
+    last_access: float
+
+
+def drawing_id_of(name: str) -> str:
+    """ファイル名から図面IDを取り出す（`{図面ID}.{拡張子}` / `{図面ID}.{種別}.{拡張子}`）"""
+    return name.split(".", 1)[0]
+
+
+def is_original(name: str) -> bool:
+    """元図面（派生ファイルでない）か"""
+    return name.count(".") == 1
+
+
+class StorageManager:
+    """アップロード領域の容量上限と LRU 削除"""
+
+    def __init__(
+        self,
+        root: Path,
+        quota_bytes: int = DEFAULT_QUOTA_BYTES,
+        low_watermark: float = DEFAULT_LOW_WATERMARK,
+        cold_after: float = DEFAULT_COLD_AFTER,
+        scan_interval: float = DEFAULT_SCAN_INTERVAL,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            root: 管理対象ディレクトリ
+            quota_bytes: 容量上限（バイト、0 以下は無制限）
+            low_watermark: 削除時に目標とする使用率（上限に対する割合）
+            cold_after: これより最近アクセスされたファイルは削除しない（秒）
+            scan_interval: 定期走査の間隔（秒）
+            on_evict: 元図面を削除した際に図面IDを渡して呼ぶ関数
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.low_watermark = low_watermark
+        self.cold_after = cold_after
+        self.scan_interval = scan_interval
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._evicted = threading.Condition(self._lock)  # 図面の削除が終わったときに通知
+        self._entries: Dict[str, _Entry] = {}
+        self._usage = 0
+        self._pins: Dict[str, int] = {}
+        self._evicting: Set[str] = set()  # ファイルを削除中の図面ID
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # ---- 記録 ----
+
+    def scan(self) -> None:
+        """
+        ディレクトリを走査して管理情報を作り直し、孤立ファイルを削除する
+
+        走査はロックの外で行うため、走査を始めた後に記録されたファイルは
+        走査結果に無くても管理情報に残す。
+        """
+        started = time.time()
+        entries: Dict[str, _Entry] = {}
+        orphans: List[Path] = []
+        with os.scandir(self.root) as it:
+            for item in it:
+                if not item.is_file(follow_symlinks=False):
+                    continue
+                stat = item.stat(follow_symlinks=False)
+                if item.name.startswith("."):
+                    # 索引などの内部ファイル。書き込み途中で残った一時ファイルのみ掃除する
+                    if item.name.endswith(".tmp") and started - stat.st_mtime > STALE_TMP_AGE:
+                        orphans.append(Path(item.path))
+                    continue
+                entries[item.name] = _Entry(stat.st_size, max(stat.st_atime, stat.st_mtime))
+
+        with self._lock:
+            for name, current in self._entries.items():
+                if current.last_access < started:
+                    continue
+                # 走査中に記録されたものは記録した時刻・サイズを残す
+                entry = entries.get(name)
+                if entry is None or entry.last_access <= current.last_access:
+                    entries[name] = _Entry(current.size, current.last_access)
+            originals = {drawing_id_of(name) for name in entries if is_original(name)}
+            for name in list(entries):
+                if not is_original(name) and drawing_id_of(name) not in originals:
+                    orphans.append(self.root / name)
+                    del entries[name]
+            self._entries = entries
+            self._usage = sum(e.size for e in entries.values())
+            STORAGE_BYTES.set(self._usage)
+
+        for path in orphans:
+            if self._unlink(path):
+                STORAGE_EVICTIONS.labels("orphan").inc()
+
+    def touch(self, name: str, size: Optional[int] = None) -> None:
+        """
+        アクセスまたは書き込みを記録する
+
+        Args:
+            name: ファイル名
+            size: 書き込んだ場合はそのサイズ（省略時はアクセスのみ）
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                if size is None:
+                    return
+                entry = self._entries[name] = _Entry(0, 0.0)
+            if size is not None:
+                self._usage += size - entry.size
+                entry.size = size
+                STORAGE_BYTES.set(self._usage)
+            entry.last_access = time.time()
+            over = self.over_quota()
+        if over:
+            self._request_eviction()
+
+    def forget(self, name: str) -> None:
+        """削除済みのファイルを管理対象から外す"""
+        with self._lock:
+            entry = self._entries.pop(name, None)
+            if entry is not None:
+                self._usage -= entry.size
+                STORAGE_BYTES.set(self._usage)
+
+    @contextmanager
+    def pin(self, drawing_id: str) -> Iterator[None]:
+        """
+        ジョブの実行中、図面とその派生ファイルを削除対象から外す
+
+        図面が削除中の場合は削除が終わるまで待つ（その後のファイルの検索では見つからない）。
+        """
+        with self._lock:
+            self._evicted.wait_for(lambda: drawing_id not in self._evicting)
+            self._pins[drawing_id] = self._pins.get(drawing_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                count = self._pins[drawing_id] - 1
+                if count:
+                    self._pins[drawing_id] = count
+                else:
+                    del self._pins[drawing_id]
+
+    @property
+    def usage(self) -> int:
+        """使用量（バイト）"""
+        return self._usage
+
+    def over_quota(self) -> bool:
+        return self.quota_bytes > 0 and self._usage > self.quota_bytes
+
+    # ---- 削除 ----
+
+    def evict(self) -> int:
+        """
+        使用量が目標以下になるまで、cold なファイルを最終アクセスの古い順に削除する
+
+        Returns:
+            int: 削除したファイル数
+        """
+        target = int(self.quota_bytes * self.low_watermark)
+        threshold = time.time() - self.cold_after
+        with self._lock:
+            if not self.over_quota():
+                return 0
+            candidates = sorted(
+                (entry.last_access, name)
+                for name, entry in self._entries.items()
+                if entry.last_access < threshold
+            )
+
+        evicted = 0
+        for _, name in candidates:
+            drawing_id = drawing_id_of(name)
+            # pin が無いことの確認と削除中の印付けを同じロック内で行い、削除中に始まったジョブは
+            # pin で削除の完了を待たせる（ファイルの削除自体はロックの外で行う）
+            with self._lock:
+                if self._usage <= target:
+                    break
+                if drawing_id in self._pins or drawing_id in self._evicting:
+                    continue
+                if name not in self._entries:
+                    continue
+                # 元図面を消す場合は派生ファイルもまとめて消す
+                names = [
+                    n for n in self._entries
+                    if n == name or (is_original(name) and drawing_id_of(n) == drawing_id)
+                ]
+                self._evicting.add(drawing_id)
+            removed: List[str] = []
+            try:
+                removed.extend(victim for victim in names if self._unlink(self.root / victim))
+            finally:
+                with self._lock:
+                    for victim in removed:
+                        entry = self._entries.pop(victim, None)
+                        if entry is not None:
+                            self._usage -= entry.size
+                    STORAGE_BYTES.set(self._usage)
+                    self._evicting.discard(drawing_id)
+                    self._evicted.notify_all()
+            STORAGE_EVICTIONS.labels("quota").inc(len(removed))
+            evicted += len(removed)
+            if is_original(name) and name in removed and self.on_evict is not None:
+                try:
+                    self.on_evict(drawing_id)
+                except Exception as e:
+                    logger.warning("削除通知に失敗しました (%s): %s", drawing_id, e)
+
+        if self.over_quota():
+            logger.warning(
+                "容量上限を超えていますが、削除できるファイルがありません (%d / %d bytes)",
+                self._usage, self.quota_bytes,
+            )
+        return evicted
+
+    def _unlink(self, path: Path) -> bool:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            logger.warning("ファイルの削除に失敗しました (%s): %s", path.name, e)
+            return False
+        return True
+
+    # ---- バックグラウンドタスク ----
+
+    def _request_eviction(self) -> None:
+        """削除タスクを起こす（どのスレッドからでも呼べる）"""
+        if self._loop is None or self._wake is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError:
+            # イベントループ終了後
+            pass
+
+    async def run(self) -> None:
+        """定期走査と容量超過時の削除を行うバックグラウンドタスク"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        await asyncio.to_thread(self.scan)
+        next_scan = time.monotonic() + self.scan_interval
+        while True:
+            if self.over_quota():
+                await asyncio.to_thread(self.evict)
+            timeout = max(0.0, next_scan - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self.scan)
+                next_scan = time.monotonic() + self.scan_interval
+            self._wake.clear()
+
+
+# シングルトンインスタンス（遅延初期化）
+_manager: Optional[StorageManager] = None
+
+
+def get_storage_manager(root: Path = Path("uploads")) -> StorageManager:
+    """アップロード領域の容量管理のシングルトンインスタンスを取得"""
+    global _manager
+    if _manager is None:
+        from .drawing_similarity import get_similarity_index
+
+        _manager = StorageManager(
+            root,
+            quota_bytes=int(os.getenv("UPLOAD_QUOTA_BYTES", DEFAULT_QUOTA_BYTES)),
+            cold_after=float(os.getenv("UPLOAD_COLD_AFTER_SECONDS", DEFAULT_COLD_AFTER)),
+            scan_interval=float(os.getenv("UPLOAD_SCAN_INTERVAL_SECONDS", DEFAULT_SCAN_INTERVAL)),
+            on_evict=lambda drawing_id: get_similarity_index(root).remove(drawing_id),
+        )
+    return _manager
@@ -0,0 +1,94 @@
+"""
+起動時間（import 時間）の予算チェック
+
+    cd backend && python scripts/check_import_time.py [--budget-ms 700] [--runs 3]
+
+`python -X importtime` で `app.main` の読み込み時間を計測し、
+予算を超えた場合、または重い依存が起動時に読み込まれている場合に終了コード 1 を返す。
+予算は環境変数 IMPORT_TIME_BUDGET_MS でも指定できる。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 起動時に読み込まれてはならない重い依存（初回利用時に遅延読み込みする）
+HEAVY_MODULES = (
+    "cv2",
+    "numpy",
+    "PIL",
+    "ezdxf",
+    "pdf2image",
+    "pytesseract",
+    "anthropic",
+    "google.generativeai",
+    "httpx",
+    "xlsxwriter",
+    "scaffold_logic",
+)
+
+_PROBE = (
+    "import json, sys\n"
+    "import app.main\n"
+    f"heavy = {HEAVY_MODULES!r}\n"
+    "print(json.dumps(sorted(m for m in heavy if m in sys.modules)))\n"
+)
+
+
+def measure() -> tuple[float, list[str]]:
+    """app.main の累積 import 時間（ms）と読み込まれた重い依存を返す"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"app.main の読み込みに失敗しました:\n{proc.stderr}")
+
+    total_us = None
+    for line in proc.stderr.splitlines():
+        # 例: "import time:       123 |       4567 | app.main"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == "app.main":
+            total_us = int(parts[1])
+    if total_us is None:
+        raise RuntimeError("app.main の import 時間を取得できませんでした")
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return total_us / 1000.0, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="app.main の import 時間予算チェック")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "700")),
+        help="許容する import 時間（ms）",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="計測回数（最小値で判定）")
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(max(1, args.runs))]
+    best_ms = min(ms for ms, _ in results)
+    loaded = results[-1][1]
+
+    print(f"app.main import time: {best_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    failed = False
+    if best_ms > args.budget_ms:
+        print("NG: import 時間が予算を超えています")
+        failed = True
+    if loaded:
+        print(f"NG: 起動時に重い依存が読み込まれています: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+受付制御（待ち行列・クライアントごとの上限・ボディサイズ・ヘルスチェック）のテスト
+"""
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.core.admission import (
+    AdmissionConfig,
+    AdmissionController,
+    AdmissionMiddleware,
+    RoutePolicy,
+    load_admission_config,
+)
+
+UPLOAD_PATH = "/api/v1/drawings/upload"
+EXTRACT_PATH = "/api/v1/drawings/extract-outline"
+
+
+def _app(release: Optional[asyncio.Event] = None) -> FastAPI:
+    """アップロードはファイルを受け取り、抽出は release が立つまで処理中のままにする"""
+    app = FastAPI()
+
+    @app.post(UPLOAD_PATH)
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post(EXTRACT_PATH)
+    async def extract():
+        await release.wait()
+        return {"ok": True}
+
+    return app
+
+
+def _controller(queue_timeout: float = 5.0, **policy) -> AdmissionController:
+    options = dict(concurrency=1, queue_depth=0, max_body_bytes=1000)
+    options.update(policy)
+    routes = [
+        RoutePolicy(name="upload", path_prefix=UPLOAD_PATH, **options),
+        RoutePolicy(name="extraction", path_prefix="/api/v1/drawings/extract", **options),
+    ]
+    return AdmissionController(AdmissionConfig(routes=routes, queue_timeout=queue_timeout))
+
+
+def _multipart(size: int):
+    boundary = "boundary"
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="a.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + b"x" * size + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}".encode()
+
+
+async def _request(middleware, path, headers=(), chunks=(b"",), tenant=None):
+    """ASGI で1リクエストを送り、(ステータス, ヘッダー, ボディ) を返す"""
+    headers = list(headers)
+    if tenant is not None:
+        headers.append((b"x-tenant-id", tenant.encode()))
+    scope = {
+        "type": "http", "method": "POST", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "headers": headers, "client": ("10.0.0.1", 1234),
+        "server": ("testserver", 80), "scheme": "http", "http_version": "1.1",
+        "root_path": "",
+    }
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    blocked = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await blocked.wait()  # 切断は送らない
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await middleware(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), json.loads(body)
+
+
+async def _while_busy(controller, release, *requests):
+    """抽出リクエスト1件を処理中にした状態で requests を送り、各応答を返す"""
+    middleware = AdmissionMiddleware(_app(release), controller)
+    busy = asyncio.create_task(_request(middleware, EXTRACT_PATH, tenant="busy"))
+    await asyncio.sleep(0.01)
+    try:
+        return [await _request(middleware, path, **kwargs) for path, kwargs in requests]
+    finally:
+        release.set()
+        assert (await busy)[0] == 200
+
+
+def test_queue_full_is_rejected_with_retry_after():
+    async def scenario():
+        release = asyncio.Event()
+        return await _while_busy(_controller(), release, (EXTRACT_PATH, {"tenant": "other"}))
+
+    ((status, headers, body),) = asyncio.run(scenario())
+    assert status == 503
+    assert int(headers[b"retry-after"]) >= 1
+    assert "混雑" in body["detail"]
+
+
+def test_queue_timeout_is_rejected_with_retry_after():
+    async def scenario():
+        release = asyncio.Event()
+        controller = _controller(queue_timeout=0.05, queue_depth=1)
+        return await _while_busy(controller, release, (EXTRACT_PATH, {"tenant": "other"}))
+
+    ((status, headers, _),) = asyncio.run(scenario())
+    assert status == 503
+    assert int(headers[b"retry-after"]) >= 1
+
+
+def test_per_client_limit_is_rejected_with_429():
+    async def scenario():
+        release = asyncio.Event()
+        controller = _controller(concurrency=2, per_client=1)
+        # 処理中のクライアント（busy）は2件目を断られ、別のクライアントは処理される
+        body, content_type = _multipart(10)
+        headers = [(b"content-type", content_type)]
+        return await _while_busy(
+            controller, release,
+            (EXTRACT_PATH, {"tenant": "busy"}),
+            (UPLOAD_PATH, {"tenant": "other", "headers": headers, "chunks": (body,)}),
+        )
+
+    (limited, other) = asyncio.run(scenario())
+    assert limited[0] == 429
+    assert b"retry-after" in limited[1]
+    assert other[0] == 200 and other[2] == {"size": 10}
+
+
+def test_per_client_limit_is_configured_separately(monkeypatch):
+    monkeypatch.setenv("ADMISSION_UPLOAD_CONCURRENCY", "8")
+    monkeypatch.setenv("ADMISSION_UPLOAD_PER_CLIENT", "3")
+    monkeypatch.setenv("ADMISSION_EXTRACTION_PER_CLIENT", "0")
+    upload, extraction = load_admission_config().routes
+    assert (upload.concurrency, upload.per_client) == (8, 3)
+    assert extraction.per_client == 0
+
+
+def test_content_length_over_limit_is_rejected_before_reading():
+    async def scenario():
+        middleware = AdmissionMiddleware(_app(), _controller())
+        body, content_type = _multipart(2000)
+        headers = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+        # ボディは送らない（読みに行けばテストが止まる）
+        return await asyncio.wait_for(
+            _request(middleware, UPLOAD_PATH, headers=headers, chunks=()), 5
+        )
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 413
+    assert "1000" in body["detail"]
+
+
+def test_streamed_body_over_limit_is_rejected():
+    """Content-Length が無くても受信しながら数え、上限を超えた時点で断る"""
+    async def scenario():
+        middleware = AdmissionMiddleware(_app(), _controller())
+        body, content_type = _multipart(2000)
+        chunks = tuple(body[i:i + 256] for i in range(0, len(body), 256))
+        headers = [(b"content-type", content_type)]
+        return await _request(middleware, UPLOAD_PATH, headers=headers, chunks=chunks)
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 413
+    assert "1000" in body["detail"]
+
+
+def test_streamed_body_within_limit_is_accepted():
+    async def scenario():
+        middleware = AdmissionMiddleware(_app(), _controller())
+        body, content_type = _multipart(500)
+        chunks = tuple(body[i:i + 256] for i in range(0, len(body), 256))
+        headers = [(b"content-type", content_type)]
+        return await _request(middleware, UPLOAD_PATH, headers=headers, chunks=chunks)
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 200 and body == {"size": 500}
+
+
+def test_health_reports_saturation(monkeypatch):
+    controller = _controller()
+    monkeypatch.setattr(main, "admission", controller)
+    client = TestClient(main.app)
+    assert client.get("/api/v1/health").status_code == 200
+
+    (gate, _) = controller._gates
+    assert asyncio.run(gate.acquire("busy", 1.0)) is None
+    response = client.get("/api/v1/health")
+    assert response.status_code == 503
+    assert response.json()["admission"]["upload"]["saturated"] is True
+
+    gate.release("busy")
+    assert client.get("/api/v1/health").status_code == 200
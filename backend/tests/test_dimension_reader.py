@@ -0,0 +1,69 @@
+"""
+寸法値のローカル読み取り（寸法値の解釈・候補領域の検出）のテスト
+"""
+import pytest
+
+from app.services.dimension_reader import LocalDimensionReader, parse_dimension_text
+
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("3640", 3640.0),
+    ("3,640", 3640.0),
+    ("12,345.5", 12345.5),
+    ("９１０", 910.0),  # 全角数字
+    ("1 820", 1820.0),  # OCR が挟んだ空白
+    ("L=3640 (2)", 3640.0),  # 最も長い数値を採る
+    ("5", None),  # 範囲外（小さすぎる）
+    ("200000", None),  # 範囲外（大きすぎる）
+    ("", None),
+    ("abc", None),
+])
+def test_parse_dimension_text(text, expected):
+    assert parse_dimension_text(text) == expected
+
+
+def _text_image(text: str) -> "np.ndarray":
+    image = np.full((40, 120), 255, dtype=np.uint8)
+    cv2.putText(image, text, (4, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 0, 2)
+    return image
+
+
+def _sheet() -> "np.ndarray":
+    """寸法線2本（水平・垂直）と寸法値、太い壁線、線から離れた文字を描いた図面"""
+    sheet = np.full((900, 1200), 255, dtype=np.uint8)
+    # 水平寸法: 線の上に寸法値
+    cv2.line(sheet, (100, 300), (800, 300), 0, 1)
+    sheet[250:290, 400:520] = _text_image("3640")
+    # 垂直寸法: 線の左に下から上へ読む寸法値
+    cv2.line(sheet, (1000, 100), (1000, 800), 0, 1)
+    sheet[390:510, 950:990] = cv2.rotate(_text_image("2730"), cv2.ROTATE_90_COUNTERCLOCKWISE)
+    # 壁（太線）の近くの文字は寸法値としない
+    cv2.rectangle(sheet, (100, 600), (800, 612), 0, -1)
+    sheet[550:590, 400:520] = _text_image("9999")
+    # どの線からも離れた文字
+    sheet[800:840, 200:320] = _text_image("1234")
+    return sheet
+
+
+def test_find_candidates_on_synthetic_sheet():
+    candidates = LocalDimensionReader(parallel=False).find_candidates(_sheet())
+
+    assert [direction for _, direction in candidates] == ["horizontal", "vertical"]
+    (h_box, _), (v_box, _) = candidates
+    assert 400 <= h_box.cx <= 520 and 250 <= h_box.cy <= 290
+    assert 950 <= v_box.cx <= 990 and 390 <= v_box.cy <= 510
+
+
+def test_find_candidates_on_downscaled_sheet():
+    """長辺の上限を超える図面は縮小して検出し、元の解像度の矩形を返す"""
+    reader = LocalDimensionReader(parallel=False, detect_max_side=800)
+    candidates = reader.find_candidates(_sheet())
+
+    directions = [direction for _, direction in candidates]
+    assert directions == ["horizontal", "vertical"]
+    (h_box, _), (v_box, _) = candidates
+    assert 400 <= h_box.cx <= 520 and 250 <= h_box.cy <= 290
+    assert 950 <= v_box.cx <= 990 and 390 <= v_box.cy <= 510
@@ -0,0 +1,138 @@
+"""
+図面の類似判定（BK-tree の近傍検索・テナントごとの索引・索引の保存と圧縮）のテスト
+"""
+import random
+
+import pytest
+
+from app.services import drawing_similarity as similarity_module
+from app.services.drawing_similarity import (
+    HASH_BITS,
+    BKTree,
+    DrawingSimilarityIndex,
+    compute_phash,
+    hamming_distance,
+)
+
+
+def _flip(value: int, bits) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_bk_tree_search_matches_brute_force(seed):
+    rng = random.Random(seed)
+    base = [rng.getrandbits(HASH_BITS) for _ in range(5)]
+    # 近傍が見つかるよう、いくつかの値の周りに少しずつビットを反転した値を作る
+    values = [
+        _flip(rng.choice(base), rng.sample(range(HASH_BITS), rng.randint(0, 12)))
+        for _ in range(300)
+    ]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, f"d{i}")
+    assert len(tree) == len(values)
+
+    for _ in range(20):
+        query = _flip(rng.choice(base), rng.sample(range(HASH_BITS), rng.randint(0, 6)))
+        max_distance = rng.randint(0, 10)
+        expected = sorted(
+            (hamming_distance(query, value), f"d{i}")
+            for i, value in enumerate(values)
+            if hamming_distance(query, value) <= max_distance
+        )
+        assert tree.search(query, max_distance) == expected
+
+
+def test_results_are_reused_only_within_tenant():
+    index = DrawingSimilarityIndex()
+    index.add("a1", 0b1011, tenant="a")
+    index.store_result("a1", "outline", {"width_mm": 9100})
+    index.add("a2", 0b1010, tenant="a")
+    index.add("b1", 0b1011, tenant="b")
+
+    assert index.find_reusable("a2", "outline") == (
+        "a1", 1.0 - 1 / HASH_BITS, {"width_mm": 9100},
+    )
+    # 同じハッシュでも別のテナントの抽出結果は返さない
+    assert index.find_reusable("b1", "outline") is None
+    assert index.find_reusable("a2", "roof") is None
+
+
+def test_removed_drawing_is_not_reused():
+    index = DrawingSimilarityIndex()
+    index.add("a1", 0b1011, tenant="a")
+    index.store_result("a1", "outline", {"width_mm": 9100})
+    index.remove("a1")
+    # 削除後に同じIDで別のテナントが登録しても、元のテナントからは見えない
+    index.add("a1", 0b1011, tenant="b")
+    index.add("a2", 0b1011, tenant="a")
+    assert index.find_reusable("a2", "outline") is None
+
+
+def test_index_is_restored_from_storage(tmp_path):
+    path = tmp_path / ".drawing_hashes.json"
+    index = DrawingSimilarityIndex(path)
+    index.add("a1", 0b1011, tenant="a")
+    index.store_result("a1", "outline", {"width_mm": 9100})
+    index.add("a2", 0b1111, tenant="a")
+    index.remove("a2")
+
+    restored = DrawingSimilarityIndex(path)
+    assert len(restored) == 1
+    restored.add("a3", 0b1010, tenant="a")
+    assert restored.find_reusable("a3", "outline")[0] == "a1"
+    # 削除済みの図面は BK-tree にも残らない
+    assert len(restored._trees["a"]) == 2
+
+
+def test_compaction_rebuilds_trees(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_module, "COMPACT_MIN_RECORDS", 10)
+    path = tmp_path / ".drawing_hashes.json"
+    index = DrawingSimilarityIndex(path)
+    for i in range(10):
+        index.add(f"d{i}", i, tenant="a")
+    for i in range(3):
+        index.remove(f"d{i}")
+    assert len(index._trees["a"]) == 10
+
+    # 追記した行（14行）が有効な行（6行）の2倍を超えた時点で書き直し、
+    # BK-tree からも削除済みの図面を除く
+    index.remove("d3")
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 6
+    assert len(index._trees["a"]) == len(index) == 6
+    found = [item for _, item in index._trees["a"].search(0, HASH_BITS)]
+    assert sorted(found) == [f"d{i}" for i in range(4, 10)]
+
+
+def test_phash_ignores_brightness_and_separates_layouts(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+
+    def png(image) -> bytes:
+        return cv2.imencode(".png", image)[1].tobytes()
+
+    def layout(seed: int):
+        """部屋を塗りつぶした矩形としてランダムに並べた図面"""
+        rng = np.random.default_rng(seed)
+        image = np.full((400, 600), 255, dtype=np.uint8)
+        for _ in range(12):
+            x0, y0 = rng.integers(0, 450), rng.integers(0, 300)
+            x1, y1 = x0 + rng.integers(40, 150), y0 + rng.integers(40, 100)
+            cv2.rectangle(image, (int(x0), int(y0)), (int(x1), int(y1)), 0, -1)
+        return image
+
+    plan, other = layout(0), layout(1)
+
+    value = compute_phash(png(plan))
+    assert 0 <= value < 1 << HASH_BITS
+    # 全体の明るさ・解像度が違うだけの再スキャンは近く、別の図面は遠い
+    rescan = cv2.resize((plan * 0.8 + 20).astype(np.uint8), (900, 600))
+    assert hamming_distance(value, compute_phash(png(rescan))) <= 6
+    assert hamming_distance(value, compute_phash(png(other))) > 12
+    # ファイルのパスからも同じ値になる
+    path = tmp_path / "plan.png"
+    path.write_bytes(png(plan))
+    assert compute_phash(path) == value
@@ -0,0 +1,165 @@
+"""
+抽出スケジューラ（優先度クラスの配分・テナント間の公平性・期限切れ）のテスト
+"""
+import asyncio
+
+import pytest
+
+from app.services import extraction_scheduler as scheduler_module
+from app.services.extraction_scheduler import (
+    BATCH,
+    INTERACTIVE,
+    ExtractionRejected,
+    ExtractionScheduler,
+)
+
+
+async def _run_in_order(scheduler: ExtractionScheduler, requests, blocker=BATCH):
+    """
+    実行枠を1つふさいだ状態で要求を順に投入し、枠を空けた後に実行された順を返す
+
+    requests は (名前, テナント, 優先度) の列。ふさぐ要求は interactive の連続実行数を
+    数え始めないよう、既定では batch とする。
+    """
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(tenant="blocker", priority=blocker):
+            await release.wait()
+
+    async def run(name, tenant, priority):
+        async with scheduler.slot(tenant=tenant, priority=priority):
+            order.append(name)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    tasks = []
+    for request in requests:
+        tasks.append(asyncio.create_task(run(*request)))
+        # 投入順（＝仮想時刻タグの付く順）を固定する
+        await asyncio.sleep(0)
+    assert scheduler.queued() == len(requests)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+def test_batch_runs_once_per_interactive_share():
+    scheduler = ExtractionScheduler(concurrency=1, interactive_share=4)
+    requests = [(f"i{n}", "t", INTERACTIVE) for n in range(8)]
+    requests += [(f"b{n}", "t", BATCH) for n in range(2)]
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    assert order == ["i0", "i1", "i2", "i3", "b0", "i4", "i5", "i6", "i7", "b1"]
+
+
+def test_interactive_only_is_not_held_back_by_share():
+    scheduler = ExtractionScheduler(concurrency=1, interactive_share=1)
+    requests = [(f"i{n}", "t", INTERACTIVE) for n in range(3)]
+    assert asyncio.run(_run_in_order(scheduler, requests)) == ["i0", "i1", "i2"]
+
+
+def test_tenants_are_interleaved():
+    """大量に投入したテナントの後から来たテナントも交互に実行される"""
+    scheduler = ExtractionScheduler(concurrency=1)
+    requests = [(f"a{n}", "a", INTERACTIVE) for n in range(4)]
+    requests += [(f"b{n}", "b", INTERACTIVE) for n in range(2)]
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    assert order == ["a0", "b0", "a1", "b1", "a2", "a3"]
+
+
+def test_tenant_weight_scales_share():
+    scheduler = ExtractionScheduler(concurrency=1, tenant_weights={"b": 2.0})
+    requests = [(f"a{n}", "a", INTERACTIVE) for n in range(3)]
+    requests += [(f"b{n}", "b", INTERACTIVE) for n in range(4)]
+    order = asyncio.run(_run_in_order(scheduler, requests))
+    # b は重み 2 のため a の2倍の割合で実行される
+    assert order == ["b0", "a0", "b1", "b2", "a1", "b3", "a2"]
+
+
+async def _expire_then_run(scheduler: ExtractionScheduler, expire) -> list:
+    """
+    テナント a の要求を1件破棄させた後に a・b の要求を1件ずつ投入し、実行された順を返す
+    """
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(tenant="blocker", priority=BATCH):
+            await release.wait()
+
+    async def run(name, tenant):
+        async with scheduler.slot(tenant=tenant):
+            order.append(name)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    with pytest.raises(ExtractionRejected):
+        await expire()
+    assert scheduler.queued() == 0
+
+    tasks = [asyncio.create_task(run("a", "a"))]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(run("b", "b")))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order
+
+
+def test_expired_request_does_not_delay_its_tenant():
+    scheduler = ExtractionScheduler(concurrency=1)
+
+    async def expire():
+        async with scheduler.slot(tenant="a", max_wait=0.01):
+            pass
+
+    # 破棄した分を差し引かないと a の次の要求は b より後ろに並ぶ
+    assert asyncio.run(_expire_then_run(scheduler, expire)) == ["a", "b"]
+
+
+def test_abandoned_request_does_not_delay_its_tenant(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "ABANDON_POLL_INTERVAL", 0.01)
+    scheduler = ExtractionScheduler(concurrency=1)
+
+    async def disconnected() -> bool:
+        return True
+
+    async def expire():
+        async with scheduler.slot(tenant="a", abandoned=disconnected):
+            pass
+
+    assert asyncio.run(_expire_then_run(scheduler, expire)) == ["a", "b"]
+
+
+def test_withdrawn_request_moves_up_later_requests_of_tenant():
+    """破棄した要求より後ろに並んでいた同じテナントの要求も繰り上がる"""
+
+    async def scenario():
+        scheduler = ExtractionScheduler(concurrency=1)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(tenant="blocker", priority=BATCH):
+                await release.wait()
+
+        async def run(name, tenant, max_wait=None):
+            try:
+                async with scheduler.slot(tenant=tenant, max_wait=max_wait):
+                    order.append(name)
+            except ExtractionRejected:
+                order.append(f"{name}:rejected")
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        tasks = []
+        for args in [("a0", "a", 0.01), ("a1", "a"), ("b0", "b"), ("b1", "b")]:
+            tasks.append(asyncio.create_task(run(*args)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["a0:rejected", "a1", "b0", "b1"]
@@ -0,0 +1,80 @@
+"""
+リクエスト単位のプロファイリングのテスト
+"""
+import pstats
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.profiling import (
+    ProfiledRoute,
+    ProfilingConfig,
+    ProfilingMiddleware,
+    run_in_threadpool,
+)
+
+TOKEN = "secret"
+
+
+def _hot_sync_work() -> int:
+    return sum(i * i for i in range(20000))
+
+
+def _hot_pool_work() -> int:
+    return sum(i for i in range(20000))
+
+
+def _make_client(output_dir) -> TestClient:
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/sync")
+    def sync_route(n: int = 1):
+        return {"value": _hot_sync_work() * n}
+
+    @router.get("/pool")
+    async def pool_route():
+        return {"value": await run_in_threadpool(_hot_pool_work)}
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(
+        ProfilingMiddleware, config=ProfilingConfig(token=TOKEN, output_dir=output_dir)
+    )
+    return TestClient(app)
+
+
+def _profiled_functions(output_dir) -> set:
+    """出力された pstats（ワーカー分を含む）に現れる関数名"""
+    paths = sorted(output_dir.glob("*.pstats"))
+    assert paths
+    names = set()
+    for path in paths:
+        names.update(func for _, _, func in pstats.Stats(str(path)).stats)
+    return names
+
+
+def test_sync_route_hot_function_appears_in_dump(tmp_path):
+    client = _make_client(tmp_path)
+    response = client.get("/sync", params={"n": 2}, headers={"X-Profile": TOKEN})
+
+    assert response.status_code == 200
+    assert response.json() == {"value": _hot_sync_work() * 2}  # 引数の解析はそのまま
+    assert response.headers["x-profile-id"]
+    assert "_hot_sync_work" in _profiled_functions(tmp_path)
+
+
+def test_run_in_threadpool_work_appears_in_dump(tmp_path):
+    client = _make_client(tmp_path)
+    response = client.get("/pool", headers={"X-Profile": TOKEN})
+
+    assert response.status_code == 200
+    assert "_hot_pool_work" in _profiled_functions(tmp_path)
+
+
+def test_unprofiled_request_writes_nothing(tmp_path):
+    client = _make_client(tmp_path)
+    response = client.get("/sync")
+
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
+    assert not list(tmp_path.iterdir())
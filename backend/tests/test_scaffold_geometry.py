@@ -0,0 +1,125 @@
+"""
+3D形状バッファ（GLB）の構造のテスト
+"""
+import json
+import struct
+from array import array
+
+import pytest
+
+from app.services.scaffold_geometry import LOD_LEVELS, build_primitives, pack_buffers, to_glb
+from scaffold_logic import (
+    BuildingOutline,
+    HeightCondition,
+    Point2D,
+    ScaffoldResult,
+    calculate_scaffold,
+)
+
+_COMPONENTS = {5126: "f", 5125: "I"}
+_WIDTH = {"SCALAR": 1, "VEC3": 3}
+
+
+def _parse_glb(glb: bytes):
+    """GLB をヘッダー・チャンク長を検証しながら (JSON, BIN) に分ける"""
+    magic, version, length = struct.unpack_from("<III", glb, 0)
+    assert magic == 0x46546C67 and version == 2
+    assert length == len(glb)
+    json_length, json_type = struct.unpack_from("<II", glb, 12)
+    assert json_type == 0x4E4F534A and json_length % 4 == 0
+    document = json.loads(glb[20:20 + json_length])
+    offset = 20 + json_length
+    binary = b""
+    if offset < len(glb):
+        bin_length, bin_type = struct.unpack_from("<II", glb, offset)
+        assert bin_type == 0x004E4942 and bin_length % 4 == 0
+        binary = glb[offset + 8:offset + 8 + bin_length]
+        assert offset + 8 + bin_length == len(glb)
+    return document, binary
+
+
+def _assert_no_empty_arrays(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            _assert_no_empty_arrays(item)
+    elif isinstance(value, list):
+        assert value, "glTF の配列は1要素以上"
+        for item in value:
+            _assert_no_empty_arrays(item)
+
+
+def _accessor_data(document, binary, index):
+    accessor = document["accessors"][index]
+    view = document["bufferViews"][accessor["bufferView"]]
+    assert view["byteOffset"] % 4 == 0
+    assert view["byteOffset"] + view["byteLength"] <= document["buffers"][0]["byteLength"]
+    data = array(_COMPONENTS[accessor["componentType"]])
+    data.frombytes(binary[view["byteOffset"]:view["byteOffset"] + view["byteLength"]])
+    assert len(data) == accessor["count"] * _WIDTH[accessor["type"]]
+    return accessor, data
+
+
+@pytest.fixture(scope="module")
+def result():
+    outline = BuildingOutline(vertices=[
+        Point2D(0, 0), Point2D(9000, 0), Point2D(9000, 4000),
+        Point2D(5000, 4000), Point2D(5000, 7000), Point2D(0, 7000),
+    ])
+    return calculate_scaffold(outline, HeightCondition())
+
+
+@pytest.mark.parametrize("lod", LOD_LEVELS)
+def test_glb_structure_and_accessor_bounds(result, lod):
+    glb = to_glb(pack_buffers(build_primitives(result, lod)), 1000.0, 2000.0, {"lod": lod})
+    document, binary = _parse_glb(glb)
+    _assert_no_empty_arrays(document)
+    assert document["buffers"][0]["byteLength"] == len(binary)
+    assert document["nodes"][0]["children"] == list(range(1, len(document["meshes"]) + 1))
+
+    for mesh in document["meshes"]:
+        primitive = mesh["primitives"][0]
+        position, positions = _accessor_data(document, binary, primitive["attributes"]["POSITION"])
+        _, indices = _accessor_data(document, binary, primitive["indices"])
+        for axis in range(3):
+            values = positions[axis::3]
+            assert position["min"][axis] == min(values)
+            assert position["max"][axis] == max(values)
+        assert len(indices) % 2 == 0
+        assert max(indices) < position["count"]
+
+
+@pytest.mark.parametrize("lod", LOD_LEVELS)
+def test_empty_result_omits_empty_arrays(lod):
+    glb = to_glb(pack_buffers(build_primitives(ScaffoldResult(members=[]), lod)))
+    document, binary = _parse_glb(glb)
+    assert binary == b""
+    _assert_no_empty_arrays(document)
+    for key in ("meshes", "accessors", "bufferViews", "buffers"):
+        assert key not in document
+    assert "children" not in document["nodes"][0]
+
+
+@pytest.mark.parametrize("lod", ("faces", "outline"))
+def test_l_shape_groups_by_scaffold_line_run(result, lod):
+    primitives = build_primitives(result, lod)
+    runs = {}
+    for prim in primitives:
+        xs, zs = prim.positions[0::3], prim.positions[2::3]
+        runs.setdefault(prim.extras["face"], []).append((xs, zs))
+
+    # L字の北面・東面はそれぞれ2本の足場ライン、南面・西面は1本
+    assert {face: len(items) for face, items in runs.items()} == {
+        "南面": 1, "北面": 2, "東面": 2, "西面": 1,
+    }
+    assert len({prim.name for prim in primitives}) == len(primitives)
+
+    # 各ランは足場ライン上（南北面は glTF の z、東西面は x が一定）にあり、建物内部を覆わない
+    lines = {"南面": set(), "北面": set(), "東面": set(), "西面": set()}
+    for m in result.members:
+        s = m.position_start
+        across = -s.y if m.face.value in ("南面", "北面") else s.x
+        lines[m.face.value].add(round(across * 0.001, 4))
+    for face, items in runs.items():
+        across = [set(zs) if face in ("南面", "北面") else set(xs) for xs, zs in items]
+        assert all(len(values) == 1 for values in across)
+        assert {round(next(iter(values)), 4) for values in across} == lines[face]
@@ -0,0 +1,84 @@
+"""
+足場計算サービスの正規化キャッシュのテスト
+"""
+import pytest
+
+from app.services.scaffold_service import ScaffoldService, canonicalize_outline
+from scaffold_logic import HeightCondition, NGArea, Point2D
+
+L_SHAPE = [(0, 0), (9000, 0), (9000, 4000), (5000, 4000), (5000, 7000), (0, 7000)]
+HEIGHT = HeightCondition(floor_count=2, floor_height=2850.0, eaves_height=5700.0)
+
+
+def _translated(points, dx, dy):
+    return [(x + dx, y + dy) for x, y in points]
+
+
+def _member_keys(result, dx=0.0, dy=0.0):
+    """部材を平行移動を戻した座標で比較できる形にする"""
+    return sorted(
+        (
+            m.member_type.value,
+            m.face.value,
+            m.length,
+            round(m.position_start.x - dx, 3),
+            round(m.position_start.y - dy, 3),
+            m.position_start.z,
+            round(m.position_end.x - dx, 3),
+            round(m.position_end.y - dy, 3),
+            m.position_end.z,
+        )
+        for m in result.members
+    )
+
+
+@pytest.mark.parametrize(
+    "variant",
+    [
+        _translated(L_SHAPE, 12345.5, -678.25),
+        L_SHAPE[3:] + L_SHAPE[:3],
+        list(reversed(L_SHAPE)),
+        _translated(list(reversed(L_SHAPE[2:] + L_SHAPE[:2])), -500, 250),
+        L_SHAPE + [L_SHAPE[0]],
+    ],
+    ids=["translated", "rotated", "reversed", "all", "closed"],
+)
+def test_equivalent_outlines_share_cache_entry(variant):
+    service = ScaffoldService()
+    base = service.calculate(L_SHAPE, HEIGHT)
+    other = service.calculate(variant, HEIGHT)
+
+    assert not base.cached
+    assert other.cached
+    assert other.key == base.key
+    assert len(service.cache) == 1
+
+    # 結果は呼び出し元の座標系に戻して返す
+    dx = min(x for x, _ in variant) - min(x for x, _ in L_SHAPE)
+    dy = min(y for _, y in variant) - min(y for _, y in L_SHAPE)
+    assert _member_keys(other.result, dx, dy) == _member_keys(base.result)
+
+
+def test_ng_areas_are_translated_with_outline():
+    service = ScaffoldService()
+    ng = [NGArea(min_point=Point2D(2000, -1500), max_point=Point2D(3500, 0))]
+    moved_ng = [NGArea(min_point=Point2D(3000, -1300), max_point=Point2D(4500, 200))]
+    base = service.calculate(L_SHAPE, HEIGHT, ng_areas=ng)
+    other = service.calculate(_translated(L_SHAPE, 1000, 200), HEIGHT, ng_areas=moved_ng)
+    assert other.cached and other.key == base.key
+    assert _member_keys(other.result, 1000, 200) == _member_keys(base.result)
+
+
+def test_different_outline_misses_cache():
+    service = ScaffoldService()
+    base = service.calculate(L_SHAPE, HEIGHT)
+    mirrored = service.calculate([(-x, y) for x, y in L_SHAPE], HEIGHT)
+    assert not mirrored.cached
+    assert mirrored.key != base.key
+
+
+def test_canonical_outline_is_counterclockwise_from_min_vertex():
+    canonical = canonicalize_outline(_translated(list(reversed(L_SHAPE)), 100, 200))
+    assert (canonical.offset_x, canonical.offset_y) == (100, 200)
+    assert canonical.vertices[0] == (0, 0)
+    assert canonical.vertices[1] == (9000, 0)
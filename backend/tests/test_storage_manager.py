@@ -0,0 +1,135 @@
+"""
+アップロード領域の容量管理（容量上限・LRU 削除・pin・走査）のテスト
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from app.services import storage_manager as storage_module
+from app.services.storage_manager import StorageManager
+
+OLD = time.time() - 86400
+
+
+def _write(root, name: str, size: int, age: int) -> None:
+    path = root / name
+    path.write_bytes(b"x" * size)
+    # age が大きいほど古いアクセス
+    os.utime(path, (OLD - age, OLD - age))
+
+
+@pytest.fixture
+def evicted_ids():
+    return []
+
+
+@pytest.fixture
+def manager(tmp_path, evicted_ids):
+    _write(tmp_path, "a.png", 100, 4)
+    _write(tmp_path, "a.outline.json", 20, 0)
+    _write(tmp_path, "b.png", 100, 3)
+    _write(tmp_path, "c.png", 100, 2)
+    _write(tmp_path, "d.png", 100, 1)
+    manager = StorageManager(
+        tmp_path, quota_bytes=300, low_watermark=0.5, cold_after=600.0,
+        on_evict=evicted_ids.append,
+    )
+    manager.scan()
+    return manager
+
+
+def _names(root):
+    return sorted(p.name for p in root.iterdir())
+
+
+def test_scan_records_usage_and_removes_orphans(tmp_path):
+    _write(tmp_path, "a.png", 100, 0)
+    _write(tmp_path, "a.outline.json", 20, 0)
+    _write(tmp_path, "gone.outline.json", 30, 0)
+    manager = StorageManager(tmp_path, quota_bytes=0)
+    manager.scan()
+    assert manager.usage == 120
+    assert _names(tmp_path) == ["a.outline.json", "a.png"]
+
+
+def test_evicts_least_recently_used_until_low_watermark(manager, tmp_path, evicted_ids):
+    assert manager.usage == 420 and manager.over_quota()
+    # 目標 150 bytes 以下になるまで古い順に削除し、元図面と一緒に派生ファイルも消す
+    assert manager.evict() == 4
+    assert _names(tmp_path) == ["d.png"]
+    assert manager.usage == 100
+    assert evicted_ids == ["a", "b", "c"]
+
+
+def test_recent_access_is_not_evicted(manager, tmp_path):
+    manager.touch("a.png")
+    manager.touch("b.png")
+    manager.evict()
+    # 派生ファイルは単独でも古ければ削除する
+    assert _names(tmp_path) == ["a.png", "b.png"]
+
+
+def test_pinned_drawing_is_not_evicted(manager, tmp_path):
+    with manager.pin("a"):
+        manager.evict()
+    assert _names(tmp_path) == ["a.outline.json", "a.png"]
+
+
+def test_under_quota_evicts_nothing(tmp_path):
+    _write(tmp_path, "a.png", 100, 0)
+    manager = StorageManager(tmp_path, quota_bytes=1000)
+    manager.scan()
+    assert manager.evict() == 0
+    assert _names(tmp_path) == ["a.png"]
+
+
+def test_unlink_runs_outside_lock_and_pin_waits_for_it(manager, tmp_path, monkeypatch):
+    unlinking, release = threading.Event(), threading.Event()
+    original_unlink = StorageManager._unlink
+
+    def slow_unlink(self, path):
+        if path.name == "a.png":
+            unlinking.set()
+            assert release.wait(5)
+        return original_unlink(self, path)
+
+    monkeypatch.setattr(StorageManager, "_unlink", slow_unlink)
+    evictor = threading.Thread(target=manager.evict)
+    evictor.start()
+    assert unlinking.wait(5)
+
+    # 削除中も他のファイルの記録はロックを待たずに行える
+    manager.touch("new.png", 10)
+
+    # 削除中の図面の pin は削除の完了を待つ
+    pinned = threading.Event()
+
+    def pin_a():
+        with manager.pin("a"):
+            pinned.set()
+            assert not (tmp_path / "a.png").exists()
+
+    pinner = threading.Thread(target=pin_a)
+    pinner.start()
+    assert not pinned.wait(0.2)
+    release.set()
+    evictor.join(5)
+    pinner.join(5)
+    assert pinned.is_set()
+
+
+def test_scan_keeps_files_recorded_while_scanning(manager, tmp_path, monkeypatch):
+    original_scandir = os.scandir
+
+    def scandir_then_upload(path):
+        it = original_scandir(path)
+        # 走査結果を取った後にアップロードが記録される
+        manager.touch("e.png", 50)
+        return it
+
+    monkeypatch.setattr(storage_module.os, "scandir", scandir_then_upload)
+    manager.scan()
+    assert manager.usage == 420 + 50
+    assert "e.png" in manager._entries
@@ -1,20 +1,63 @@
 """
 足場割付計算ロジック パッケージ
 """
-from .core import calculate_scaffold
+from .clash import RoofBVH, RoofSolid, detect_roof_clashes, roof_solids
+from .core import (
+    calculate_scaffold,
+    floor_polygons,
+    get_scaffold_summary,
+    ridge_along_x,
+    split_spans,
+)
+from .geometry import IntOutline
+from .rectilinear import level_footprints, offset_polygon, offset_region
+from .spatial import NGAreaIndex, MemberGridIndex, point_in_polygon
 from .types import (
     BuildingOutline,
+    CostModel,
     HeightCondition,
+    RoofClash,
+    RoofSpec,
+    ScaffoldSpec,
     ScaffoldResult,
+    LayoutCost,
     ScaffoldMember,
     MemberType,
+    FaceDirection,
+    NGArea,
+    Point2D,
+    Point3D,
 )
 
 __all__ = [
     "calculate_scaffold",
+    "get_scaffold_summary",
+    "split_spans",
+    "floor_polygons",
+    "ridge_along_x",
+    "detect_roof_clashes",
+    "roof_solids",
+    "RoofBVH",
+    "RoofSolid",
+    "IntOutline",
+    "level_footprints",
+    "offset_polygon",
+    "offset_region",
+    "NGAreaIndex",
+    "MemberGridIndex",
+    "point_in_polygon",
     "BuildingOutline",
+    "CostModel",
     "HeightCondition",
+    "RoofClash",
+    "RoofSpec",
+    "ScaffoldSpec",
     "ScaffoldResult",
+    "LayoutCost",
     "ScaffoldMember",
     "MemberType",
+    "FaceDirection",
+    "NGArea",
+    "Point2D",
+    "Point3D",
 ]
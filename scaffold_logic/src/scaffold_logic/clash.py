@@ -0,0 +1,438 @@
+"""
+足場部材と屋根の干渉チェック
+
+屋根条件（RoofSpec）と各階の外形から屋根の立体を作り、足場部材の線分との干渉を求める。
+
+- 屋根の範囲は直角多角形に含まれる極大矩形の集まりとし、矩形ごとに軒出・ケラバを含めた
+  凸多面体（半空間の積）で表す。屋根はそれらの和で、寄棟は外形からの距離（軸方向の
+  チェビシェフ距離）で上る面、切妻の入隅は矩形ごとの屋根の交線が谷になる。
+  最上階の外周に本屋根、下の階で上の階からはみ出した部分に下屋を置く
+- 棟の向きは屋根を架ける階の外周から ridge_along_x で決める（足場ラインのケラバ側の判定と同じ）。
+  片流れは座標の大きい側を高くする
+- 屋根の立体は外接箱の BVH に登録し、部材の線分は numpy の配列演算でまとめて検索する
+  （ノードごとに外接箱の重なりで候補を絞り、葉で凸多面体との交差区間を求める）
+- 部材ごとに、高さを変えるかスパンを詰めるかのうち調整量の小さい方を調整案とする
+"""
+import math
+from dataclasses import dataclass
+from itertools import chain
+from typing import TYPE_CHECKING, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .core import floor_polygons, ridge_along_x
+from .geometry import IntOutline, bounding_box
+from .rectilinear import Polygon, difference, level_footprints
+from .types import BuildingOutline, HeightCondition, RoofClash, RoofSpec, ScaffoldResult
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 勾配・棟高さの指定が無い勾配屋根の勾配（4寸勾配）
+DEFAULT_ROOF_SLOPE = 0.4
+
+# 屋根の厚み（軒先の下端から屋根面まで、mm）
+ROOF_THICKNESS = 200.0
+
+# これより短い食い込みは干渉としない（mm）
+CLASH_TOLERANCE = 1.0
+
+# 長さ比較の許容誤差（mm）
+EPS = 1e-6
+
+Rect = Tuple[int, int, int, int]  # (x0, y0, x1, y1)
+Plane = Tuple[float, float, float, float]  # a x + b y + c z <= d
+
+
+def _np():
+    import numpy
+
+    return numpy
+
+
+@dataclass
+class RoofSolid:
+    """屋根の立体（凸多面体）"""
+    planes: "np.ndarray"              # 半空間 (a, b, c, d) の配列（a x + b y + c z <= d）
+    lo: Tuple[float, float, float]    # 外接箱の最小座標
+    hi: Tuple[float, float, float]    # 外接箱の最大座標
+    floor: int                        # 屋根の階（最上階以外は下屋）
+
+
+def _rectangles(polygons: Sequence[Polygon]) -> List[Rect]:
+    """
+    直角多角形（穴を含む）に含まれる極大矩形（どの方向にも広げられない矩形）を全て求める
+
+    多角形に含まれる軸平行な矩形（正方形を含む）は必ずいずれかの極大矩形に含まれるため、
+    極大矩形ごとの屋根の立体の和が外形全体の屋根になる。
+    頂点座標で区切った格子のセルの内外を求め、列の範囲ごとに全て内側の行の連続区間を列挙する。
+    """
+    edges = [
+        (min(x1, x2), max(x1, x2), y1)
+        for polygon in polygons
+        for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1])
+        if y1 == y2 and x1 != x2
+    ]
+    xs = sorted({x for polygon in polygons for x, _ in polygon})
+    ys = sorted({y for polygon in polygons for _, y in polygon})
+    row = {y: j for j, y in enumerate(ys)}
+
+    # inside[i][j]: x 方向 i 番目・y 方向 j 番目のセルが内側か
+    inside: List[List[bool]] = []
+    for xa, xb in zip(xs, xs[1:]):
+        mid = (xa + xb) / 2.0
+        crossings = sorted(y for lo, hi, y in edges if lo < mid < hi)
+        column = [False] * (len(ys) - 1)
+        for y0, y1 in zip(crossings[::2], crossings[1::2]):
+            for j in range(row[y0], row[y1]):
+                column[j] = True
+        inside.append(column)
+
+    columns, rows = len(inside), len(ys) - 1
+    rects: List[Rect] = []
+    for i0 in range(columns):
+        filled = [True] * rows  # 列 i0..i1 で全て内側の行
+        for i1 in range(i0, columns):
+            filled = [f and c for f, c in zip(filled, inside[i1])]
+            if not any(filled):
+                break
+            j = 0
+            while j < rows:
+                if not filled[j]:
+                    j += 1
+                    continue
+                j0 = j
+                while j < rows and filled[j]:
+                    j += 1
+                # 左右に広げられる場合は極大でない（上下は連続区間なので極大）
+                if i0 > 0 and all(inside[i0 - 1][j0:j]):
+                    continue
+                if i1 + 1 < columns and all(inside[i1 + 1][j0:j]):
+                    continue
+                rects.append((xs[i0], ys[j0], xs[i1 + 1], ys[j]))
+    return rects
+
+
+def _roof_slope(roof: RoofSpec, depth: float, eaves_height: float) -> float:
+    """屋根勾配（tan）。傾斜角度、棟高さと奥行き、既定値の順に決める"""
+    if roof.roof_type == "flat":
+        return 0.0
+    if roof.slope_angle is not None:
+        return math.tan(math.radians(roof.slope_angle))
+    if roof.ridge_height is not None and depth > 0:
+        run = depth if roof.roof_type == "shed" else depth / 2.0
+        return max(0.0, (roof.ridge_height - eaves_height) / run)
+    return DEFAULT_ROOF_SLOPE
+
+
+def _rect_solid(
+    rect: Rect,
+    roof: RoofSpec,
+    eaves_height: float,
+    slope: float,
+    cap: Optional[float],
+) -> Tuple[List[Plane], List[float], List[float]]:
+    """
+    棟が x 方向の矩形1つ分の屋根の半空間と外接箱
+
+    y 方向の両辺を軒、x 方向の両端をケラバ（寄棟・陸屋根は軒）とする。
+    屋根面は軒の壁面位置で軒高、軒先の下端を水平な底面とする（箱軒）。
+    """
+    x0, y0, x1, y1 = rect
+    kind = roof.roof_type
+    e, t = eaves_height, slope
+    eave = roof.eave_overhang
+    end = roof.gable_overhang if kind in ("gable", "shed") else eave
+    bottom = e - t * eave - ROOF_THICKNESS
+    planes: List[Plane] = [
+        (-1.0, 0.0, 0.0, -(x0 - end)),
+        (1.0, 0.0, 0.0, x1 + end),
+        (0.0, -1.0, 0.0, -(y0 - eave)),
+        (0.0, 1.0, 0.0, y1 + eave),
+        (0.0, 0.0, -1.0, -bottom),
+    ]
+    if kind == "flat":
+        top = max(e, cap) if cap is not None else e
+        planes.append((0.0, 0.0, 1.0, top))
+    else:
+        # y0 側の軒から上る屋根面
+        planes.append((0.0, -t, 1.0, e - t * y0))
+        if kind == "shed":
+            top = e + t * (y1 - y0 + eave)
+        else:
+            planes.append((0.0, t, 1.0, e + t * y1))
+            half = (y1 - y0) / 2.0
+            if kind == "hip":
+                planes.append((-t, 0.0, 1.0, e - t * x0))
+                planes.append((t, 0.0, 1.0, e + t * x1))
+                half = min(half, (x1 - x0) / 2.0)
+            top = e + t * half
+        if cap is not None:
+            planes.append((0.0, 0.0, 1.0, cap))
+            top = min(top, cap)
+    lo = [x0 - end, y0 - eave, bottom]
+    hi = [x1 + end, y1 + eave, max(top, bottom)]
+    return planes, lo, hi
+
+
+def roof_solids(
+    outline: BuildingOutline,
+    height_condition: HeightCondition,
+    roof: RoofSpec,
+    floor_outlines: Optional[Mapping[int, BuildingOutline]] = None,
+    clearance: float = 0.0,
+) -> List[RoofSolid]:
+    """
+    屋根の立体を作る
+
+    最上階の外周に軒高で本屋根を、下の階で上の階からはみ出した部分にその階の天端高さで
+    下屋を置く。棟高さは本屋根にのみ適用する。
+
+    Args:
+        outline: 建物外周ポリライン（1階の外形）
+        height_condition: 高さ条件
+        roof: 屋根条件
+        floor_outlines: 階 → 外形（1階と異なる階のみ）
+        clearance: 部材と屋根の間に確保する距離（mm、立体をこの分だけ膨らませる）
+
+    Returns:
+        List[RoofSolid]: 屋根の立体
+    """
+    np = _np()
+    floor_count = max(1, height_condition.floor_count)
+    footprints = level_footprints(floor_polygons(outline, floor_outlines or {}, floor_count))
+
+    main = footprints[floor_count]
+    if not main:
+        return []
+    min_x, min_y, max_x, max_y = bounding_box(IntOutline.from_polygon(p) for p in main)
+    slope = _roof_slope(
+        roof, min(max_x - min_x, max_y - min_y), height_condition.eaves_height
+    )
+
+    # (階, 屋根の範囲, 棟の向きを決める外周, 軒高, 高さの上限)
+    regions: List[Tuple[int, List[Polygon], List[Polygon], float, Optional[float]]] = [
+        (floor_count, main, main, height_condition.eaves_height, roof.ridge_height)
+    ]
+    for floor in range(1, floor_count):
+        lower = difference(footprints[floor], footprints[floor + 1])
+        if lower:
+            regions.append(
+                (floor, lower, footprints[floor], floor * height_condition.floor_height, None)
+            )
+
+    solids: List[RoofSolid] = []
+    for floor, polygons, footprint, eaves_height, cap in regions:
+        # 下屋の短冊の形ではなくその階の外周で決め、足場ラインの軒・ケラバ側と揃える
+        along_x = ridge_along_x(footprint)
+        if not along_x:
+            # 棟が y 方向の場合は x と y を入れ替えて同じ形で作る
+            polygons = [[(y, x) for x, y in polygon] for polygon in polygons]
+        for rect in _rectangles(polygons):
+            planes, lo, hi = _rect_solid(rect, roof, eaves_height, slope, cap)
+            array = np.array(planes, dtype=np.float64)
+            if not along_x:
+                array[:, [0, 1]] = array[:, [1, 0]]
+                lo[0], lo[1], hi[0], hi[1] = lo[1], lo[0], hi[1], hi[0]
+            # 各半空間を法線方向に clearance だけ外へずらす（底面・側面は軸に垂直なので
+            # 外接箱も clearance だけ、屋根面の上側は法線の傾きの分だけ広げる）
+            norms = np.linalg.norm(array[:, :3], axis=1)
+            array[:, 3] += clearance * norms
+            rise = clearance * float(norms.max())
+            solids.append(RoofSolid(
+                planes=array,
+                lo=(lo[0] - clearance, lo[1] - clearance, lo[2] - clearance),
+                hi=(hi[0] + clearance, hi[1] + clearance, hi[2] + rise),
+                floor=floor,
+            ))
+    return solids
+
+
+class RoofBVH:
+    """
+    屋根の立体の外接箱による BVH
+
+    ノードは配列で保持し、線分の集まりを根からまとめて絞り込む
+    （各ノードで外接箱が重なる線分だけを子に渡す）。
+    """
+
+    def __init__(self, solids: Sequence[RoofSolid]):
+        """
+        初期化
+
+        Args:
+            solids: 登録する屋根の立体
+        """
+        np = _np()
+        self.solids = list(solids)
+        self._node_lo: List["np.ndarray"] = []
+        self._node_hi: List["np.ndarray"] = []
+        self._children: List[Tuple[int, int]] = []
+        self._leaf: List[int] = []
+        if self.solids:
+            lo = np.array([s.lo for s in self.solids], dtype=np.float64)
+            hi = np.array([s.hi for s in self.solids], dtype=np.float64)
+            self._build(np.arange(len(self.solids)), lo, hi)
+
+    def _build(self, items: "np.ndarray", lo: "np.ndarray", hi: "np.ndarray") -> int:
+        """外接箱の最も長い軸で中心座標の中央値により2分割する"""
+        np = _np()
+        node = len(self._leaf)
+        node_lo, node_hi = lo[items].min(axis=0), hi[items].max(axis=0)
+        self._node_lo.append(node_lo)
+        self._node_hi.append(node_hi)
+        self._children.append((-1, -1))
+        self._leaf.append(-1)
+        if len(items) == 1:
+            self._leaf[node] = int(items[0])
+            return node
+        axis = int(np.argmax(node_hi - node_lo))
+        centers = (lo[items, axis] + hi[items, axis]) / 2.0
+        ordered = items[np.argsort(centers, kind="stable")]
+        half = len(ordered) // 2
+        left = self._build(ordered[:half], lo, hi)
+        right = self._build(ordered[half:], lo, hi)
+        self._children[node] = (left, right)
+        return node
+
+    def query(self, p0: "np.ndarray", p1: "np.ndarray") -> Iterator[Tuple[int, "np.ndarray"]]:
+        """
+        線分と外接箱が重なる立体を検索する
+
+        Args:
+            p0: 線分の始点（線分数 × 3）
+            p1: 線分の終点（線分数 × 3）
+
+        Yields:
+            (立体の番号, 外接箱が重なる線分の番号の配列)
+        """
+        np = _np()
+        if not self.solids or not len(p0):
+            return
+        seg_lo, seg_hi = np.minimum(p0, p1), np.maximum(p0, p1)
+        stack = [(0, np.arange(len(p0)))]
+        while stack:
+            node, idx = stack.pop()
+            overlaps = (
+                (seg_lo[idx] <= self._node_hi[node]) & (seg_hi[idx] >= self._node_lo[node])
+            ).all(axis=1)
+            idx = idx[overlaps]
+            if not len(idx):
+                continue
+            solid = self._leaf[node]
+            if solid >= 0:
+                yield solid, idx
+            else:
+                left, right = self._children[node]
+                stack.append((right, idx))
+                stack.append((left, idx))
+
+    def __len__(self) -> int:
+        return len(self.solids)
+
+
+def _clip(
+    planes: "np.ndarray", p0: "np.ndarray", p1: "np.ndarray"
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    線分を凸多面体で切り取る（Cyrus-Beck 法）
+
+    Returns:
+        線分上の媒介変数で表した内側の区間 (t_enter, t_exit)。交差しない線分は t_enter > t_exit
+    """
+    np = _np()
+    normals, d = planes[:, :3], planes[:, 3]
+    num = d - p0 @ normals.T
+    den = (p1 - p0) @ normals.T
+    parallel = np.abs(den) <= 1e-12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = num / np.where(parallel, 1.0, den)
+    t_enter = np.where(~parallel & (den < 0), t, -np.inf).max(axis=1, initial=0.0)
+    t_exit = np.where(~parallel & (den > 0), t, np.inf).min(axis=1, initial=1.0)
+    # 平面と平行で外側にある（境界に接するだけのものを含む）線分は交差しない
+    t_exit[(parallel & (num < CLASH_TOLERANCE)).any(axis=1)] = -np.inf
+    return t_enter, t_exit
+
+
+def detect_roof_clashes(
+    result: ScaffoldResult,
+    outline: BuildingOutline,
+    height_condition: HeightCondition,
+    roof: RoofSpec,
+    floor_outlines: Optional[Mapping[int, BuildingOutline]] = None,
+    clearance: float = 0.0,
+) -> List[RoofClash]:
+    """
+    足場部材と屋根の干渉を検出し、部材ごとに調整案を返す
+
+    支柱は屋根に入っている側の端を動かす（height。上端が入っていれば屋根の下端まで下げ、
+    下端が入っていれば屋根から出るまで上げる）。それ以外の部材は、屋根の下端まで下げる量と
+    屋根に入っている側の端から詰める量（span）のうち小さい方を調整案とする。
+    1本の部材が複数の立体と干渉する場合は調整量の絶対値が最も大きいものを返す。
+
+    Args:
+        result: 足場計算結果
+        outline: 建物外周ポリライン（1階の外形）
+        height_condition: 高さ条件
+        roof: 屋根条件
+        floor_outlines: 階 → 外形（1階と異なる階のみ）
+        clearance: 部材と屋根の間に確保する距離（mm）
+
+    Returns:
+        List[RoofClash]: 干渉（部材の順）
+    """
+    members = result.members
+    if not members:
+        return []
+    solids = roof_solids(outline, height_condition, roof, floor_outlines, clearance)
+    if not solids:
+        return []
+
+    np = _np()
+    flat = chain.from_iterable(
+        (m.position_start.x, m.position_start.y, m.position_start.z,
+         m.position_end.x, m.position_end.y, m.position_end.z)
+        for m in members
+    )
+    coords = np.fromiter(flat, dtype=np.float64, count=6 * len(members)).reshape(-1, 6)
+    p0, p1 = coords[:, :3], coords[:, 3:]
+
+    clashes: Dict[int, RoofClash] = {}
+    for solid_index, idx in RoofBVH(solids).query(p0, p1):
+        solid = solids[solid_index]
+        t_enter, t_exit = _clip(solid.planes, p0[idx], p1[idx])
+        lengths = np.linalg.norm(p1[idx] - p0[idx], axis=1)
+        overlaps = (t_exit - t_enter) * lengths
+        hit = overlaps > CLASH_TOLERANCE
+        rows = zip(
+            idx[hit].tolist(), t_enter[hit].tolist(), t_exit[hit].tolist(),
+            overlaps[hit].tolist(), lengths[hit].tolist(),
+        )
+        for i, t0, t1, overlap, length in rows:
+            member = members[i]
+            start, end = member.position_start, member.position_end
+            top, base = max(start.z, end.z), min(start.z, end.z)
+            if abs(start.x - end.x) < EPS and abs(start.y - end.y) < EPS:
+                z0 = start.z + (end.z - start.z) * t0
+                z1 = start.z + (end.z - start.z) * t1
+                if min(z0, z1) <= base + EPS and max(z0, z1) < top - EPS:
+                    # 下端だけが屋根に入っている場合は屋根から出るまで上げる
+                    adjustment, amount = "height", max(z0, z1) - base
+                else:
+                    adjustment, amount = "height", min(z0, z1) - top
+            else:
+                lower = top - solid.lo[2]
+                trim = min(t1, 1.0 - t0) * length
+                if lower <= trim:
+                    adjustment, amount = "height", -lower
+                else:
+                    adjustment, amount = "span", trim
+            current = clashes.get(i)
+            if current is None or abs(amount) > abs(current.amount):
+                clashes[i] = RoofClash(
+                    member_index=i,
+                    member=member,
+                    floor=solid.floor,
+                    overlap=round(overlap, 1),
+                    adjustment=adjustment,
+                    amount=round(amount, 1),
+                )
+    return [clashes[i] for i in sorted(clashes)]
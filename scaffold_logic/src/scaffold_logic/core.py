@@ -4,37 +4,79 @@
 このモジュールは既存の足場計算ロジックをラップし、
 外周ポリラインから足場配置を算出する機能を提供します。
 """
-from typing import List, Optional
+import math
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
 
+from .geometry import IntOutline, bounding_box
+from .optimizer import RunLayout, SpanRun, optimize_runs
+from .profiling import profiled
+from .rectilinear import Polygon, level_footprints, offset_region
+from .spatial import NGAreaIndex
 from .types import (
     BuildingOutline,
+    CostModel,
+    LayoutCost,
     HeightCondition,
+    RoofSpec,
     ScaffoldSpec,
     ScaffoldResult,
     ScaffoldMember,
     MemberType,
     FaceDirection,
+    NGArea,
+    Point2D,
     Point3D,
 )
 
+# 長さ比較の許容誤差（mm）
+EPS = 1e-6
 
+Interval = Tuple[float, float]
+
+# 足場の段: (外周, 支柱の下端高さ, 支柱の上端高さ, 布材の高さ)
+Stage = Tuple[List[Polygon], float, float, List[float]]
+
+# 割付対象の区間: (面, 辺の始点, 辺の終点, 区間の始点距離, 区間の終点距離, 段)
+_Run = Tuple[FaceDirection, Point2D, Point2D, float, float, Stage]
+
+
+@profiled()
 def calculate_scaffold(
     outline: BuildingOutline,
     height_condition: HeightCondition,
     scaffold_spec: Optional[ScaffoldSpec] = None,
-    ng_areas: Optional[List] = None,
+    ng_areas: Optional[List[NGArea]] = None,
+    floor_outlines: Optional[Mapping[int, BuildingOutline]] = None,
+    roof: Optional[RoofSpec] = None,
+    cost_model: Optional[CostModel] = None,
+    time_budget: float = 2.0,
+    max_workers: Optional[int] = None,
 ) -> ScaffoldResult:
     """
     足場の自動割付を行う
 
+    階ごとの外形が与えられた場合は、各階の外周（その階以上の外形の和）に沿って割り付け、
+    外周が変わる高さで支柱を段切りする。
+    足場ラインは外周を辺ごとの離れ（外壁からの離れ、軒先・ケラバのクリアランス）で
+    外側へオフセットした線とする。
+
+    cost_model を指定すると最適化モードとなり、区間ごとにスパンの組み合わせ・並び順・
+    残りの位置を分枝限定法で探索して、コスト最小の割付とコスト内訳を返す。
+
     Args:
-        outline: 建物外周ポリライン（直角多角形）
+        outline: 建物外周ポリライン（直角多角形、1階の外形）
         height_condition: 高さ条件（階数、階高、軒高など）
         scaffold_spec: 足場仕様テンプレート（省略時はデフォルト値）
         ng_areas: 足場設置禁止エリア（開口など）
+        floor_outlines: 階 → 外形（下屋・バルコニー等で1階と異なる階のみ。
+            指定の無い階は直下の階の外形を使う）
+        roof: 屋根条件（省略時は軒出・ケラバなしとして外壁からの離れのみ取る）
+        cost_model: 最適化モードのコストモデル（省略時は長いスパンから貪欲に割り付ける）
+        time_budget: 最適化モードの探索時間の上限（秒）
+        max_workers: 最適化モードのワーカープロセス数（None は CPU 数）
 
     Returns:
-        ScaffoldResult: 足場部材の配置情報と数量集計用データ
+        ScaffoldResult: 足場部材の配置情報と数量集計用データ（最適化モードではコスト内訳付き）
     """
     if scaffold_spec is None:
         scaffold_spec = ScaffoldSpec()
@@ -42,35 +84,313 @@ def calculate_scaffold(
     if ng_areas is None:
         ng_areas = []
     
-    # TODO: 既存の足場計算ロジックを呼び出す
-    # 現在はダミーの結果を返す
-    
+    # NG エリアはグリッドに登録し、各面の区間ごとに検索する
+    ng_index = NGAreaIndex(ng_areas, cell_size=scaffold_spec.standard_span)
+    levels = _ledger_heights(height_condition, scaffold_spec)
+
+    runs: List[_Run] = []
+    for stage in _stages(outline, floor_outlines or {}, height_condition, levels):
+        footprint = stage[0]
+        line = offset_region(footprint, _edge_standoffs(footprint, scaffold_spec, roof))
+        # 足場ラインの各辺の設置可能区間を割付対象とする
+        for face, start, end in _perimeter_faces(line):
+            free = _free_intervals(start, end, ng_index, scaffold_spec.scaffold_width)
+            runs.extend((face, start, end, t0, t1, stage) for t0, t1 in free)
+
+    if cost_model is None:
+        layouts = [
+            RunLayout(spans=split_spans(t1 - t0, scaffold_spec.available_spans))
+            for _, _, _, t0, t1, _ in runs
+        ]
+    else:
+        layouts = optimize_runs(
+            [_span_run(run) for run in runs],
+            scaffold_spec.available_spans,
+            cost_model,
+            time_budget,
+            max_workers,
+        )
+
     members: List[ScaffoldMember] = []
-    
-    # 外接矩形を取得
-    min_pt, max_pt = outline.get_bounding_box()
-    width = max_pt.x - min_pt.x
-    depth = max_pt.y - min_pt.y
-    
-    # ダミーの支柱を配置（四隅）
-    corners = [
-        (min_pt.x, min_pt.y, FaceDirection.SOUTH),
-        (max_pt.x, min_pt.y, FaceDirection.EAST),
-        (max_pt.x, max_pt.y, FaceDirection.NORTH),
-        (min_pt.x, max_pt.y, FaceDirection.WEST),
-    ]
-    
-    for x, y, face in corners:
-        # 支柱を追加
+    # 支柱の重複排除は段ごとに行う（段切り位置では上下に別部材となる）
+    column_positions: Dict[int, Set[Tuple[float, float]]] = {}
+    for (face, start, end, t0, _, stage), layout in zip(runs, layouts):
+        _, z0, z1, stage_levels = stage
+        _place_interval(
+            face, start, end, t0 + layout.offset, layout.spans,
+            (z0, z1), stage_levels,
+            members, column_positions.setdefault(id(stage), set()),
+        )
+
+    result = ScaffoldResult(members=members)
+    if cost_model is not None:
+        result.cost = _layout_cost(result, layouts, cost_model)
+    return result
+
+
+def _span_run(run: _Run) -> SpanRun:
+    """割付対象の区間を最適化の入力に変換"""
+    _, start, end, t0, t1, stage = run
+    face_length = math.hypot(end.x - start.x, end.y - start.y)
+    return SpanRun(
+        length=round(t1 - t0, 3),
+        level_count=len(stage[3]),
+        start_at_corner=t0 < EPS,
+        end_at_corner=t1 > face_length - EPS,
+    )
+
+
+def _layout_cost(
+    result: ScaffoldResult, layouts: List[RunLayout], cost_model: CostModel
+) -> LayoutCost:
+    """区間ごとのコストを合計する（支柱は隅での共有を反映した実際の本数で数える）"""
+    breakdown: Dict[str, float] = {}
+    for layout in layouts:
+        for name, value in layout.costs.items():
+            breakdown[name] = breakdown.get(name, 0.0) + value
+    columns = sum(1 for m in result.members if m.member_type == MemberType.COLUMN)
+    breakdown["columns"] = columns * cost_model.column_cost
+    return LayoutCost(
+        total=sum(breakdown.values()),
+        breakdown=breakdown,
+        timed_out=any(layout.timed_out for layout in layouts),
+        nodes=sum(layout.nodes for layout in {id(x): x for x in layouts}.values()),
+    )
+
+
+def split_spans(length: float, available_spans: Sequence[float]) -> List[float]:
+    """
+    区間長を使用可能スパンで分割する（長いスパンから貪欲に採用）
+
+    Args:
+        length: 区間長（mm）
+        available_spans: 使用可能なスパン長（mm）
+
+    Returns:
+        List[float]: 採用したスパン長の列（最小スパン未満の端数は割り付けない）
+    """
+    spans = sorted({float(s) for s in available_spans if s > 0}, reverse=True)
+    result: List[float] = []
+    remaining = length
+    for span in spans:
+        while remaining >= span - EPS:
+            result.append(span)
+            remaining -= span
+    return result
+
+
+def _ledger_heights(height_condition: HeightCondition, scaffold_spec: ScaffoldSpec) -> List[float]:
+    """布材を架ける高さの一覧（階高ピッチごと、軒高まで）"""
+    count = max(1, math.ceil(height_condition.eaves_height / scaffold_spec.floor_pitch - EPS))
+    return [scaffold_spec.floor_pitch * (k + 1) for k in range(count)]
+
+
+def floor_polygons(
+    outline: BuildingOutline,
+    floor_outlines: Mapping[int, BuildingOutline],
+    floor_count: int,
+) -> Dict[int, Polygon]:
+    """階 → 外形（整数 mm）。指定の無い階は直下の階の外形を引き継ぐ"""
+    polygons: Dict[int, Polygon] = {}
+    current = IntOutline.from_points(outline.vertices).vertices()
+    for floor in range(1, max(1, floor_count) + 1):
+        if floor in floor_outlines:
+            current = IntOutline.from_points(floor_outlines[floor].vertices).vertices()
+        polygons[floor] = current
+    return polygons
+
+
+def ridge_along_x(footprint: Sequence[Polygon]) -> bool:
+    """
+    棟が x 方向か（外周の外接矩形の長辺方向とみなす）
+
+    足場ラインのケラバ側の判定と屋根の干渉チェックで同じ向きを使うため、
+    いずれもその階の外周（level_footprints の値）を渡す。
+    """
+    min_x, min_y, max_x, max_y = bounding_box(
+        IntOutline.from_polygon(polygon) for polygon in footprint
+    )
+    return max_x - min_x >= max_y - min_y
+
+
+def _stages(
+    outline: BuildingOutline,
+    floor_outlines: Mapping[int, BuildingOutline],
+    height_condition: HeightCondition,
+    levels: List[float],
+) -> List[Stage]:
+    """
+    布材の高さを、同じ外周を持つ連続した段にまとめる
+
+    各段（布材間の高さ範囲）は下端が属する階の外周を使う。
+    外周が変わらない限り1つの段にまとめ、支柱はその高さ範囲を1本で通す。
+    """
+    floor_count = max(1, height_condition.floor_count)
+    footprints = level_footprints(floor_polygons(outline, floor_outlines, floor_count))
+
+    floor_height = height_condition.floor_height
+    stages: List[Stage] = []
+    bottom = 0.0
+    for z in levels:
+        floor = int(bottom // floor_height) + 1 if floor_height > 0 else 1
+        footprint = footprints[min(floor, floor_count)]
+        if stages and stages[-1][0] == footprint:
+            prev_footprint, z0, _, stage_levels = stages[-1]
+            stages[-1] = (prev_footprint, z0, z, stage_levels + [z])
+        else:
+            stages.append((footprint, stages[-1][2] if stages else 0.0, z, [z]))
+        bottom = z
+
+    # 最上段の支柱は軒高まで
+    if stages:
+        footprint, z0, _, stage_levels = stages[-1]
+        stages[-1] = (footprint, z0, height_condition.eaves_height, stage_levels)
+    return stages
+
+
+def _edge_standoffs(
+    footprint: List[Polygon], scaffold_spec: ScaffoldSpec, roof: Optional[RoofSpec]
+) -> List[List[float]]:
+    """
+    外周の辺ごとの足場ラインまでの距離
+
+    外壁からの離れと、軒先・ケラバ＋クリアランスの大きい方を取る。
+    棟は外周の長辺方向とみなし、切妻・片流れでは棟に直交する辺をケラバ側とする。
+    """
+    base = scaffold_spec.wall_standoff
+    if roof is None or not footprint:
+        return [[base] * len(polygon) for polygon in footprint]
+
+    outlines = [IntOutline.from_polygon(polygon) for polygon in footprint]
+    along_x = ridge_along_x(footprint)
+    gabled = roof.roof_type in ("gable", "shed")
+
+    standoffs: List[List[float]] = []
+    for outline in outlines:
+        distances: List[float] = []
+        for _, y1, _, y2 in outline.edges():
+            horizontal = y1 == y2
+            is_gable_side = gabled and horizontal != along_x
+            overhang = roof.gable_overhang if is_gable_side else roof.eave_overhang
+            clearance = overhang + scaffold_spec.roof_clearance if overhang > 0 else 0.0
+            distances.append(max(base, clearance))
+        standoffs.append(distances)
+    return standoffs
+
+
+def _perimeter_faces(
+    footprint: List[Polygon],
+) -> List[Tuple[FaceDirection, Point2D, Point2D]]:
+    """
+    外周の各辺と面方向（各辺は始点の隅を受け持つ）
+
+    外周は反時計回り・中庭などの穴は時計回りなので、いずれも辺の右側が屋外になる。
+    """
+    faces: List[Tuple[FaceDirection, Point2D, Point2D]] = []
+    for polygon in footprint:
+        directions = IntOutline.from_polygon(polygon).face_directions()
+        for face, (x1, y1), (x2, y2) in zip(directions, polygon, polygon[1:] + polygon[:1]):
+            faces.append((face, Point2D(float(x1), float(y1)), Point2D(float(x2), float(y2))))
+    return faces
+
+
+def _free_intervals(
+    start: Point2D, end: Point2D, ng_index: NGAreaIndex, band: float
+) -> List[Interval]:
+    """
+    面に沿った区間のうち NG エリアに掛からない部分を求める
+
+    Args:
+        start: 面の始点
+        end: 面の終点
+        ng_index: NG エリアのインデックス
+        band: 面から両側に検索する幅（mm）
+
+    Returns:
+        List[Interval]: 始点からの距離で表した設置可能区間
+    """
+    horizontal = abs(start.y - end.y) < EPS
+    length = abs(end.x - start.x) if horizontal else abs(end.y - start.y)
+    if not len(ng_index):
+        return [(0.0, length)]
+
+    hits = ng_index.query(
+        min(start.x, end.x) - band, min(start.y, end.y) - band,
+        max(start.x, end.x) + band, max(start.y, end.y) + band,
+    )
+
+    # NG エリアを面の軸へ投影して禁止区間を作る
+    origin = start.x if horizontal else start.y
+    sign = 1.0 if (end.x if horizontal else end.y) >= origin else -1.0
+    blocked: List[Interval] = []
+    for area in hits:
+        lo, hi = (area.min_point.x, area.max_point.x) if horizontal else (
+            area.min_point.y, area.max_point.y
+        )
+        ta, tb = (lo - origin) * sign, (hi - origin) * sign
+        t0, t1 = max(0.0, min(ta, tb)), min(length, max(ta, tb))
+        if t1 > t0:
+            blocked.append((t0, t1))
+    blocked.sort()
+
+    free: List[Interval] = []
+    cursor = 0.0
+    for t0, t1 in blocked:
+        if t0 > cursor + EPS:
+            free.append((cursor, t0))
+        cursor = max(cursor, t1)
+    if length > cursor + EPS or not blocked:
+        free.append((cursor, length))
+    return free
+
+
+def _place_interval(
+    face: FaceDirection,
+    start: Point2D,
+    end: Point2D,
+    t0: float,
+    spans: Sequence[float],
+    column_range: Tuple[float, float],
+    levels: List[float],
+    members: List[ScaffoldMember],
+    column_positions: Set[Tuple[float, float]],
+) -> None:
+    """始点距離 t0 からスパン列を配置し、支柱（column_range の高さ範囲）と布材を追加する"""
+    z0, z1 = column_range
+    length = math.hypot(end.x - start.x, end.y - start.y)
+    ux, uy = ((end.x - start.x) / length, (end.y - start.y) / length) if length > EPS else (0, 0)
+
+    def at(t: float) -> Tuple[float, float]:
+        return (start.x + ux * t, start.y + uy * t)
+
+    def add_column(t: float) -> None:
+        x, y = at(t)
+        key = (round(x, 3), round(y, 3))
+        if key in column_positions:
+            return
+        column_positions.add(key)
         members.append(ScaffoldMember(
             member_type=MemberType.COLUMN,
-            length=height_condition.eaves_height,
+            length=z1 - z0,
             face=face,
-            position_start=Point3D(x, y, 0),
-            position_end=Point3D(x, y, height_condition.eaves_height),
+            position_start=Point3D(x, y, z0),
+            position_end=Point3D(x, y, z1),
         ))
-    
-    return ScaffoldResult(members=members)
+
+    t = t0
+    add_column(t)
+    for span in spans:
+        (x0, y0), (x1, y1) = at(t), at(t + span)
+        for z in levels:
+            members.append(ScaffoldMember(
+                member_type=MemberType.LEDGER,
+                length=span,
+                face=face,
+                position_start=Point3D(x0, y0, z),
+                position_end=Point3D(x1, y1, z),
+            ))
+        t += span
+        add_column(t)
 
 
 def get_scaffold_summary(result: ScaffoldResult) -> dict:
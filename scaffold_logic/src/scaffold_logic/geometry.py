@@ -0,0 +1,148 @@
+"""
+整数 mm 座標の幾何カーネル
+
+外形の頂点を連続した int64 配列（頂点数 × 2）で保持し、
+外接矩形・辺の列挙・向き（符号付き面積）・面方向の判定を numpy のベクトル演算で行う。
+
+- 座標は mm 単位の整数なので、直角多角形の辺の判定や頂点の一致は誤差なく比較できる
+- 頂点ごとの Python ループや Point2D の属性参照を避け、大きな外形でも配列演算1回で済ませる
+- numpy は起動時間を抑えるため初回利用時に読み込む
+"""
+from itertools import chain
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence, Tuple
+
+from .types import FaceDirection
+
+if TYPE_CHECKING:
+    import numpy as np
+
+Vertex = Tuple[int, int]
+
+# face_directions の面コード → 面方向
+_FACES = (FaceDirection.SOUTH, FaceDirection.NORTH, FaceDirection.EAST, FaceDirection.WEST)
+
+
+def _np():
+    import numpy
+
+    return numpy
+
+
+class IntOutline:
+    """整数 mm 座標の閉じた外形（頂点は連続重複・閉じ点なし）"""
+
+    __slots__ = ("coords",)
+
+    def __init__(self, coords: "np.ndarray"):
+        """
+        初期化
+
+        Args:
+            coords: 頂点座標（頂点数 × 2 の int64 配列、行が (x, y)）
+        """
+        np = _np()
+        self.coords = np.ascontiguousarray(coords, dtype=np.int64).reshape(-1, 2)
+
+    @classmethod
+    def from_points(cls, points: Iterable) -> "IntOutline":
+        """
+        頂点列から作る（mm に丸め、連続重複点・閉じ点は除去）
+
+        Args:
+            points: (x, y) タプル、または x / y 属性を持つ点の列
+        """
+        np = _np()
+        flat = chain.from_iterable((p.x, p.y) if hasattr(p, "x") else p for p in points)
+        # round() と同じ偶数丸め
+        coords = np.rint(np.fromiter(flat, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+        if len(coords) > 1:
+            changed = coords[1:] != coords[:-1]
+            keep = np.empty(len(coords), dtype=bool)
+            keep[0] = True
+            keep[1:] = changed[:, 0] | changed[:, 1]
+            coords = coords[keep]
+        if len(coords) > 1 and (coords[0] == coords[-1]).all():
+            coords = coords[:-1]
+        return cls(coords)
+
+    @classmethod
+    def from_polygon(cls, polygon: Sequence[Vertex]) -> "IntOutline":
+        """正規化済みの整数座標タプル列から作る（丸め・重複除去はしない）"""
+        np = _np()
+        flat = chain.from_iterable(polygon)
+        return cls(np.fromiter(flat, dtype=np.int64, count=2 * len(polygon)))
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    @property
+    def xs(self) -> "np.ndarray":
+        return self.coords[:, 0]
+
+    @property
+    def ys(self) -> "np.ndarray":
+        return self.coords[:, 1]
+
+    def vertices(self) -> List[Vertex]:
+        """頂点を (x, y) タプルの列で返す"""
+        return [(x, y) for x, y in self.coords.tolist()]
+
+    def _next(self) -> "np.ndarray":
+        """各辺の終点座標（1つずらした配列）"""
+        # np.roll より小さい配列でのオーバーヘッドが少ない
+        return _np().concatenate((self.coords[1:], self.coords[:1]))
+
+    def bounding_box(self) -> Tuple[int, int, int, int]:
+        """外接矩形 (min_x, min_y, max_x, max_y)（頂点なしは全て 0）"""
+        if not len(self.coords):
+            return 0, 0, 0, 0
+        (min_x, min_y), (max_x, max_y) = self.coords.min(axis=0), self.coords.max(axis=0)
+        return int(min_x), int(min_y), int(max_x), int(max_y)
+
+    def edges(self) -> List[Tuple[int, int, int, int]]:
+        """辺 (x1, y1, x2, y2) の列（最後の頂点から最初の頂点への辺を含む）"""
+        stacked = _np().hstack((self.coords, self._next()))
+        return list(map(tuple, stacked.tolist()))
+
+    def signed_area2(self) -> int:
+        """符号付き面積の2倍（反時計回りで正、整数で厳密）"""
+        nxt = self._next()
+        return int((self.xs * nxt[:, 1]).sum() - (nxt[:, 0] * self.ys).sum())
+
+    def orientation(self) -> int:
+        """向き（反時計回り 1 / 時計回り -1 / 面積 0 は 0）"""
+        area2 = self.signed_area2()
+        return (area2 > 0) - (area2 < 0)
+
+    def counterclockwise(self) -> "IntOutline":
+        """反時計回りに揃えた外形（既に反時計回りなら自身）"""
+        if self.orientation() >= 0:
+            return self
+        return IntOutline(self.coords[::-1])
+
+    def first_oblique_edge(self) -> Optional[int]:
+        """軸に平行でない最初の辺の番号（全て平行なら None）"""
+        deltas = self._next() - self.coords
+        oblique = _np().flatnonzero((deltas[:, 0] != 0) & (deltas[:, 1] != 0))
+        return int(oblique[0]) if len(oblique) else None
+
+    def face_directions(self) -> List[FaceDirection]:
+        """
+        各辺の面方向
+
+        +x 向きの辺を南面、-x 向きを北面、+y 向きを東面、-y 向きを西面とする
+        （反時計回りの外周・時計回りの穴では辺の右側が屋外）。
+        斜めの辺は x 成分を優先し、長さ 0 の辺は西面とする。
+        """
+        dx, dy = (self._next() - self.coords).T
+        codes = _np().where(dx != 0, dx < 0, 2 + (dy <= 0))
+        return list(map(_FACES.__getitem__, codes.tolist()))
+
+
+def bounding_box(outlines: Iterable[IntOutline]) -> Tuple[int, int, int, int]:
+    """複数の外形をまとめた外接矩形 (min_x, min_y, max_x, max_y)（頂点なしは全て 0）"""
+    boxes = [o.bounding_box() for o in outlines if len(o)]
+    if not boxes:
+        return 0, 0, 0, 0
+    min_xs, min_ys, max_xs, max_ys = zip(*boxes)
+    return min(min_xs), min(min_ys), max(max_xs), max(max_ys)
@@ -0,0 +1,255 @@
+"""
+足場割付の最適化（分枝限定法）
+
+面の設置可能区間（ラン）ごとに、使用可能スパンの組み合わせ・並び順・残り（端数）を
+置く位置をコストモデルに従って探索する。
+
+- スパンの組み合わせは長いスパンから本数を決める深さ優先探索とし、
+  「残り長さ × 残りの選択肢の最小単価」を下界として枝刈りする。
+  最初に到達する葉は貪欲割付（split_spans）と同じ解になるため、常に暫定解がある
+- 長さ・段数・隅の有無が同じランは1回だけ解く
+- 独立したランはワーカープロセスで並列に解き、時間制限に達した場合は
+  その時点の最良解を返す。ワーカープロセスはモジュール共通のプールを使い回し、
+  マルチスレッドのサーバーから fork しないよう forkserver（無い環境では spawn）で起動する
+"""
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .types import CostModel
+
+# 長さ比較の許容誤差（mm）
+EPS = 1e-6
+
+# 時間制限を確認するノード間隔
+_DEADLINE_CHECK_INTERVAL = 1024
+
+# これ未満のラン数ではワーカープロセスを起動しない
+_PARALLEL_MIN_RUNS = 4
+
+
+class SpanRun(NamedTuple):
+    """割付対象の区間（ラン）"""
+    length: float            # 区間長（mm）
+    level_count: int         # 布材の段数
+    start_at_corner: bool    # 始点が外周の隅か
+    end_at_corner: bool      # 終点が外周の隅か
+
+
+@dataclass
+class RunLayout:
+    """ランの割付結果"""
+    spans: List[float]                 # 始点側からのスパン列
+    offset: float = 0.0                # 始点側に置く残りの長さ（mm）
+    costs: Dict[str, float] = field(default_factory=dict)  # コスト内訳
+    nodes: int = 0                     # 探索したノード数
+    timed_out: bool = False            # 時間制限で打ち切ったか
+
+
+def _span_cost(span: float, level_count: int, model: CostModel) -> float:
+    """スパン1本（全段の布材と支柱1本）のコスト"""
+    ledger = model.member_cost + model.rental_cost_per_m * span / 1000.0
+    if span <= model.short_span_length + EPS:
+        ledger += model.short_span_penalty
+    return level_count * ledger + model.column_cost
+
+
+def _arrange(
+    run: SpanRun, spans: Sequence[float], counts: Sequence[int], model: CostModel
+) -> Tuple[List[float], int]:
+    """
+    スパンの並び順を決める（隅に短尺が接しないように長いスパンを隅側へ置く）
+
+    Returns:
+        Tuple[List[float], int]: 始点側からのスパン列と、隅に接する短尺の端の数
+    """
+    ordered = [s for s, c in zip(spans, counts) for _ in range(c)]  # 降順
+    if run.start_at_corner and run.end_at_corner:
+        # 長いものを両端、短いものを中央へ
+        ordered = ordered[0::2] + ordered[1::2][::-1]
+    elif run.end_at_corner:
+        ordered.reverse()
+
+    adjacent = 0
+    if ordered:
+        short = model.short_span_length + EPS
+        adjacent += run.start_at_corner and ordered[0] <= short
+        adjacent += run.end_at_corner and ordered[-1] <= short
+    return ordered, adjacent
+
+
+def _gap_placement(run: SpanRun, model: CostModel) -> Tuple[bool, float]:
+    """残りを置く側（始点側なら True）とその係数"""
+    start_factor = model.corner_gap_factor if run.start_at_corner else 1.0
+    end_factor = model.corner_gap_factor if run.end_at_corner else 1.0
+    if start_factor < end_factor:
+        return True, start_factor
+    return False, end_factor
+
+
+def solve_run(
+    run: SpanRun,
+    spans: Sequence[float],
+    model: CostModel,
+    deadline: Optional[float] = None,
+) -> RunLayout:
+    """
+    1つのランを分枝限定法で割り付ける
+
+    Args:
+        run: 割付対象の区間
+        spans: 使用可能なスパン長（降順）
+        model: コストモデル
+        deadline: 探索の打ち切り時刻（time.time() 基準、None は無制限）
+
+    Returns:
+        RunLayout: 最良の割付とコスト内訳
+    """
+    n = len(spans)
+    levels = run.level_count
+    gap_at_start, gap_factor = _gap_placement(run, model)
+    gap_unit = model.gap_cost_per_mm * gap_factor
+
+    costs = [_span_cost(s, levels, model) for s in spans]
+    # 位置 i 以降のスパンと残りの最小単価（下界用）
+    suffix_min = [gap_unit] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        suffix_min[i] = min(suffix_min[i + 1], costs[i] / spans[i])
+
+    counts = [0] * n
+    best_cost = math.inf
+    best_counts: List[int] = []
+    nodes = 0
+    timed_out = False
+
+    def leaf_cost(remaining: float) -> float:
+        total = sum(c * k for c, k in zip(costs, counts)) + model.column_cost
+        total += gap_unit * remaining
+        _, adjacent = _arrange(run, spans, counts, model)
+        return total + adjacent * levels * model.corner_short_span_penalty
+
+    def search(i: int, remaining: float, partial: float) -> None:
+        nonlocal best_cost, best_counts, nodes, timed_out
+        nodes += 1
+        if deadline is not None and nodes % _DEADLINE_CHECK_INTERVAL == 0:
+            timed_out = time.time() > deadline
+        if timed_out:
+            return
+        if partial + model.column_cost + remaining * suffix_min[i] >= best_cost - EPS:
+            return
+        if i == n:
+            total = leaf_cost(remaining)
+            if total < best_cost - EPS:
+                best_cost, best_counts = total, list(counts)
+            return
+        for count in range(int((remaining + EPS) // spans[i]), -1, -1):
+            counts[i] = count
+            search(i + 1, remaining - count * spans[i], partial + count * costs[i])
+        counts[i] = 0
+
+    search(0, run.length, 0.0)
+
+    ordered, adjacent = _arrange(run, spans, best_counts, model)
+    remaining = max(0.0, run.length - sum(ordered))
+    breakdown = {
+        "ledgers": 0.0,
+        "columns": model.column_cost * (len(ordered) + 1),
+        "short_spans": 0.0,
+        "corner_short_spans": adjacent * levels * model.corner_short_span_penalty,
+        "gaps": gap_unit * remaining,
+    }
+    for s in ordered:
+        ledger = model.member_cost + model.rental_cost_per_m * s / 1000.0
+        breakdown["ledgers"] += levels * ledger
+        if s <= model.short_span_length + EPS:
+            breakdown["short_spans"] += levels * model.short_span_penalty
+
+    return RunLayout(
+        spans=ordered,
+        offset=remaining if gap_at_start else 0.0,
+        costs=breakdown,
+        nodes=nodes,
+        timed_out=timed_out,
+    )
+
+
+_Task = Tuple[SpanRun, Tuple[float, ...], CostModel, Optional[float]]
+
+
+def _solve_task(task: _Task) -> RunLayout:
+    # ProcessPoolExecutor.map から呼ぶためモジュール直下に置く
+    return solve_run(*task)
+
+
+# ワーカー数 → ワーカープロセスのプール（初回利用時に起動し、以降は使い回す）
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return pool
+
+
+def _reset_pool(workers: int) -> None:
+    with _pool_lock:
+        pool = _pools.pop(workers, None)
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def optimize_runs(
+    runs: Sequence[SpanRun],
+    available_spans: Sequence[float],
+    model: CostModel,
+    time_budget: float = 2.0,
+    max_workers: Optional[int] = None,
+) -> List[RunLayout]:
+    """
+    ランの列をまとめて最適化する
+
+    Args:
+        runs: 割付対象の区間
+        available_spans: 使用可能なスパン長（mm）
+        model: コストモデル
+        time_budget: 探索時間の上限（秒）
+        max_workers: ワーカープロセス数（None は CPU 数、1 以下はプロセス内で解く）
+
+    Returns:
+        List[RunLayout]: runs と同じ順の割付結果（同条件のランは同じ結果を共有する）
+    """
+    spans = tuple(sorted({float(s) for s in available_spans if s > 0}, reverse=True))
+    deadline = time.time() + max(0.0, time_budget)
+    unique = list(dict.fromkeys(runs))
+
+    workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+    workers = min(workers, len(unique))
+
+    solved: Optional[List[RunLayout]] = None
+    if workers > 1 and len(unique) >= _PARALLEL_MIN_RUNS:
+        tasks = [(run, spans, model, deadline) for run in unique]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        try:
+            solved = list(_get_pool(workers).map(_solve_task, tasks, chunksize=chunksize))
+        except (OSError, BrokenProcessPool):
+            # ワーカーが落ちた・プロセスを起動できない環境ではプロセス内で解く
+            _reset_pool(workers)
+            solved = None
+    if solved is None:
+        solved = [solve_run(run, spans, model, deadline) for run in unique]
+
+    layouts = dict(zip(unique, solved))
+    return [layouts[run] for run in runs]
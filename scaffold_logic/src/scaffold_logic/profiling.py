@@ -0,0 +1,67 @@
+"""
+足場計算のプロファイリングフック
+
+環境変数 SCAFFOLD_PROFILE_DIR が設定されている場合のみ、
+対象関数を cProfile で計測して pstats ファイルを書き出す。
+未設定時は環境変数を1回参照するだけで元の関数を呼び出す。
+
+    SCAFFOLD_PROFILE_DIR=profiles python run_layout.py
+    python -m pstats profiles/calculate_scaffold-....pstats
+"""
+import cProfile
+import functools
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+PROFILE_DIR_ENV = "SCAFFOLD_PROFILE_DIR"
+
+_state = threading.local()
+
+
+def profiled(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    関数を SCAFFOLD_PROFILE_DIR 設定時のみプロファイルするデコレータ
+
+    入れ子の呼び出しやプロファイラ使用中のスレッドでは計測しない。
+
+    Args:
+        name: 出力ファイル名の接頭辞（省略時は関数名）
+    """
+
+    def decorator(func: F) -> F:
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            output_dir = os.environ.get(PROFILE_DIR_ENV)
+            if not output_dir or getattr(_state, "active", False):
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            _state.active = True
+            try:
+                profile.enable()
+            except ValueError:
+                # 他のプロファイラが動作中
+                _state.active = False
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                _state.active = False
+                directory = Path(output_dir)
+                directory.mkdir(parents=True, exist_ok=True)
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+                suffix = uuid.uuid4().hex[:8]
+                profile.dump_stats(str(directory / f"{label}-{stamp}-{suffix}.pstats"))
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
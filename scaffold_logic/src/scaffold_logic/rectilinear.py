@@ -0,0 +1,410 @@
+"""
+直角多角形（rectilinear polygon）の集合演算
+
+整数 mm 座標の直角多角形について、和（union）・差（difference）、
+階ごとの外周（下屋・バルコニーを含む各階の足場ライン）と、
+辺ごとの距離による外側へのオフセット（外壁からの離れ・軒先のクリアランス）を求める。
+
+アルゴリズムは x 方向の平面走査で、y 座標を座標圧縮した区間木（区間加算・最小値）上で
+「被覆数が 0 の区間」を列挙して境界となる縦辺を求める。
+各イベントは O(log n + k log n)（k は出力辺数）で処理でき、全体で O((n + k) log n)。
+縦辺から横辺を対応付けて閉路を復元し、外周は反時計回り・穴は時計回りで返す。
+入力の丸め・向き・辺の列挙は geometry の IntOutline で行う。
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple, Union
+
+from .geometry import IntOutline
+
+Vertex = Tuple[int, int]
+Polygon = List[Vertex]
+
+# 縦辺: (x, y0, y1, 値の増分)。y0 < y1
+_Edge = Tuple[int, int, int, int]
+
+
+def _vertical_edges(
+    outline: IntOutline, inside_delta: int, keep_orientation: bool = False
+) -> List[_Edge]:
+    """
+    多角形の縦辺を走査イベントに変換する
+
+    Args:
+        outline: 直角多角形
+        inside_delta: 走査線が多角形の内側に入るときの値の増分
+        keep_orientation: True なら頂点の向きをそのまま使う（時計回りの穴は値を減らす）
+    """
+    _check_rectilinear(outline)
+    direction = outline.orientation()
+    if direction == 0:
+        return []
+    # 反時計回りなら下向きの縦辺が左側（内側に入る辺）
+    orientation = 1 if direction > 0 or keep_orientation else -1
+    edges: List[_Edge] = []
+    for x1, y1, x2, y2 in outline.edges():
+        if x1 != x2 or y1 == y2:
+            continue
+        entering = (y2 < y1) == (orientation > 0)
+        delta = inside_delta if entering else -inside_delta
+        edges.append((x1, min(y1, y2), max(y1, y2), delta))
+    return edges
+
+
+def _check_rectilinear(outline: IntOutline) -> None:
+    """全ての辺が軸に平行であることを確認する"""
+    index = outline.first_oblique_edge()
+    if index is not None:
+        x1, y1, x2, y2 = outline.edges()[index]
+        raise ValueError(f"直角多角形ではありません: ({x1}, {y1}) -> ({x2}, {y2})")
+
+
+class _MinAddTree:
+    """区間加算・区間内の値 0 の連続区間列挙を行う区間木（値は常に 0 以上）"""
+
+    def __init__(self, size: int, initial: int):
+        self.size = size
+        self._min = [initial] * (4 * max(size, 1))
+        self._lazy = [0] * (4 * max(size, 1))
+
+    def add(self, lo: int, hi: int, delta: int) -> None:
+        self._add(1, 0, self.size, lo, hi, delta)
+
+    def _add(self, node: int, nlo: int, nhi: int, lo: int, hi: int, delta: int) -> None:
+        if hi <= nlo or nhi <= lo:
+            return
+        if lo <= nlo and nhi <= hi:
+            self._min[node] += delta
+            self._lazy[node] += delta
+            return
+        self._push(node)
+        mid = (nlo + nhi) // 2
+        self._add(2 * node, nlo, mid, lo, hi, delta)
+        self._add(2 * node + 1, mid, nhi, lo, hi, delta)
+        self._min[node] = min(self._min[2 * node], self._min[2 * node + 1])
+
+    def _push(self, node: int) -> None:
+        lazy = self._lazy[node]
+        if lazy:
+            for child in (2 * node, 2 * node + 1):
+                self._min[child] += lazy
+                self._lazy[child] += lazy
+            self._lazy[node] = 0
+
+    def zeros(self, lo: int, hi: int) -> List[Tuple[int, int]]:
+        """[lo, hi) 内で値が 0 の要素区間を列挙（隣接する区間は結合済み）"""
+        runs: List[Tuple[int, int]] = []
+        self._zeros(1, 0, self.size, lo, hi, runs)
+        return runs
+
+    def _zeros(
+        self, node: int, nlo: int, nhi: int, lo: int, hi: int, runs: List[Tuple[int, int]]
+    ) -> None:
+        if hi <= nlo or nhi <= lo or self._min[node] > 0:
+            return
+        if nhi - nlo == 1:
+            if runs and runs[-1][1] == nlo:
+                runs[-1] = (runs[-1][0], nhi)
+            else:
+                runs.append((nlo, nhi))
+            return
+        self._push(node)
+        mid = (nlo + nhi) // 2
+        self._zeros(2 * node, nlo, mid, lo, hi, runs)
+        self._zeros(2 * node + 1, mid, nhi, lo, hi, runs)
+
+
+def _merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """区間を結合して重なりのない昇順の区間列にする"""
+    merged: List[Tuple[int, int]] = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _subtract_ranges(
+    a: List[Tuple[int, int]], b: List[Tuple[int, int]]
+) -> List[Tuple[int, int]]:
+    """昇順・重なりなしの区間列 a から b を除く"""
+    result: List[Tuple[int, int]] = []
+    j = 0
+    for lo, hi in a:
+        cursor = lo
+        while j < len(b) and b[j][1] <= cursor:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < hi:
+            if b[k][0] > cursor:
+                result.append((cursor, b[k][0]))
+            cursor = max(cursor, b[k][1])
+            k += 1
+        if cursor < hi:
+            result.append((cursor, hi))
+    return result
+
+
+def _sweep(edges: List[_Edge], initial: int, inside_is_zero: bool) -> List[Polygon]:
+    """
+    縦辺イベントを走査して、条件を満たす領域の境界多角形を求める
+
+    Args:
+        edges: 縦辺イベント
+        initial: 走査開始時（最左）の値
+        inside_is_zero: True なら値 0 の領域、False なら値が正の領域を結果とする
+    """
+    if not edges:
+        return []
+
+    ys = sorted({y for _, y0, y1, _ in edges for y in (y0, y1)})
+    y_index = {y: i for i, y in enumerate(ys)}
+    tree = _MinAddTree(len(ys) - 1, initial)
+
+    by_x: Dict[int, List[_Edge]] = defaultdict(list)
+    for edge in edges:
+        by_x[edge[0]].append(edge)
+
+    # 出力縦辺: (x, y0, y1, 領域に入る辺か)
+    boundary: List[Tuple[int, int, int, bool]] = []
+    for x in sorted(by_x):
+        group = by_x[x]
+        negative = [(y_index[y0], y_index[y1], d) for _, y0, y1, d in group if d < 0]
+        positive = [(y_index[y0], y_index[y1], d) for _, y0, y1, d in group if d > 0]
+
+        # 減算を先に適用し、新たに 0 になった区間を求める
+        for lo, hi, d in negative:
+            tree.add(lo, hi, d)
+        became_zero = [
+            run for lo, hi in _merge_ranges((lo, hi) for lo, hi, _ in negative)
+            for run in tree.zeros(lo, hi)
+        ]
+        # 加算前に 0 だった区間は、加算により 0 でなくなる
+        left_zero = [
+            run for lo, hi in _merge_ranges((lo, hi) for lo, hi, _ in positive)
+            for run in tree.zeros(lo, hi)
+        ]
+        for lo, hi, d in positive:
+            tree.add(lo, hi, d)
+
+        # 同じ x で 0 になって戻った区間は境界にならない
+        to_zero = _subtract_ranges(became_zero, left_zero)
+        from_zero = _subtract_ranges(left_zero, became_zero)
+        for lo, hi in to_zero:
+            boundary.append((x, ys[lo], ys[hi], inside_is_zero))
+        for lo, hi in from_zero:
+            boundary.append((x, ys[lo], ys[hi], not inside_is_zero))
+
+    return _assemble(boundary)
+
+
+def _assemble(boundary: List[Tuple[int, int, int, bool]]) -> List[Polygon]:
+    """縦の境界辺を横辺で結び、閉路（多角形）に復元する"""
+    # 同じ x で接する同種の縦辺を結合
+    merged: List[Tuple[int, int, int, bool]] = []
+    for x, y0, y1, entering in sorted(boundary, key=lambda e: (e[0], e[3], e[1])):
+        if merged:
+            px, py0, py1, pe = merged[-1]
+            if px == x and pe == entering and py1 == y0:
+                merged[-1] = (x, py0, y1, entering)
+                continue
+        merged.append((x, y0, y1, entering))
+
+    # 有向辺: 始点 → [(終点, 向き)]。領域に入る辺は下向き、出る辺は上向きにすると
+    # 外周が反時計回り・穴が時計回りになる
+    outgoing: Dict[Vertex, List[Tuple[Vertex, Vertex]]] = defaultdict(list)
+    # 同じ y 上の頂点: (x, 縦辺の終点か)
+    by_y: Dict[int, List[Tuple[int, bool]]] = defaultdict(list)
+    for x, y0, y1, entering in merged:
+        start, end = ((x, y1), (x, y0)) if entering else ((x, y0), (x, y1))
+        outgoing[start].append((end, (0, 1 if end[1] > start[1] else -1)))
+        by_y[start[1]].append((x, False))
+        by_y[end[1]].append((x, True))
+
+    # 同じ y 上の頂点を x 順に2つずつ横辺で結ぶ（縦辺の終点 → 次の縦辺の始点）
+    for y, entries in by_y.items():
+        entries.sort()
+        for i in range(0, len(entries) - 1, 2):
+            (xa, a_is_end), (xb, _) = entries[i], entries[i + 1]
+            src, dst = ((xa, y), (xb, y)) if a_is_end else ((xb, y), (xa, y))
+            outgoing[src].append((dst, (1 if dst[0] > src[0] else -1, 0)))
+
+    polygons: List[Polygon] = []
+    for first in list(outgoing):
+        while outgoing[first]:
+            loop: Polygon = []
+            v, direction = first, None
+            while outgoing[v]:
+                candidates = outgoing[v]
+                choice = 0
+                if direction is not None and len(candidates) > 1:
+                    # 点で接する頂点では左折を選び、領域ごとに別の閉路にする
+                    left = (-direction[1], direction[0])
+                    choice = next(
+                        (i for i, (_, d) in enumerate(candidates) if d == left), 0
+                    )
+                end, direction = candidates.pop(choice)
+                loop.append(v)
+                v = end
+            polygons.append(loop)
+    return polygons
+
+
+def union(polygons: Sequence[Sequence]) -> List[Polygon]:
+    """
+    直角多角形の和を求める
+
+    Args:
+        polygons: 直角多角形の列（頂点の向きは問わない）
+
+    Returns:
+        List[Polygon]: 外周（反時計回り）と穴（時計回り）の多角形
+    """
+    edges: List[_Edge] = []
+    for polygon in polygons:
+        edges.extend(_vertical_edges(IntOutline.from_points(polygon), 1))
+    return _sweep(edges, 0, inside_is_zero=False)
+
+
+def _region(polygons: Sequence[Sequence]) -> List[Polygon]:
+    """
+    外周と穴からなる多角形の列を、重なりのない外周と穴に正規化する
+
+    頂点の向きをそのまま使い（外周は反時計回り、穴は時計回り）、回転数が正の部分を領域とする。
+    """
+    edges: List[_Edge] = []
+    for polygon in polygons:
+        edges.extend(
+            _vertical_edges(IntOutline.from_points(polygon), 1, keep_orientation=True)
+        )
+    return _sweep(edges, 0, inside_is_zero=False)
+
+
+def difference(subject: Sequence[Sequence], clip: Sequence[Sequence]) -> List[Polygon]:
+    """
+    直角多角形の差（subject の領域から clip の領域を除いた領域）を求める
+
+    Args:
+        subject: 元の領域。外周（反時計回り）と穴（時計回り）の多角形
+            （union() / difference() の戻り値など）
+        clip: 除く領域（subject と同じ形式）
+
+    Returns:
+        List[Polygon]: 外周（反時計回り）と穴（時計回り）の多角形
+    """
+    # 正規化した各領域は重なりがないので、被覆数はそれぞれ 0 / 1 になる。
+    # 値 = clip被覆 - subject被覆 + 1 とすると、結果領域はちょうど値 0 の部分になる。
+    # 穴を塗りつぶさないよう、頂点の向きをそのまま使う
+    edges: List[_Edge] = []
+    for polygon in _region(subject):
+        edges.extend(_vertical_edges(IntOutline.from_polygon(polygon), -1, keep_orientation=True))
+    for polygon in _region(clip):
+        edges.extend(_vertical_edges(IntOutline.from_polygon(polygon), 1, keep_orientation=True))
+    return _sweep(edges, 1, inside_is_zero=True)
+
+
+def level_footprints(floor_polygons: Mapping[int, Sequence]) -> Dict[int, List[Polygon]]:
+    """
+    階ごとの足場外周（その階より上の全階の和）を求める
+
+    上階が張り出す（バルコニー等）場合も含めるため、
+    k 階の外周は k 階以上の全ての階の外形の和とする。
+
+    Args:
+        floor_polygons: 階 → 外形多角形
+
+    Returns:
+        Dict[int, List[Polygon]]: 階 → 外周（反時計回り）と穴（時計回り）の多角形
+    """
+    floors = sorted(floor_polygons)
+    return {
+        floor: union([floor_polygons[f] for f in floors if f >= floor])
+        for floor in floors
+    }
+
+
+def _rectangle_edges(x1: int, y1: int, x2: int, y2: int) -> List[_Edge]:
+    """2つの対角点で決まる矩形の縦辺の走査イベント（面積 0 なら空）"""
+    lo_x, hi_x = min(x1, x2), max(x1, x2)
+    lo_y, hi_y = min(y1, y2), max(y1, y2)
+    if lo_x == hi_x or lo_y == hi_y:
+        return []
+    return [(hi_x, lo_y, hi_y, -1), (lo_x, lo_y, hi_y, 1)]
+
+
+def offset_region(
+    polygons: Sequence[Sequence], standoffs: Union[float, Sequence[Sequence[float]]]
+) -> List[Polygon]:
+    """
+    直角多角形の領域を辺ごとの距離で外側へオフセットする
+
+    各辺を外側へ平行移動した帯と、各頂点の隅の矩形を元の領域に加えた和を求める。
+    帯と隅は頂点数に比例する個数で作られ、オフセットで生じる自己交差や
+    狭い入隅（凹部）の潰れは和を取る走査で解消される。
+
+    Args:
+        polygons: 外周（反時計回り）と穴（時計回り）の多角形（union() の戻り値など）。
+            各辺の右側を屋外とみなす
+        standoffs: 全辺共通の距離（mm）、または多角形ごとの辺ごとの距離の列
+            （辺 i は頂点 i → i+1）
+
+    Returns:
+        List[Polygon]: オフセット後の外周（反時計回り）と穴（時計回り）の多角形
+    """
+    edges: List[_Edge] = []
+    for index, points in enumerate(polygons):
+        outline = IntOutline.from_points(points)
+        polygon = outline.vertices()
+        n = len(polygon)
+        if isinstance(standoffs, (int, float)):
+            distances = [int(round(standoffs))] * n
+        else:
+            distances = [int(round(d)) for d in standoffs[index]]
+            if len(distances) != n:
+                raise ValueError(f"辺の数と距離の数が一致しません: {n} != {len(distances)}")
+        if any(d < 0 for d in distances):
+            raise ValueError("オフセット距離は0以上である必要があります")
+
+        edges.extend(_vertical_edges(outline, 1, keep_orientation=True))
+        # 辺の右側（屋外側）の単位法線
+        normals = []
+        for i in range(n):
+            (x1, y1), (x2, y2) = polygon[i], polygon[(i + 1) % n]
+            normals.append(((y2 > y1) - (y2 < y1), (x1 > x2) - (x1 < x2)))
+        for i in range(n):
+            (x1, y1), (x2, y2) = polygon[i], polygon[(i + 1) % n]
+            (nx, ny), d = normals[i], distances[i]
+            # 辺を平行移動した帯
+            edges.extend(_rectangle_edges(x1, y1, x2 + nx * d, y2 + ny * d))
+            # 始点の隅（直前の辺と合わせた出隅の矩形）
+            (px, py), pd = normals[i - 1], distances[i - 1]
+            edges.extend(
+                _rectangle_edges(x1, y1, x1 + nx * d + px * pd, y1 + ny * d + py * pd)
+            )
+    return _sweep(edges, 0, inside_is_zero=False)
+
+
+def offset_polygon(
+    polygon: Sequence, standoffs: Union[float, Sequence[float]]
+) -> List[Polygon]:
+    """
+    直角多角形1つを辺ごとの距離で外側へオフセットする
+
+    Args:
+        polygon: 直角多角形（頂点の向きは問わない）
+        standoffs: 全辺共通の距離（mm）、または辺ごとの距離（辺 i は頂点 i → i+1）
+
+    Returns:
+        List[Polygon]: オフセット後の外周（反時計回り）と穴（時計回り）の多角形
+    """
+    outline = IntOutline.from_points(polygon)
+    points = outline.counterclockwise().vertices()
+    distances = standoffs
+    if outline.orientation() < 0:
+        # 反時計回りに揃え、辺ごとの距離も同じ辺に対応させる
+        if not isinstance(standoffs, (int, float)):
+            distances = list(standoffs)[::-1]
+            distances = distances[1:] + distances[:1]
+    if not isinstance(distances, (int, float)):
+        distances = [list(distances)]
+    return offset_region([points], distances)
@@ -0,0 +1,239 @@
+"""
+空間インデックス
+
+NG エリアなどの矩形や足場部材を一様グリッドに登録し、
+範囲検索を対象セル内の要素だけで行えるようにする。
+"""
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .types import NGArea, Point2D, ScaffoldMember
+
+# グリッドセルの既定サイズ（mm）。標準スパン程度にしておく
+DEFAULT_CELL_SIZE = 1800.0
+
+# 1つの NG エリアがこれより多くのセルに掛かる場合はグリッドに登録せず、検索時に個別に判定する
+MAX_CELLS_PER_AREA = 1024
+
+Cell = Tuple[int, int]
+CellRange = Tuple[int, int, int, int]  # (cx0, cy0, cx1, cy1)
+QuantityKey = Tuple[str, float, str]  # (部材種別, 長さ, 面)
+
+
+class NGAreaIndex:
+    """NG エリアの一様グリッドインデックス"""
+
+    def __init__(self, areas: Sequence[NGArea], cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        初期化
+
+        Args:
+            areas: 登録する NG エリア
+            cell_size: グリッドセルの一辺（mm）
+        """
+        if cell_size <= 0:
+            raise ValueError(f"cell_size は正の値である必要があります: {cell_size}")
+        self.cell_size = cell_size
+        self.areas: List[NGArea] = list(areas)
+        self._cells: Dict[Cell, List[int]] = {}
+        self._large: List[int] = []  # グリッドに登録しない大きな NG エリア
+        self._extent: Optional[CellRange] = None  # 登録したセルの範囲
+        for i, area in enumerate(self.areas):
+            cells = self._cell_range(
+                area.min_point.x, area.min_point.y, area.max_point.x, area.max_point.y
+            )
+            cx0, cy0, cx1, cy1 = cells
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_AREA:
+                self._large.append(i)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._cells.setdefault((cx, cy), []).append(i)
+            self._extent = cells if self._extent is None else (
+                min(self._extent[0], cx0), min(self._extent[1], cy0),
+                max(self._extent[2], cx1), max(self._extent[3], cy1),
+            )
+
+    def _cell_range(self, min_x: float, min_y: float, max_x: float, max_y: float) -> CellRange:
+        """矩形範囲が掛かるセルの範囲"""
+        size = self.cell_size
+        return (
+            math.floor(min_x / size), math.floor(min_y / size),
+            math.floor(max_x / size), math.floor(max_y / size),
+        )
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[NGArea]:
+        """
+        矩形範囲と重なる NG エリアを検索
+
+        検索範囲は登録したセルの範囲に切り詰め、それでもセル数が NG エリアの数より多い場合は
+        全ての NG エリアを個別に判定する。
+
+        Args:
+            min_x, min_y, max_x, max_y: 検索範囲
+
+        Returns:
+            List[NGArea]: 重なる NG エリア（登録順）
+        """
+        hits = {i for i in self._large if self.areas[i].overlaps(min_x, min_y, max_x, max_y)}
+        if self._extent is not None:
+            qx0, qy0, qx1, qy1 = self._cell_range(min_x, min_y, max_x, max_y)
+            ex0, ey0, ex1, ey1 = self._extent
+            cx0, cy0, cx1, cy1 = max(qx0, ex0), max(qy0, ey0), min(qx1, ex1), min(qy1, ey1)
+            if cx0 <= cx1 and cy0 <= cy1:
+                if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.areas):
+                    candidates = range(len(self.areas))
+                else:
+                    candidates = (
+                        i
+                        for cx in range(cx0, cx1 + 1)
+                        for cy in range(cy0, cy1 + 1)
+                        for i in self._cells.get((cx, cy), ())
+                    )
+                hits.update(
+                    i for i in candidates
+                    if i not in hits and self.areas[i].overlaps(min_x, min_y, max_x, max_y)
+                )
+        return [self.areas[i] for i in sorted(hits)]
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+
+def point_in_polygon(x: float, y: float, polygon: Sequence[Point2D]) -> bool:
+    """点が多角形の内側にあるか判定（レイキャスト法）"""
+    inside = False
+    n = len(polygon)
+    j = n - 1
+    for i in range(n):
+        xi, yi = polygon[i].x, polygon[i].y
+        xj, yj = polygon[j].x, polygon[j].y
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _segment_hits_rect(
+    x0: float, y0: float, x1: float, y1: float,
+    min_x: float, min_y: float, max_x: float, max_y: float,
+) -> bool:
+    """線分が矩形と交差するか判定（Liang-Barsky 法）"""
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - min_x), (dx, max_x - x0), (-dy, y0 - min_y), (dy, max_y - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+class MemberGridIndex:
+    """
+    足場部材の一様グリッドインデックス
+
+    部材は中点の属するセルに登録し、セルごとに
+    部材種別×長さ×面の数量を事前集計しておく。
+    """
+
+    def __init__(self, members: Sequence[ScaffoldMember], cell_size: float = DEFAULT_CELL_SIZE):
+        """
+        初期化
+
+        Args:
+            members: 登録する足場部材
+            cell_size: グリッドセルの一辺（mm）
+        """
+        if cell_size <= 0:
+            raise ValueError(f"cell_size は正の値である必要があります: {cell_size}")
+        self.cell_size = cell_size
+        self.member_count = len(members)
+        self._members: Dict[Cell, List[Tuple[float, float, QuantityKey]]] = {}
+        self._totals: Dict[Cell, Counter] = {}
+        for m in members:
+            x = (m.position_start.x + m.position_end.x) / 2.0
+            y = (m.position_start.y + m.position_end.y) / 2.0
+            key = (m.member_type.value, m.length, m.face.value)
+            cell = (math.floor(x / cell_size), math.floor(y / cell_size))
+            self._members.setdefault(cell, []).append((x, y, key))
+            self._totals.setdefault(cell, Counter())[key] += 1
+        # 部材を登録したセルの範囲 (cx0, cy0, cx1, cy1)
+        cells = self._totals.keys()
+        self._extent: CellRange = (
+            (min(c[0] for c in cells), min(c[1] for c in cells),
+             max(c[0] for c in cells), max(c[1] for c in cells))
+            if cells else (0, 0, -1, -1)
+        )
+
+    def query_polygon(self, polygon: Sequence[Point2D]) -> Dict[QuantityKey, int]:
+        """
+        多角形（投げ縄）内に中点がある部材の数量を集計
+
+        多角形の辺が通過しないセルはセル中心の内外判定だけで
+        事前集計をまとめて加算し、辺が通過するセルのみ部材を個別に判定する。
+        セルの列挙は部材を登録したセルの範囲に限る（投げ縄が大きくても範囲外は数えない）。
+
+        Args:
+            polygon: 投げ縄の頂点列
+
+        Returns:
+            dict: (部材種別, 長さ, 面) → 数量
+        """
+        result: Counter = Counter()
+        if len(polygon) < 3 or not self._totals:
+            return dict(result)
+
+        # 部材は登録済みのセルにしか無いので、検索範囲をその範囲に切り詰める
+        size = self.cell_size
+        ex0, ey0, ex1, ey1 = self._extent
+        cx0 = max(ex0, math.floor(min(p.x for p in polygon) / size))
+        cx1 = min(ex1, math.floor(max(p.x for p in polygon) / size))
+        cy0 = max(ey0, math.floor(min(p.y for p in polygon) / size))
+        cy1 = min(ey1, math.floor(max(p.y for p in polygon) / size))
+        if cx0 > cx1 or cy0 > cy1:
+            return dict(result)
+
+        # 多角形の辺が通過するセル（境界セル）を求める
+        boundary = set()
+        n = len(polygon)
+        for i in range(n):
+            a, b = polygon[i], polygon[(i + 1) % n]
+            bx0 = max(cx0, math.floor(min(a.x, b.x) / size))
+            bx1 = min(cx1, math.floor(max(a.x, b.x) / size))
+            by0 = max(cy0, math.floor(min(a.y, b.y) / size))
+            by1 = min(cy1, math.floor(max(a.y, b.y) / size))
+            for cx in range(bx0, bx1 + 1):
+                for cy in range(by0, by1 + 1):
+                    if _segment_hits_rect(
+                        a.x, a.y, b.x, b.y,
+                        cx * size, cy * size, (cx + 1) * size, (cy + 1) * size,
+                    ):
+                        boundary.add((cx, cy))
+
+        occupied = self._totals.keys()
+        span = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        if span <= len(occupied):
+            candidates = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        else:
+            candidates = [c for c in occupied if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+
+        for cell in candidates:
+            totals = self._totals.get(cell)
+            if totals is None:
+                continue
+            if cell in boundary:
+                for x, y, key in self._members[cell]:
+                    if point_in_polygon(x, y, polygon):
+                        result[key] += 1
+            elif point_in_polygon((cell[0] + 0.5) * size, (cell[1] + 0.5) * size, polygon):
+                result.update(totals)
+        return dict(result)
@@ -3,7 +3,7 @@
 """
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 
 class MemberType(Enum):
@@ -48,15 +48,10 @@ class BuildingOutline:
     vertices: List[Point2D]  # 頂点リスト（直角多角形）
     
     def get_bounding_box(self) -> Tuple[Point2D, Point2D]:
-        """外接矩形を取得"""
-        if not self.vertices:
-            return Point2D(0, 0), Point2D(0, 0)
-        
-        min_x = min(v.x for v in self.vertices)
-        max_x = max(v.x for v in self.vertices)
-        min_y = min(v.y for v in self.vertices)
-        max_y = max(v.y for v in self.vertices)
-        
+        """外接矩形を取得（整数 mm に丸めた頂点から幾何カーネルで求める）"""
+        from .geometry import IntOutline
+
+        min_x, min_y, max_x, max_y = IntOutline.from_points(self.vertices).bounding_box()
         return Point2D(min_x, min_y), Point2D(max_x, max_y)
 
 
@@ -69,16 +64,67 @@ class HeightCondition:
     max_height: float = 7000.0     # 最高高さ（mm）
 
 
+@dataclass
+class RoofSpec:
+    """屋根条件（軒出・ケラバ・勾配・棟高さ）"""
+    eave_overhang: float = 0.0     # 軒出（mm）
+    gable_overhang: float = 0.0    # ケラバ出幅（mm）
+    roof_type: str = "flat"        # 屋根形状（flat / gable / hip / shed）
+    slope_angle: Optional[float] = None   # 傾斜角度（度、省略時は棟高さから求める）
+    ridge_height: Optional[float] = None  # 棟高さ（mm、地盤面から）
+
+
 @dataclass
 class ScaffoldSpec:
     """足場仕様テンプレート"""
     standard_span: float = 1800.0      # 標準スパン（mm）
     floor_pitch: float = 1900.0        # 階高ピッチ（mm）
+    scaffold_width: float = 600.0      # 足場幅（mm）
+    wall_standoff: float = 300.0       # 外壁からの離れ（mm）
+    roof_clearance: float = 100.0      # 軒先・ケラバからのクリアランス（mm）
     available_spans: List[float] = field(
         default_factory=lambda: [1800, 1500, 1200, 900, 600, 355, 300, 150]
     )
 
 
+@dataclass
+class NGArea:
+    """足場設置禁止エリア（外接矩形）"""
+    min_point: Point2D             # 最小座標
+    max_point: Point2D             # 最大座標
+    kind: str = "opening"          # 種別（opening / entrance / boundary など）
+
+    def overlaps(self, min_x: float, min_y: float, max_x: float, max_y: float) -> bool:
+        """矩形範囲と重なるか判定（境界接触は重なりとしない）"""
+        return (
+            self.min_point.x < max_x and min_x < self.max_point.x
+            and self.min_point.y < max_y and min_y < self.max_point.y
+        )
+
+
+@dataclass
+class CostModel:
+    """割付最適化のコストモデル"""
+    member_cost: float = 1.0           # 部材1本あたりのコスト（運搬・施工手間）
+    column_cost: float = 1.0           # 支柱1本あたりのコスト
+    rental_cost_per_m: float = 0.0     # 布材の長さ1mあたりの損料
+    short_span_length: float = 300.0   # これ以下のスパンを端材（短尺）とみなす（mm）
+    short_span_penalty: float = 0.5    # 短尺の布材1本あたりの追加コスト
+    corner_short_span_penalty: float = 0.5  # 隅に接する短尺スパンの追加コスト（布材1本あたり）
+    gap_cost_per_mm: float = 0.01      # 割り付けられない残り（持ち出し等で対応）1mmあたりのコスト
+    corner_gap_factor: float = 2.0     # 残りを隅側に置く場合の係数
+
+
+@dataclass
+class LayoutCost:
+    """割付結果のコスト内訳"""
+    total: float                       # 合計コスト
+    # 内訳（ledgers / columns / short_spans / corner_short_spans / gaps）
+    breakdown: Dict[str, float]
+    timed_out: bool = False            # 時間制限により探索を打ち切ったか
+    nodes: int = 0                     # 探索したノード数
+
+
 @dataclass
 class ScaffoldMember:
     """足場部材"""
@@ -89,10 +135,48 @@ class ScaffoldMember:
     position_end: Point3D          # 終了位置
 
 
+@dataclass
+class RoofClash:
+    """足場部材と屋根（クリアランス込み）の干渉"""
+    member_index: int              # ScaffoldResult.members 内の位置
+    member: ScaffoldMember         # 干渉した部材
+    floor: int                     # 干渉した屋根の階（最上階以外は下屋）
+    overlap: float                 # 屋根の内側に入っている部材の長さ（mm）
+    adjustment: str                # 調整案（height: 高さを変える / span: スパンを詰める）
+    amount: float                  # 調整量（mm、height は上げる向きが正）
+
+
 @dataclass
 class ScaffoldResult:
     """足場計算結果"""
     members: List[ScaffoldMember]  # 部材リスト
+    cost: Optional[LayoutCost] = None  # 最適化モードで計算した場合のコスト内訳
+    _spatial_index: Optional[Any] = field(default=None, init=False, repr=False, compare=False)
+
+    def build_spatial_index(self, cell_size: float = 1800.0) -> Any:
+        """
+        部材位置の空間インデックスを構築（部材数が変わった場合は再構築）
+
+        Args:
+            cell_size: グリッドセルの一辺（mm）
+
+        Returns:
+            MemberGridIndex: 構築済みインデックス
+        """
+        from .spatial import MemberGridIndex
+
+        index = self._spatial_index
+        if index is None or index.member_count != len(self.members) or index.cell_size != cell_size:
+            index = MemberGridIndex(self.members, cell_size)
+            self._spatial_index = index
+        return index
+
+    def get_quantity_in_polygon(self, polygon: Sequence[Point2D]) -> dict:
+        """投げ縄（多角形）内の部材種別×長さ×面ごとの数量を集計"""
+        index = self._spatial_index or self.build_spatial_index()
+        if index.member_count != len(self.members):
+            index = self.build_spatial_index(index.cell_size)
+        return index.query_polygon(polygon)
     
     def get_quantity_by_type_and_face(self) -> dict:
         """部材種別×面ごとの数量を集計"""
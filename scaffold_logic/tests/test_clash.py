@@ -0,0 +1,163 @@
+"""
+屋根との干渉チェック（屋根の立体・BVH・調整案）のテスト
+"""
+import random
+
+import numpy as np
+import pytest
+
+from scaffold_logic import (
+    BuildingOutline,
+    FaceDirection,
+    HeightCondition,
+    MemberType,
+    Point2D,
+    Point3D,
+    RoofBVH,
+    RoofSolid,
+    RoofSpec,
+    ScaffoldMember,
+    ScaffoldResult,
+    detect_roof_clashes,
+    roof_solids,
+)
+from scaffold_logic.clash import ROOF_THICKNESS, _rectangles
+
+# 南側が東へ張り出した L 字（入隅は (4000, 4000)）
+L_SHAPE = [(0, 0), (9000, 0), (9000, 4000), (4000, 4000), (4000, 8000), (0, 8000)]
+EAVES = 3000.0
+SLOPE = 0.4
+
+
+def _outline(points) -> BuildingOutline:
+    return BuildingOutline(vertices=[Point2D(x, y) for x, y in points])
+
+
+def _inside_roof(solids, x: float, y: float, z: float) -> bool:
+    point = np.array([x, y, z, -1.0])
+    return any(bool((solid.planes @ point <= 1e-6).all()) for solid in solids)
+
+
+def _member(member_type, start, end) -> ScaffoldMember:
+    s, e = Point3D(*start), Point3D(*end)
+    length = float(np.linalg.norm(np.subtract(end, start)))
+    return ScaffoldMember(member_type, length, FaceDirection.SOUTH, s, e)
+
+
+def test_rectangles_are_maximal():
+    rects = sorted(_rectangles([L_SHAPE]))
+    assert rects == [(0, 0, 4000, 8000), (0, 0, 9000, 4000)]
+
+    # 中庭のある口の字: 4本の帯が極大矩形になる
+    outer = [(0, 0), (9000, 0), (9000, 9000), (0, 9000)]
+    hole = [(3000, 3000), (3000, 6000), (6000, 6000), (6000, 3000)]
+    assert sorted(_rectangles([outer, hole])) == [
+        (0, 0, 3000, 9000), (0, 0, 9000, 3000), (0, 6000, 9000, 9000), (6000, 0, 9000, 9000),
+    ]
+
+
+@pytest.mark.parametrize("x, y", [(3900, 2000), (4100, 2000), (2000, 3900), (2000, 6000)])
+def test_hip_roof_follows_whole_footprint(x, y):
+    """寄棟の屋根面は短冊の継ぎ目で下がらず、外形から遠いほど高い"""
+    solids = roof_solids(
+        _outline(L_SHAPE), HeightCondition(floor_count=1, eaves_height=EAVES),
+        RoofSpec(roof_type="hip", slope_angle=None, eave_overhang=0.0),
+    )
+    # 外形に収まる最大の正方形の半径（= 外形までのチェビシェフ距離）
+    radius = max(
+        min(x - x0, x1 - x, y - y0, y1 - y)
+        for x0, y0, x1, y1 in ((0, 0, 9000, 4000), (0, 0, 4000, 8000))
+        if x0 <= x <= x1 and y0 <= y <= y1
+    )
+    height = EAVES + SLOPE * radius
+    assert _inside_roof(solids, x, y, height - 1.0)
+    assert not _inside_roof(solids, x, y, height + 1.0)
+
+
+def test_hip_roof_clash_at_reentrant_strip_seam():
+    """入隅付近で屋根の中ほどを通る布材は干渉として検出する"""
+    outline = _outline(L_SHAPE)
+    height_condition = HeightCondition(floor_count=1, eaves_height=EAVES)
+    roof = RoofSpec(roof_type="hip")
+    z = EAVES + SLOPE * 1500.0
+    ledger = _member(MemberType.LEDGER, (3800.0, 2000.0, z), (4200.0, 2000.0, z))
+    clashes = detect_roof_clashes(ScaffoldResult(members=[ledger]), outline, height_condition, roof)
+    assert len(clashes) == 1
+    assert clashes[0].overlap == pytest.approx(400.0)
+
+
+def test_gable_valley_is_union_of_wings():
+    """切妻の入隅では両方の屋根の高い方（谷）を屋根面とする"""
+    solids = roof_solids(
+        _outline(L_SHAPE), HeightCondition(floor_count=1, eaves_height=EAVES),
+        RoofSpec(roof_type="gable"),
+    )
+    # 東西に長い棟の南側の帯では y 方向の中央（y=2000）が棟
+    assert _inside_roof(solids, 6000, 2000, EAVES + SLOPE * 2000 - 1.0)
+    assert not _inside_roof(solids, 6000, 2000, EAVES + SLOPE * 2000 + 1.0)
+    # 入隅の内側では北に伸びる帯の屋根の方が高い
+    assert _inside_roof(solids, 2000, 3900, EAVES + SLOPE * 3900 - 1.0)
+
+
+def _random_box(rng: random.Random):
+    lo = [rng.uniform(-10000, 10000) for _ in range(3)]
+    return lo, [v + rng.uniform(1, 4000) for v in lo]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_bvh_query_matches_brute_force(seed):
+    rng = random.Random(seed)
+    solids = []
+    for _ in range(rng.randint(1, 40)):
+        lo, hi = _random_box(rng)
+        solids.append(RoofSolid(planes=np.zeros((0, 4)), lo=tuple(lo), hi=tuple(hi), floor=1))
+    p0 = np.array([[rng.uniform(-12000, 12000) for _ in range(3)] for _ in range(200)])
+    p1 = p0 + np.array([[rng.uniform(-3000, 3000) for _ in range(3)] for _ in range(200)])
+
+    found = {
+        (solid, int(i)) for solid, idx in RoofBVH(solids).query(p0, p1) for i in idx
+    }
+    seg_lo, seg_hi = np.minimum(p0, p1), np.maximum(p0, p1)
+    expected = {
+        (s, i)
+        for s, solid in enumerate(solids)
+        for i in range(len(p0))
+        if (seg_lo[i] <= solid.hi).all() and (seg_hi[i] >= solid.lo).all()
+    }
+    assert found == expected
+
+
+class TestAdjustments:
+    """陸屋根（軒出 600、底面 2800〜上面 3000）に対する調整案"""
+
+    outline = _outline([(0, 0), (6000, 0), (6000, 4000), (0, 4000)])
+    height_condition = HeightCondition(floor_count=1, eaves_height=EAVES)
+    roof = RoofSpec(roof_type="flat", eave_overhang=600.0)
+    bottom = EAVES - ROOF_THICKNESS
+
+    def _clashes(self, *members):
+        result = ScaffoldResult(members=list(members))
+        return detect_roof_clashes(result, self.outline, self.height_condition, self.roof)
+
+    def test_column_top_in_roof_is_lowered_below_roof(self):
+        column = _member(MemberType.COLUMN, (-300, 2000, 0), (-300, 2000, 3500))
+        (clash,) = self._clashes(column)
+        assert (clash.adjustment, clash.amount) == ("height", self.bottom - 3500)
+        assert clash.overlap == pytest.approx(ROOF_THICKNESS)
+
+    def test_column_bottom_in_roof_is_raised_above_roof(self):
+        column = _member(MemberType.COLUMN, (-300, 2000, 2900), (-300, 2000, 5000))
+        (clash,) = self._clashes(column)
+        assert (clash.adjustment, clash.amount) == ("height", EAVES - 2900)
+
+    def test_ledger_prefers_smaller_adjustment(self):
+        # 屋根に 100 mm 入る布材: 高さ 2850 なら下げる量 50 < 詰める量 100、
+        # 高さ 2950 なら下げる量 150 > 詰める量 100
+        low = _member(MemberType.LEDGER, (-2000, 2000, 2850), (-500, 2000, 2850))
+        high = _member(MemberType.LEDGER, (-2000, 1000, 2950), (-500, 1000, 2950))
+        clear = _member(MemberType.LEDGER, (-2000, 3000, 2000), (-500, 3000, 2000))
+        clashes = self._clashes(low, high, clear)
+        assert [(c.member_index, c.adjustment, c.amount) for c in clashes] == [
+            (0, "height", -50.0),
+            (1, "span", 100.0),
+        ]
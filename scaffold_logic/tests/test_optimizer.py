@@ -0,0 +1,78 @@
+"""
+割付最適化（分枝限定法）を貪欲割付のコストと突き合わせるテスト
+"""
+import random
+
+import pytest
+
+from scaffold_logic import split_spans
+from scaffold_logic.optimizer import SpanRun, optimize_runs, solve_run
+from scaffold_logic.types import CostModel
+
+SPANS = (1800.0, 1500.0, 1200.0, 900.0, 600.0, 355.0, 300.0, 150.0)
+
+
+def _cost(run: SpanRun, spans, gap_at_start: bool, model: CostModel) -> float:
+    """スパン列（始点側から）と残りの置き方のコストをコストモデルから直接求める"""
+    short = model.short_span_length + 1e-6
+    total = model.column_cost * (len(spans) + 1)
+    for s in spans:
+        total += run.level_count * (model.member_cost + model.rental_cost_per_m * s / 1000.0)
+        if s <= short:
+            total += run.level_count * model.short_span_penalty
+    if spans:
+        adjacent = (run.start_at_corner and spans[0] <= short) + (
+            run.end_at_corner and spans[-1] <= short
+        )
+        total += adjacent * run.level_count * model.corner_short_span_penalty
+    at_corner = run.start_at_corner if gap_at_start else run.end_at_corner
+    factor = model.corner_gap_factor if at_corner else 1.0
+    return total + model.gap_cost_per_mm * factor * max(0.0, run.length - sum(spans))
+
+
+def _random_run(rng: random.Random) -> SpanRun:
+    return SpanRun(
+        length=float(rng.randrange(150, 15000, 5)),
+        level_count=rng.randint(1, 4),
+        start_at_corner=rng.random() < 0.5,
+        end_at_corner=rng.random() < 0.5,
+    )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_optimized_cost_never_exceeds_greedy(seed):
+    rng = random.Random(seed)
+    model = CostModel(rental_cost_per_m=rng.choice([0.0, 0.3]), gap_cost_per_mm=0.002)
+    run = _random_run(rng)
+    layout = solve_run(run, SPANS, model)
+
+    optimized = _cost(run, layout.spans, layout.offset > 0, model)
+    assert optimized == pytest.approx(sum(layout.costs.values()))
+    assert sum(layout.spans) + layout.offset <= run.length + 1e-6
+
+    # 貪欲割付は長いスパンから始点側に並べ、残りを終点側に置く
+    greedy = _cost(run, split_spans(run.length, SPANS), False, model)
+    assert optimized <= greedy + 1e-9
+    assert not layout.timed_out
+
+
+def test_optimizer_avoids_short_span_at_corner():
+    run = SpanRun(length=2100.0, level_count=2, start_at_corner=True, end_at_corner=True)
+    model = CostModel()
+    layout = solve_run(run, SPANS, model)
+
+    assert split_spans(run.length, SPANS) == [1800.0, 300.0]
+    # 短尺を使わず2本で割り切る（1500 + 600 / 1200 + 900 は同コスト）
+    assert len(layout.spans) == 2 and sum(layout.spans) == run.length
+    assert min(layout.spans) > model.short_span_length
+    greedy = _cost(run, [1800.0, 300.0], False, model)
+    assert _cost(run, layout.spans, False, model) < greedy
+
+
+def test_parallel_matches_in_process():
+    rng = random.Random(0)
+    runs = [_random_run(rng) for _ in range(12)]
+    model = CostModel()
+    serial = optimize_runs(runs, SPANS, model, time_budget=30.0, max_workers=1)
+    parallel = optimize_runs(runs, SPANS, model, time_budget=30.0, max_workers=2)
+    assert [(x.spans, x.offset) for x in parallel] == [(x.spans, x.offset) for x in serial]
@@ -0,0 +1,100 @@
+"""
+直角多角形の集合演算をラスタ（格子のセル）と突き合わせるランダムテスト
+"""
+import random
+from typing import List, Sequence, Set, Tuple
+
+import pytest
+
+from scaffold_logic import IntOutline
+from scaffold_logic.rectilinear import Polygon, difference, offset_region, union
+
+GRID = 12
+Cell = Tuple[int, int]
+
+
+def _random_rects(rng: random.Random, count: int) -> List[Polygon]:
+    rects = []
+    for _ in range(count):
+        x0, x1 = sorted(rng.sample(range(GRID + 1), 2))
+        y0, y1 = sorted(rng.sample(range(GRID + 1), 2))
+        rects.append([(x0, y0), (x1, y0), (x1, y1), (x0, y1)])
+    return rects
+
+
+def _rect_cells(rects: Sequence[Polygon]) -> Set[Cell]:
+    return {
+        (x, y)
+        for rect in rects
+        for x in range(rect[0][0], rect[1][0])
+        for y in range(rect[0][1], rect[2][1])
+    }
+
+
+def _raster(polygons: Sequence[Polygon], size: int = GRID) -> Set[Cell]:
+    """セル中心を偶奇規則で判定する（外周と穴は重ならない前提）"""
+    cells = set()
+    for x in range(-size, 2 * size):
+        for y in range(-size, 2 * size):
+            px, py = x + 0.5, y + 0.5
+            inside = False
+            for polygon in polygons:
+                for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+                    if x1 == x2 and x1 > px and min(y1, y2) < py < max(y1, y2):
+                        inside = not inside
+            if inside:
+                cells.add((x, y))
+    return cells
+
+
+def _check_loops(polygons: Sequence[Polygon]) -> None:
+    for polygon in polygons:
+        assert len(polygon) >= 4
+        assert IntOutline.from_polygon(polygon).orientation() != 0
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_union_and_difference_match_raster(seed):
+    rng = random.Random(seed)
+    a = _random_rects(rng, rng.randint(1, 4))
+    b = _random_rects(rng, rng.randint(1, 4))
+    c = _random_rects(rng, rng.randint(1, 3))
+
+    region_a = union(a)
+    _check_loops(region_a)
+    assert _raster(region_a) == _rect_cells(a)
+
+    a_minus_b = difference(region_a, union(b))
+    _check_loops(a_minus_b)
+    assert _raster(a_minus_b) == _rect_cells(a) - _rect_cells(b)
+
+    # 穴を含む領域をさらに差し引いても穴が残る
+    nested = difference(a_minus_b, union(c))
+    _check_loops(nested)
+    assert _raster(nested) == _rect_cells(a) - _rect_cells(b) - _rect_cells(c)
+
+
+def test_difference_keeps_hole_of_subject():
+    square = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    hole = [(3, 3), (6, 3), (6, 6), (3, 6)]
+    far = [(100, 100), (110, 100), (110, 110), (100, 110)]
+    holed = difference([square], [hole])
+    assert _raster(difference(holed, [far]), 20) == _raster(holed, 20)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_offset_region_matches_raster(seed):
+    rng = random.Random(seed)
+    rects = _random_rects(rng, rng.randint(1, 4))
+    distance = rng.randint(1, 2)
+    result = offset_region(union(rects), distance)
+    _check_loops(result)
+    # 一様なオフセットは各セルを距離分広げた正方形（チェビシェフ距離）の和になる
+    cells = _rect_cells(rects)
+    expected = {
+        (x + dx, y + dy)
+        for x, y in cells
+        for dx in range(-distance, distance + 1)
+        for dy in range(-distance, distance + 1)
+    }
+    assert _raster(result) == expected
@@ -0,0 +1,92 @@
+"""
+空間インデックスの検索結果を全件走査と突き合わせるテスト
+"""
+import random
+import time
+
+import pytest
+
+from scaffold_logic import (
+    FaceDirection,
+    MemberGridIndex,
+    MemberType,
+    NGArea,
+    NGAreaIndex,
+    Point2D,
+    Point3D,
+    ScaffoldMember,
+    point_in_polygon,
+)
+
+
+def _random_area(rng: random.Random, extent: float, max_size: float) -> NGArea:
+    x, y = rng.uniform(-extent, extent), rng.uniform(-extent, extent)
+    return NGArea(
+        min_point=Point2D(x, y),
+        max_point=Point2D(x + rng.uniform(1, max_size), y + rng.uniform(1, max_size)),
+    )
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_ng_query_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    areas = [_random_area(rng, 20000, rng.choice([500, 3000, 200000])) for _ in range(30)]
+    index = NGAreaIndex(areas, cell_size=rng.choice([150, 900, 1800]))
+    for _ in range(30):
+        q = _random_area(rng, 40000, rng.choice([100, 5000, 1e6]))
+        args = (q.min_point.x, q.min_point.y, q.max_point.x, q.max_point.y)
+        assert index.query(*args) == [a for a in areas if a.overlaps(*args)]
+
+
+def test_huge_area_and_query_with_tiny_cells_stay_cheap():
+    huge = NGArea(min_point=Point2D(-1e6, -1e6), max_point=Point2D(1e6, 1e6))
+    small = NGArea(min_point=Point2D(0, 0), max_point=Point2D(10, 10))
+    start = time.perf_counter()
+    index = NGAreaIndex([huge, small], cell_size=1)
+    assert index.query(-1e6, -1e6, 1e6, 1e6) == [huge, small]
+    assert index.query(20, 20, 30, 30) == [huge]
+    assert time.perf_counter() - start < 1.0
+
+
+def _member(x0, y0, x1, y1, length=1800.0):
+    return ScaffoldMember(
+        member_type=MemberType.LEDGER,
+        length=length,
+        face=FaceDirection.SOUTH,
+        position_start=Point3D(x0, y0, 0.0),
+        position_end=Point3D(x1, y1, 0.0),
+    )
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_lasso_query_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    members = []
+    for _ in range(200):
+        x, y = rng.uniform(0, 20000), rng.uniform(0, 15000)
+        members.append(_member(x, y, x + rng.choice([0, 900, 1800]), y, rng.choice([900, 1800])))
+    index = MemberGridIndex(members, cell_size=rng.choice([600, 1800, 5000]))
+    for _ in range(10):
+        cx, cy, r = rng.uniform(-5000, 25000), rng.uniform(-5000, 20000), rng.uniform(500, 30000)
+        lasso = [
+            Point2D(cx + r * rng.uniform(0.3, 1) * c, cy + r * rng.uniform(0.3, 1) * s)
+            for c, s in ((1, 0), (0.7, 0.7), (0, 1), (-0.7, 0.7), (-1, 0), (0, -1))
+        ]
+        expected = {}
+        for m in members:
+            mx = (m.position_start.x + m.position_end.x) / 2.0
+            my = (m.position_start.y + m.position_end.y) / 2.0
+            if point_in_polygon(mx, my, lasso):
+                key = (m.member_type.value, m.length, m.face.value)
+                expected[key] = expected.get(key, 0) + 1
+        assert index.query_polygon(lasso) == expected
+
+
+def test_huge_lasso_with_small_cells_stays_cheap():
+    index = MemberGridIndex([_member(0, 0, 1800, 0), _member(5000, 5000, 5000, 6800)], 1.0)
+    lasso = [Point2D(-1e6, -1e6), Point2D(1e6, -1e6), Point2D(1e6, 1e6), Point2D(-1e6, 1e6)]
+    start = time.perf_counter()
+    assert sum(index.query_polygon(lasso).values()) == 2
+    corner = [Point2D(-1e6, -1e6), Point2D(-9e5, -1e6), Point2D(-1e6, -9e5)]
+    assert index.query_polygon(corner) == {}
+    assert time.perf_counter() - start < 1.0